@@ -0,0 +1,125 @@
+"""
+Benchmark concurrent /user/{id}/stats requests against a running API
+
+Usage: python benchmark_user_stats.py [--url http://localhost:8000] [--user-id 60312089]
+                                      [--concurrency 50] [--requests 1000] [--seed 0]
+
+While the stats requests run, a probe calls the trivial ``/`` endpoint every
+50 ms. If MongoDB calls blocked the event loop, the probe would wait behind
+them; with async access its latency should stay flat under load. Start the
+API first (python run.py), and run once per MONGODB_MAX_POOL_SIZE setting to
+compare pool sizes. ``--seed N`` first saves N sample analyses for the user.
+"""
+import sys
+import os
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import requests
+
+def percentile(values: list, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+def seed_analyses(user_id: str, count: int):
+    """Save sample analyses (with realistic module payloads) straight to MongoDB"""
+    from src.mongodb_manager import MongoDBManager
+    
+    db = MongoDBManager()
+    if not db.is_connected():
+        print("✗ MongoDB not connected, not seeding")
+        return
+    db.create_or_update_user({'id': user_id, 'login': f'bench-{user_id}'})
+    saved = db.save_analyses([
+        (user_id, {
+            'repository_name': f'bench/repo-{i}',
+            'overall_repository_risk': (i % 10) / 10,
+            'modules': [
+                {'file': f'src/module_{j}.py', 'risk_score': (j % 10) / 10, 'reason': 'Frequent bug fixes',
+                 'detailed_issues': [{'line': k, 'issue': 'x' * 200} for k in range(10)]}
+                for j in range(200)
+            ]
+        })
+        for i in range(count)
+    ], batch_size=50)
+    print(f"✓ Seeded {len(saved)} analyses")
+    db.close()
+
+def run_benchmark(url: str, user_id: str, concurrency: int, total: int):
+    local = threading.local()
+    
+    def session() -> requests.Session:
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        return local.session
+    
+    def fetch_stats(_) -> tuple:
+        start = time.perf_counter()
+        try:
+            response = session().get(f"{url}/user/{user_id}/stats", timeout=30)
+            ok = response.status_code == 200
+        except requests.exceptions.RequestException:
+            ok = False
+        return time.perf_counter() - start, ok
+    
+    probe_latencies = []
+    stop = threading.Event()
+    
+    def probe():
+        with requests.Session() as probe_session:
+            while not stop.is_set():
+                start = time.perf_counter()
+                try:
+                    probe_session.get(f"{url}/", timeout=30)
+                    probe_latencies.append(time.perf_counter() - start)
+                except requests.exceptions.RequestException:
+                    pass
+                stop.wait(0.05)
+    
+    # Warm up the connection pool and MongoDB connection
+    fetch_stats(None)
+    
+    prober = threading.Thread(target=probe, daemon=True)
+    prober.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(fetch_stats, range(total)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    prober.join()
+    
+    latencies = [latency for latency, ok in results if ok]
+    errors = sum(1 for _, ok in results if not ok)
+    
+    print("\n" + "="*60)
+    print(f"GET /user/{user_id}/stats: {total} requests, {concurrency} concurrent")
+    print("="*60)
+    print(f"   Throughput: {len(latencies) / elapsed:.1f} req/s ({elapsed:.2f}s total)")
+    print(f"   Latency p50/p95/p99: {percentile(latencies, 0.5) * 1000:.1f} / "
+          f"{percentile(latencies, 0.95) * 1000:.1f} / {percentile(latencies, 0.99) * 1000:.1f} ms")
+    print(f"   Errors: {errors}")
+    print(f"\n   Event loop probe (GET /) during load: {len(probe_latencies)} call(s)")
+    print(f"   Latency p50/p99/max: {percentile(probe_latencies, 0.5) * 1000:.1f} / "
+          f"{percentile(probe_latencies, 0.99) * 1000:.1f} / {max(probe_latencies, default=0) * 1000:.1f} ms")
+    return errors == 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--url', default='http://localhost:8000')
+    parser.add_argument('--user-id', default='60312089')
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    
+    print("\n🧪 USER STATS BENCHMARK")
+    if args.seed:
+        print(f"Seeding {args.seed} analyses for user {args.user_id}...")
+        seed_analyses(args.user_id, args.seed)
+    passed = run_benchmark(args.url.rstrip('/'), args.user_id, args.concurrency, args.requests)
+    print(f"\n{'✅' if passed else '❌'} Benchmark complete")
@@ -15,8 +15,11 @@ def clear_test_data():
         print("✗ MongoDB not connected!")
         return
     
-    # Delete test analyses
-    result = db.db.analyses.delete_many({'repository_name': {'$regex': '^test/'}})
+    # Delete test analyses with their modules and Gemini output
+    test_ids = db.db.analyses.distinct('_id', {'repository_name': {'$regex': '^test/'}})
+    db.db.analysis_modules.delete_many({'analysis_id': {'$in': test_ids}})
+    db.db.analysis_gemini.delete_many({'_id': {'$in': test_ids}})
+    result = db.db.analyses.delete_many({'_id': {'$in': test_ids}})
     print(f"✓ Deleted {result.deleted_count} test analyses")
     
     # Keep your real user but reset analysis count
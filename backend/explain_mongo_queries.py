@@ -0,0 +1,58 @@
+"""
+Print the MongoDB query plan of every query MongoDBManager issues
+
+Usage: python explain_mongo_queries.py [user_id] [repository_name]
+
+Flags queries that scan the whole collection or sort in memory, which
+means an index from mongodb_manager.INDEXES is missing or not used.
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
+
+from mongodb_manager import MongoDBManager
+
+def explain_queries(user_id: str, repository_name: str):
+    print("=== MongoDB Query Plans ===\n")
+    
+    db = MongoDBManager()
+    if not db.is_connected():
+        print("✗ MongoDB not connected! Set MONGODB_URI")
+        return False
+    
+    print("Indexes:")
+    for collection in ('users', 'analyses'):
+        for name, info in db.db[collection].index_information().items():
+            print(f"   {collection}.{name}: {info['key']}{' (unique)' if info.get('unique') else ''}")
+    
+    healthy = True
+    print("\nQueries:")
+    for plan in db.explain_queries(user_id, repository_name):
+        if 'error' in plan:
+            print(f"\n   ✗ {plan['query']}: explain failed: {plan['error']}")
+            healthy = False
+            continue
+        
+        problems = []
+        if plan['collection_scan']:
+            problems.append("collection scan")
+        if plan['in_memory_sort']:
+            problems.append("in-memory sort")
+        healthy = healthy and not problems
+        
+        print(f"\n   {'✗' if problems else '✓'} {plan['query']}")
+        print(f"     Plan: {' <- '.join(plan['stages'])}")
+        print(f"     Index: {', '.join(plan['indexes']) or 'none'}")
+        print(f"     Returned {plan['returned']}, examined {plan['keys_examined']} key(s) / "
+              f"{plan['docs_examined']} doc(s) in {plan['time_ms']} ms")
+        if problems:
+            print(f"     ⚠ {', '.join(problems)}")
+    
+    db.close()
+    print(f"\n{'✓ Every query uses an index' if healthy else '⚠ Some queries need attention'}")
+    return healthy
+
+if __name__ == "__main__":
+    user_id = sys.argv[1] if len(sys.argv) > 1 else '60312089'
+    repository_name = sys.argv[2] if len(sys.argv) > 2 else 'test/repo-1'
+    sys.exit(0 if explain_queries(user_id, repository_name) else 1)
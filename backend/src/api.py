@@ -1,16 +1,22 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File
+from fastapi import FastAPI, HTTPException, UploadFile, File, Request, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Dict, Optional
 import json
 import os
+import time
+import uuid
 import asyncio
-from .predictor import BugPredictor
+from .predictor import BugPredictor, IncrementalModuleRisks
 from .github_analyzer import GitHubAnalyzer
 from .incremental_learner import IncrementalLearner
 from .feedback_api import router as feedback_router
-from .progress_tracker import ProgressTracker
+from .progress_tracker import ProgressTracker, ProgressReporter, QueueProgressSink
+from .progress_ws import serve_progress_socket
+from .retrain_worker import RetrainWorker
+from .enrichment_jobs import EnrichmentJobStore
+from .gemini_usage import usage_scope
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -30,10 +36,17 @@ app.add_middleware(
 predictor = BugPredictor()
 learner = IncrementalLearner()
 progress_tracker = ProgressTracker()
+enrichment_jobs = EnrichmentJobStore()
+background_tasks = set()  # Keep references so deferred tasks are not garbage collected
+
+# Retrain in the background and swap new models into the predictor
+retrain_worker = RetrainWorker(learner)
+learner.model_listeners.append(lambda model: setattr(predictor, 'model', model))
 
 # Set learner for feedback API
 from . import feedback_api
 feedback_api.set_learner(learner)
+feedback_api.set_retrain_worker(retrain_worker)
 
 # Include feedback/learning endpoints
 app.include_router(feedback_router, prefix="/api/learning", tags=["learning"])
@@ -42,16 +55,19 @@ app.include_router(feedback_router, prefix="/api/learning", tags=["learning"])
 ENHANCED_FEATURES_ENABLED = False
 oauth_handler = None
 user_manager = None
+mongodb = None
 gemini_analyzer = None
 
 # Import new modules (optional - graceful degradation)
 try:
     from .oauth_handler import OAuthHandler
     from .user_manager import UserManager
+    from .async_mongodb_manager import AsyncMongoDBManager
     from .gemini_analyzer import GeminiAnalyzer
     
     oauth_handler = OAuthHandler()
-    user_manager = UserManager()
+    user_manager = UserManager(use_mongodb=False)  # Local-file fallback; MongoDB goes through `mongodb`
+    mongodb = AsyncMongoDBManager()
     gemini_analyzer = GeminiAnalyzer()
     ENHANCED_FEATURES_ENABLED = True
     print("✓ Enhanced features enabled (OAuth, Gemini AI, User Management)")
@@ -80,10 +96,30 @@ class GitHubURLRequest(BaseModel):
     access_token: Optional[str] = None
     session_id: Optional[str] = None
     user_id: Optional[str] = None
+    defer_gemini: Optional[bool] = False  # Return the ML result now, Gemini via SSE / job handle
 
 class GitHubAuthRequest(BaseModel):
     access_token: str
 
+@app.on_event("startup")
+async def start_background_workers():
+    retrain_worker.start()
+    progress_tracker.start_sweeper()
+    enrichment_jobs.start_sweeper()
+    if mongodb:
+        # Connect in the background so startup never waits on MongoDB
+        task = asyncio.create_task(mongodb.available())
+        background_tasks.add(task)
+        task.add_done_callback(background_tasks.discard)
+
+@app.on_event("shutdown")
+def stop_background_workers():
+    retrain_worker.stop()
+    progress_tracker.stop_sweeper()
+    enrichment_jobs.stop_sweeper()
+    if mongodb:
+        mongodb.close()
+
 @app.get("/")
 def root():
     return {
@@ -111,13 +147,31 @@ def predict_bugs(data: RepositoryData):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/progress/sessions")
+def allocate_progress_session():
+    """Reserve a unique session id to pass as ``session_id`` when starting an analysis"""
+    session_id = progress_tracker.allocate_session()
+    return {"session_id": session_id, "progress_url": f"/progress/{session_id}"}
+
+@app.get("/progress/sessions/stats")
+async def get_progress_stats():
+    """Live progress sessions, subscribers and buffered memory"""
+    return await progress_tracker.stats()
+
 @app.get("/progress/{session_id}")
-async def get_progress(session_id: str):
-    """Stream progress updates for an analysis session"""
-    progress_tracker.create_session(session_id)
+async def get_progress(session_id: str, request: Request, last_event_id: Optional[int] = None):
+    """Stream progress updates for an analysis session
+    
+    Any number of clients may watch the same session. A reconnecting
+    EventSource sends ``Last-Event-ID`` and resumes after that event; the
+    ``last_event_id`` query parameter does the same for other clients.
+    """
+    header = request.headers.get("last-event-id")
+    if header and header.isdigit():
+        last_event_id = int(header)
     
     return StreamingResponse(
-        progress_tracker.get_updates(session_id),
+        progress_tracker.get_updates(session_id, last_event_id),
         media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache",
@@ -125,10 +179,146 @@ async def get_progress(session_id: str):
         }
     )
 
+@app.websocket("/ws/progress")
+async def progress_websocket(websocket: WebSocket, format: str = "json"):
+    """Follow many progress sessions and deferred Gemini jobs over one connection
+    
+    Send ``{"action": "subscribe", "sessions": [...], "jobs": [...]}`` and
+    updates arrive tagged with their session id; see ``ProgressSocket`` for
+    the protocol. ``format=msgpack`` switches to binary frames.
+    """
+    await serve_progress_socket(websocket, progress_tracker, enrichment_jobs, format)
+
+async def fetch_repository(analyzer: GitHubAnalyzer, request: GitHubURLRequest) -> Dict:
+    """Run the blocking GitHub fetch in a worker thread; its progress still streams live"""
+    try:
+        return await asyncio.to_thread(
+            analyzer.analyze_repository, request.repo_url, max_commits=request.max_commits
+        )
+    finally:
+        if analyzer.progress:
+            await analyzer.progress.drain()
+
+def build_ml_summary(result: Dict) -> Dict:
+    """Condense an ML prediction result into the input Gemini expects"""
+    modules = result.get('modules', [])
+    return {
+        "repository": result['repository_name'],
+        "overall_risk": result['overall_repository_risk'],
+        "total_files": len(modules),
+        "high_risk_files": [m for m in modules if m['risk_score'] >= 0.7],
+        "medium_risk_files": [m for m in modules if 0.4 <= m['risk_score'] < 0.7],
+        "modules": modules[:10]  # Top 10 risky files
+    }
+
+def gemini_failure_result(result: Dict, error: Exception) -> Dict:
+    """Placeholder Gemini section used when the AI analysis fails"""
+    return {
+        "error": str(error),
+        "overall_risk": int(result['overall_repository_risk'] * 100),
+        "files_analyzed": 0,
+        "files": [],
+        "recommendations": [],
+        "critical_concerns": [],
+        "summary": f"Gemini AI analysis failed: {str(error)[:200]}"
+    }
+
+async def save_user_analysis(user_id: Optional[str], result: Dict) -> Optional[str]:
+    """Save analysis to the user's profile (MongoDB or local fallback)
+    
+    Returns the MongoDB analysis id, or None when nothing was saved to MongoDB.
+    """
+    if not user_id:
+        print(f"⚠️ No user_id provided, analysis not saved to user profile")
+        return None
+    
+    print(f"💾 Saving analysis for user: {user_id}")
+    if not ENHANCED_FEATURES_ENABLED:
+        print(f"⚠️ Enhanced features not enabled, cannot save analysis")
+        return None
+    
+    # Try MongoDB first
+    if await mongodb.available():
+        analysis_id = await mongodb.save_analysis(user_id, result)
+        print(f"✅ Analysis saved to MongoDB for user {user_id}")
+        return analysis_id if analysis_id not in ("local", "error") else None
+    
+    # Fallback to local file
+    user_manager.save_analysis_local(user_id, result)
+    print(f"✅ Analysis saved locally for user {user_id}")
+    return None
+
+def gemini_pending_result(result: Dict, job_id: str) -> Dict:
+    """Placeholder Gemini section returned while the analysis runs in the background"""
+    return {
+        "status": "pending",
+        "job_id": job_id,
+        "overall_risk": int(result['overall_repository_risk'] * 100),
+        "files_analyzed": 0,
+        "files": [],
+        "recommendations": [],
+        "critical_concerns": [],
+        "summary": "Gemini AI analysis is running in the background..."
+    }
+
+def attach_gemini_usage(gemini_result: Dict, usage_id: str) -> Dict:
+    """Store the token / latency totals of an analysis' Gemini calls with its Gemini section
+    
+    Reads the usage log (SQLite); call it with ``asyncio.to_thread`` from async code.
+    """
+    gemini_result["usage"] = {"id": usage_id, **gemini_analyzer.usage.summary(analysis_id=usage_id)}
+    return gemini_result
+
+def schedule_session_cleanup(session_id: str, delay: float = 2.0):
+    """Drop a progress session shortly after its last update, without delaying the response"""
+    session = progress_tracker.sessions.get(session_id)
+    asyncio.get_running_loop().call_later(delay, progress_tracker.cleanup_session, session_id, session)
+
+async def run_deferred_gemini(job_id: str, session_id: str, result: Dict, analysis_id: Optional[str],
+                              user_id: Optional[str] = None):
+    """Background half of a deferred analysis: run Gemini, persist and push the result
+    
+    The job store is SQLite, so its calls run in worker threads.
+    """
+    await asyncio.to_thread(enrichment_jobs.mark_running, job_id)
+    try:
+        with usage_scope(analysis_id=job_id, user_id=user_id):
+            gemini_result = await gemini_analyzer.analyze_ml_results_async(
+                build_ml_summary(result),
+                on_partial=gemini_partial_forwarder(session_id, 100)
+            )
+        gemini_result = await asyncio.to_thread(attach_gemini_usage, gemini_result, job_id)
+        await asyncio.to_thread(enrichment_jobs.complete, job_id, gemini_result)
+        message = "Gemini AI analysis complete!"
+    except Exception as e:
+        print(f"❌ Deferred Gemini AI analysis failed: {e}")
+        gemini_result = await asyncio.to_thread(attach_gemini_usage, gemini_failure_result(result, e), job_id)
+        await asyncio.to_thread(enrichment_jobs.fail, job_id, str(e), gemini_result)
+        message = "Gemini AI unavailable, using ML only"
+    
+    try:
+        if analysis_id:
+            await mongodb.update_analysis_gemini(analysis_id, gemini_result)
+        await progress_tracker.update(
+            session_id, "complete", message, 100,
+            result={"job_id": job_id, "gemini_analysis": gemini_result}
+        )
+    finally:
+        schedule_session_cleanup(session_id)
+
+def gemini_partial_forwarder(session_id: str, progress: int):
+    """Forward pieces of a streaming Gemini answer to the session's progress stream"""
+    async def forward(partial: Dict):
+        await progress_tracker.update(
+            session_id, "gemini", "Receiving Gemini AI insights...", progress, partial=partial
+        )
+    return forward
+
 @app.post("/analyze-github-url")
 async def analyze_github_url(request: GitHubURLRequest):
     """Analyze a GitHub repository by URL with progress tracking"""
-    session_id = request.session_id or "default"
+    session_id = request.session_id or progress_tracker.allocate_session()
+    job_id = None  # Set when Gemini is deferred to the background
     
     try:
         await progress_tracker.update(session_id, "starting", "Initializing analysis...", 0)
@@ -149,10 +339,7 @@ async def analyze_github_url(request: GitHubURLRequest):
         
         # Analyze repository
         await progress_tracker.update(session_id, "analyzing", "Fetching repository data...", 20)
-        repo_data = analyzer.analyze_repository(
-            request.repo_url, 
-            max_commits=request.max_commits
-        )
+        repo_data = await fetch_repository(analyzer, request)
         
         # Predict bug risk
         await progress_tracker.update(session_id, "predicting", "Calculating risk scores...", 70)
@@ -160,18 +347,22 @@ async def analyze_github_url(request: GitHubURLRequest):
         result["metadata"] = repo_data.get("metadata", {})
         
         # Add Gemini AI analysis if available
-        if ENHANCED_FEATURES_ENABLED and gemini_analyzer:
+        if ENHANCED_FEATURES_ENABLED and gemini_analyzer and request.defer_gemini:
+            # Respond with the ML result now; Gemini runs after the response
+            job_id = await asyncio.to_thread(
+                enrichment_jobs.create, session_id, request.user_id, result['repository_name']
+            )
+            result["gemini_analysis"] = gemini_pending_result(result, job_id)
+            result["gemini_job"] = {"job_id": job_id, "status_url": f"/analysis-jobs/{job_id}"}
+        elif ENHANCED_FEATURES_ENABLED and gemini_analyzer:
+            usage_id = uuid.uuid4().hex
             try:
                 await progress_tracker.update(session_id, "gemini", "Running Gemini AI analysis...", 80)
-                ml_analysis_summary = {
-                    "repository": result['repository_name'],
-                    "overall_risk": result['overall_repository_risk'],
-                    "total_files": len(result.get('modules', [])),
-                    "high_risk_files": [m for m in result.get('modules', []) if m['risk_score'] >= 0.7],
-                    "medium_risk_files": [m for m in result.get('modules', []) if 0.4 <= m['risk_score'] < 0.7],
-                    "modules": result.get('modules', [])[:10]
-                }
-                gemini_result = gemini_analyzer.analyze_ml_results(ml_analysis_summary)
+                with usage_scope(analysis_id=usage_id, user_id=request.user_id):
+                    gemini_result = await gemini_analyzer.analyze_ml_results_async(
+                        build_ml_summary(result),
+                        on_partial=gemini_partial_forwarder(session_id, 80)
+                    )
                 result["gemini_analysis"] = gemini_result
                 print(f"✅ Gemini AI analysis completed")
                 print(f"   - Has recommendations: {bool(gemini_result.get('recommendations'))}")
@@ -179,16 +370,9 @@ async def analyze_github_url(request: GitHubURLRequest):
             except Exception as e:
                 print(f"❌ Gemini AI analysis failed: {e}")
                 # Don't fail the entire request, just add error info
-                result["gemini_analysis"] = {
-                    "error": str(e),
-                    "overall_risk": int(result['overall_repository_risk'] * 100),
-                    "files_analyzed": 0,
-                    "files": [],
-                    "recommendations": [],
-                    "critical_concerns": [],
-                    "summary": f"Gemini AI analysis failed: {str(e)[:200]}"
-                }
+                result["gemini_analysis"] = gemini_failure_result(result, e)
                 await progress_tracker.update(session_id, "warning", f"Gemini AI unavailable, using ML only")
+            await asyncio.to_thread(attach_gemini_usage, result["gemini_analysis"], usage_id)
         
         # Record analysis for learning
         await progress_tracker.update(session_id, "recording", "Saving analysis...", 90)
@@ -196,21 +380,20 @@ async def analyze_github_url(request: GitHubURLRequest):
         result["record_id"] = record_id
         
         # Save analysis data if user_id is provided
-        if request.user_id:
-            print(f"💾 Saving analysis for user: {request.user_id}")
-            if ENHANCED_FEATURES_ENABLED:
-                # Try MongoDB first
-                if user_manager.mongodb.is_connected():
-                    user_manager.mongodb.save_analysis(request.user_id, result)
-                    print(f"✅ Analysis saved to MongoDB for user {request.user_id}")
-                else:
-                    # Fallback to local file
-                    user_manager.save_analysis_local(request.user_id, result)
-                    print(f"✅ Analysis saved locally for user {request.user_id}")
-            else:
-                print(f"⚠️ Enhanced features not enabled, cannot save analysis")
-        else:
-            print(f"⚠️ No user_id provided, analysis not saved to user profile")
+        analysis_id = await save_user_analysis(request.user_id, result)
+        
+        if job_id:
+            await asyncio.to_thread(enrichment_jobs.attach, job_id, record_id=record_id, analysis_id=analysis_id)
+            task = asyncio.create_task(
+                run_deferred_gemini(job_id, session_id, result, analysis_id, request.user_id)
+            )
+            background_tasks.add(task)
+            task.add_done_callback(background_tasks.discard)
+            await progress_tracker.update(
+                session_id, "ml_complete", "ML analysis complete, Gemini AI running in background...", 100
+            )
+            print(f"✓ ML analysis complete for {result['repository_name']} (Gemini deferred, job {job_id})")
+            return result
         
         await progress_tracker.update(session_id, "complete", "Analysis complete!", 100)
         print(f"✓ Analysis complete for {result['repository_name']}")
@@ -225,9 +408,119 @@ async def analyze_github_url(request: GitHubURLRequest):
         print(f"✗ Error: {error_msg}")
         raise HTTPException(status_code=400, detail=error_msg)
     finally:
-        # Cleanup after a delay
-        await asyncio.sleep(2)
-        progress_tracker.cleanup_session(session_id)
+        # Cleanup after a delay, unless a deferred Gemini job still reports to this session
+        if not job_id:
+            schedule_session_cleanup(session_id)
+
+@app.get("/analysis-jobs/{job_id}")
+def get_analysis_job(job_id: str):
+    """Status and result of a deferred Gemini analysis"""
+    job = enrichment_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+def ndjson_line(event: Dict) -> str:
+    """Serialize one streaming event as a newline-delimited JSON line"""
+    return json.dumps(event, default=str) + "\n"
+
+@app.post("/analyze-github-url/stream")
+async def analyze_github_url_stream(request: GitHubURLRequest):
+    """Analyze a GitHub repository and stream results as NDJSON.
+    
+    Emits one line per event: ``started``, ``progress`` while commits are
+    fetched, provisional ``module`` lines (``"provisional": true``) for the
+    files touched by each page of commits as it arrives, then one final
+    ``module`` per scored file, ``summary`` with the repository-level
+    result, ``gemini`` when the AI section is ready and finally ``complete``
+    (or ``error``). A later ``module`` line for a file replaces earlier ones.
+    """
+    if not request.repo_url or not request.repo_url.strip():
+        raise HTTPException(status_code=400, detail="Repository URL is required")
+    
+    async def event_stream():
+        fetch = None
+        try:
+            yield ndjson_line({"type": "started", "repository": request.repo_url})
+            
+            # The fetch runs in a worker thread; its progress reports and pages of
+            # processed commits come back through this queue while it runs
+            loop = asyncio.get_running_loop()
+            updates = asyncio.Queue()
+            reporter = ProgressReporter(QueueProgressSink(updates), None, loop, progress_tracker.max_updates_per_second)
+            analyzer = GitHubAnalyzer(access_token=request.access_token, progress=reporter)
+            
+            def on_commits(page: List[Dict]):
+                loop.call_soon_threadsafe(updates.put_nowait, ('commits', page))
+            
+            async def run_fetch():
+                try:
+                    return await asyncio.to_thread(
+                        analyzer.analyze_repository, request.repo_url, request.max_commits, on_commits
+                    )
+                finally:
+                    await reporter.drain()
+                    updates.put_nowait(None)
+            
+            fetch = asyncio.create_task(run_fetch())
+            provisional = IncrementalModuleRisks(predictor)
+            while (item := await updates.get()) is not None:
+                kind, payload = item
+                if kind == 'progress':
+                    yield ndjson_line({"type": "progress", **payload})
+                    continue
+                # Only the files this page touched are rescored
+                for module in provisional.add(payload):
+                    yield ndjson_line({
+                        "type": "module", "provisional": True, "commits": provisional.total_commits, "module": module
+                    })
+            repo_data = await fetch
+            
+            modules = []
+            for module in predictor.iter_module_risks(repo_data):
+                modules.append(module)
+                yield ndjson_line({"type": "module", "module": module})
+            
+            result = predictor.summarize_modules(repo_data.get('repository_name', 'Unknown'), modules)
+            result["metadata"] = repo_data.get("metadata", {})
+            yield ndjson_line({
+                "type": "summary",
+                "repository_name": result["repository_name"],
+                "overall_repository_risk": result["overall_repository_risk"],
+                "files": [m["file"] for m in result["modules"]],
+                "metadata": result["metadata"]
+            })
+            
+            if ENHANCED_FEATURES_ENABLED and gemini_analyzer:
+                usage_id = uuid.uuid4().hex
+                try:
+                    with usage_scope(analysis_id=usage_id, user_id=request.user_id):
+                        result["gemini_analysis"] = await gemini_analyzer.analyze_ml_results_async(
+                            build_ml_summary(result)
+                        )
+                except Exception as e:
+                    print(f"❌ Gemini AI analysis failed: {e}")
+                    result["gemini_analysis"] = gemini_failure_result(result, e)
+                await asyncio.to_thread(attach_gemini_usage, result["gemini_analysis"], usage_id)
+                yield ndjson_line({"type": "gemini", "gemini_analysis": result["gemini_analysis"]})
+            
+            result["record_id"] = learner.record_analysis(repo_data, result)
+            await save_user_analysis(request.user_id, result)
+            
+            yield ndjson_line({"type": "complete", "record_id": result["record_id"]})
+        except Exception as e:
+            print(f"✗ Error: {e}")
+            yield ndjson_line({"type": "error", "detail": str(e)})
+        finally:
+            if fetch and not fetch.done():
+                # Client went away mid-fetch; the thread finishes on its own
+                fetch.add_done_callback(lambda task: task.cancelled() or task.exception())
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache"}
+    )
 
 @app.post("/analyze-github-file")
 async def analyze_github_file(file: UploadFile = File(...)):
@@ -398,7 +691,10 @@ async def github_callback(code: str):
         user_info = await oauth_handler.get_user_info(access_token)
         
         # Create or update user
-        user_profile = user_manager.create_or_update_user(user_info)
+        if await mongodb.available():
+            user_profile = await mongodb.create_or_update_user(user_info)
+        else:
+            user_profile = user_manager.create_or_update_user(user_info)
         
         # Create JWT token
         jwt_token = oauth_handler.create_jwt_token(user_info)
@@ -423,23 +719,29 @@ def verify_token(token: str):
 
 # User Management Endpoints
 @app.get("/user/{user_id}")
-def get_user_profile(user_id: str):
+async def get_user_profile(user_id: str):
     """Get user profile"""
     if not ENHANCED_FEATURES_ENABLED:
         raise HTTPException(status_code=503, detail="Enhanced features not available")
-    user = user_manager.get_user(user_id)
+    if await mongodb.available():
+        user = await mongodb.get_user(user_id)
+    else:
+        user = user_manager.get_user(user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return user
 
 @app.get("/user/{user_id}/stats")
-def get_user_stats(user_id: str):
+async def get_user_stats(user_id: str):
     """Get user statistics"""
     if not ENHANCED_FEATURES_ENABLED:
         raise HTTPException(status_code=503, detail="Enhanced features not available")
     
     print(f"📊 Getting stats for user: {user_id}")
-    stats = user_manager.get_user_stats(user_id)
+    if await mongodb.available():
+        stats = await mongodb.get_user_stats(user_id)
+    else:
+        stats = user_manager.get_user_stats(user_id)
     
     if not stats or (stats.get('total_analyses') == 0 and stats.get('repositories_analyzed') == 0):
         print(f"⚠ No stats found for user {user_id}, returning defaults")
@@ -466,6 +768,34 @@ async def get_user_repositories(user_id: str, github_token: str):
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@app.get("/user/{user_id}/analyses")
+async def get_user_analyses(user_id: str, limit: int = 20):
+    """Summaries of the user's saved analyses, newest first (no module details)"""
+    if not ENHANCED_FEATURES_ENABLED:
+        raise HTTPException(status_code=503, detail="Enhanced features not available")
+    if not await mongodb.available():
+        return {"analyses": []}
+    return {"analyses": await mongodb.get_user_analyses(user_id, limit=min(max(limit, 1), 100))}
+
+@app.get("/analyses/{analysis_id}")
+async def get_saved_analysis(analysis_id: str, include_modules: bool = True):
+    """A saved analysis with its modules and Gemini output, for the detail view"""
+    if not ENHANCED_FEATURES_ENABLED or not await mongodb.available():
+        raise HTTPException(status_code=503, detail="Analysis storage not available")
+    analysis = await mongodb.get_analysis(analysis_id, include_modules=include_modules)
+    if not analysis:
+        raise HTTPException(status_code=404, detail="Analysis not found")
+    return analysis
+
+@app.get("/analyses/{analysis_id}/modules")
+async def get_saved_analysis_modules(analysis_id: str, offset: int = 0, limit: int = 50):
+    """One page of a saved analysis' modules"""
+    if not ENHANCED_FEATURES_ENABLED or not await mongodb.available():
+        raise HTTPException(status_code=503, detail="Analysis storage not available")
+    modules = await mongodb.get_analysis_modules(analysis_id, offset=max(offset, 0),
+                                                 limit=min(max(limit, 1), 500))
+    return {"analysis_id": analysis_id, "offset": offset, "modules": modules}
+
 # Gemini AI Analysis Endpoints
 class GeminiAnalysisRequest(BaseModel):
     code: str
@@ -493,6 +823,55 @@ def analyze_repository_with_gemini(files_data: List[dict]):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/analyze/gemini/cache")
+def get_gemini_cache_stats():
+    """Gemini response cache hit/miss counters"""
+    if not ENHANCED_FEATURES_ENABLED:
+        raise HTTPException(status_code=503, detail="Gemini AI not available")
+    if not gemini_analyzer.cache:
+        return {"enabled": False}
+    return {"enabled": True, **gemini_analyzer.cache.stats()}
+
+@app.get("/analyze/gemini/keys")
+def get_gemini_key_stats():
+    """Health and cooldown state of each configured Gemini API key"""
+    if not ENHANCED_FEATURES_ENABLED:
+        raise HTTPException(status_code=503, detail="Gemini AI not available")
+    return {"keys": gemini_analyzer.key_pool.stats()}
+
+@app.get("/analyze/gemini/breaker")
+def get_gemini_breaker_stats():
+    """Circuit breaker state for Gemini calls"""
+    if not ENHANCED_FEATURES_ENABLED:
+        raise HTTPException(status_code=503, detail="Gemini AI not available")
+    return gemini_analyzer.breaker.stats()
+
+@app.get("/analyze/gemini/usage")
+def get_gemini_usage(user_id: Optional[str] = None, analysis_id: Optional[str] = None,
+                     hours: float = 24, bucket_minutes: float = 60):
+    """Gemini token, latency and cache-hit accounting
+    
+    With ``analysis_id`` (the ``usage.id`` stored with an analysis) returns
+    that analysis' totals. Otherwise totals over the last ``hours``, per
+    time window of ``bucket_minutes`` and, unless filtered by ``user_id``,
+    the heaviest users.
+    """
+    if not ENHANCED_FEATURES_ENABLED:
+        raise HTTPException(status_code=503, detail="Gemini AI not available")
+    usage = gemini_analyzer.usage
+    if analysis_id:
+        return {"analysis_id": analysis_id, **usage.summary(analysis_id=analysis_id)}
+    
+    since = time.time() - hours * 3600
+    report = {
+        "window_hours": hours,
+        "totals": usage.summary(user_id=user_id, since=since),
+        "timeline": usage.timeline(bucket_minutes * 60, since=since, user_id=user_id)
+    }
+    if not user_id:
+        report["by_user"] = usage.by_user(since=since)
+    return report
+
 # Enhanced Analysis with Gemini
 @app.post("/analyze-enhanced")
 async def analyze_enhanced(request: GitHubURLRequest):
@@ -500,7 +879,7 @@ async def analyze_enhanced(request: GitHubURLRequest):
     if not ENHANCED_FEATURES_ENABLED:
         raise HTTPException(status_code=503, detail="Enhanced analysis not available. Use /analyze-github-url instead")
     
-    session_id = request.session_id or "default"
+    session_id = request.session_id or progress_tracker.allocate_session()
     user_id = request.user_id  # Get user_id from request
     
     try:
@@ -513,25 +892,20 @@ async def analyze_enhanced(request: GitHubURLRequest):
             progress_tracker=progress_tracker,
             session_id=session_id
         )
-        repo_data = analyzer.analyze_repository(request.repo_url, max_commits=request.max_commits)
+        repo_data = await fetch_repository(analyzer, request)
         ml_result = predictor.predict_repository_risk(repo_data)
         
         # Gemini AI analysis - analyze ML results with AI
         await progress_tracker.update(session_id, "gemini", "Running Gemini AI analysis...", 60)
+        usage_id = uuid.uuid4().hex
         
         try:
-            # Prepare ML analysis data for Gemini
-            ml_analysis_summary = {
-                "repository": ml_result['repository_name'],
-                "overall_risk": ml_result['overall_repository_risk'],
-                "total_files": len(ml_result.get('modules', [])),
-                "high_risk_files": [m for m in ml_result.get('modules', []) if m['risk_score'] >= 0.7],
-                "medium_risk_files": [m for m in ml_result.get('modules', []) if 0.4 <= m['risk_score'] < 0.7],
-                "modules": ml_result.get('modules', [])[:10]  # Top 10 risky files
-            }
-            
             # Get Gemini's interpretation of the ML results
-            gemini_result = gemini_analyzer.analyze_ml_results(ml_analysis_summary)
+            with usage_scope(analysis_id=usage_id, user_id=user_id):
+                gemini_result = await gemini_analyzer.analyze_ml_results_async(
+                    build_ml_summary(ml_result),
+                    on_partial=gemini_partial_forwarder(session_id, 60)
+                )
             
         except Exception as e:
             print(f"Error in Gemini analysis: {e}")
@@ -542,6 +916,7 @@ async def analyze_enhanced(request: GitHubURLRequest):
                 "summary": f"ML Analysis shows {len(ml_result.get('modules', []))} files with potential issues.",
                 "error": str(e)
             }
+        await asyncio.to_thread(attach_gemini_usage, gemini_result, usage_id)
         
         # Combine results
         await progress_tracker.update(session_id, "combining", "Combining results...", 90)
@@ -555,8 +930,8 @@ async def analyze_enhanced(request: GitHubURLRequest):
         # Save analysis to MongoDB and update user stats
         if user_id:
             print(f"💾 Saving enhanced analysis for user: {user_id}")
-            if user_manager.mongodb.is_connected():
-                user_manager.mongodb.save_analysis(user_id, combined_result)
+            if await mongodb.available():
+                await mongodb.save_analysis(user_id, combined_result)
                 print(f"✅ Enhanced analysis saved to MongoDB for user {user_id}")
             else:
                 # Fallback to local storage
@@ -572,8 +947,7 @@ async def analyze_enhanced(request: GitHubURLRequest):
         await progress_tracker.update(session_id, "error", f"Error: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
     finally:
-        await asyncio.sleep(2)
-        progress_tracker.cleanup_session(session_id)
+        schedule_session_cleanup(session_id)
 
 # Analytics Endpoints
 @app.get("/analytics/overview")
@@ -607,12 +981,12 @@ def get_analytics_overview():
     }
 
 @app.get("/analytics/trends")
-def get_analytics_trends(user_id: Optional[str] = None):
+async def get_analytics_trends(user_id: Optional[str] = None):
     """Get trend data for charts"""
     if user_id:
         # Try MongoDB first
-        if user_manager.mongodb.is_connected():
-            return user_manager.mongodb.get_analytics_trends(user_id)
+        if mongodb and await mongodb.available():
+            return await mongodb.get_analytics_trends(user_id)
         
         # Fallback to local storage
         user = user_manager.get_user(user_id)
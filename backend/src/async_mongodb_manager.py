@@ -0,0 +1,266 @@
+"""
+Async MongoDB access for the API (Motor), sharing documents and queries with MongoDBManager
+"""
+import asyncio
+import os
+import time
+from datetime import datetime
+from typing import Optional, List
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from motor.motor_asyncio import AsyncIOMotorClient
+from dotenv import load_dotenv
+from .mongodb_manager import (
+    INDEXES, SUMMARY_FIELDS, TREND_FIELDS, STATS_USER_FIELDS, client_options, user_upsert,
+    analysis_count_update, format_user, analysis_documents, analysis_summary, bucket_query, page_modules,
+    recent_stats_pipeline, empty_stats, user_stats, empty_trends, analytics_trends
+)
+
+load_dotenv()
+
+class AsyncMongoDBManager:
+    """MongoDB access that never blocks the event loop
+    
+    Nothing connects at construction. The Motor client (pool size and
+    timeouts from ``client_options``) is created on first use, and
+    ``available`` pings the server once, creates the indexes and caches the
+    answer; after a failure it checks again every ``retry_seconds`` instead
+    of giving up for the life of the process. Callers fall back to local
+    storage while it returns False.
+    """
+    
+    def __init__(self, uri: Optional[str] = None, db_name: Optional[str] = None,
+                 retry_seconds: Optional[float] = None):
+        self.uri = uri or os.getenv('MONGODB_URI')
+        self.db_name = db_name or os.getenv('MONGODB_DB_NAME', 'githubbug')
+        self.retry_seconds = retry_seconds if retry_seconds is not None \
+            else float(os.getenv('MONGODB_RETRY_SECONDS', '30'))
+        self.client = None
+        self.db = None
+        self._loop = None
+        self._available = False
+        self._checked_at = None
+        self._check_lock = None
+    
+    def _connect(self):
+        """Create the client for the running loop; no I/O happens until the first operation"""
+        loop = asyncio.get_running_loop()
+        if self.client is None or self._loop is not loop:
+            if self.client is not None:
+                self.client.close()
+            self.client = AsyncIOMotorClient(self.uri, **client_options())
+            self.db = self.client[self.db_name]
+            self._loop = loop
+            self._check_lock = asyncio.Lock()
+            self._checked_at = None
+    
+    async def available(self) -> bool:
+        """Whether MongoDB can be used; the first call (and retries) ping the server"""
+        self._connect()
+        if self._checked_at is not None and (self._available or time.monotonic() - self._checked_at < self.retry_seconds):
+            return self._available
+        
+        async with self._check_lock:
+            if self._checked_at is not None and (self._available or time.monotonic() - self._checked_at < self.retry_seconds):
+                return self._available
+            try:
+                await self.client.admin.command('ping')
+                await self.ensure_indexes()
+                print(f"✓ Connected to MongoDB (async): {self.db_name}")
+                self._available = True
+            except Exception as e:
+                print(f"✗ MongoDB connection failed: {e}")
+                self._available = False
+            self._checked_at = time.monotonic()
+        return self._available
+    
+    async def ensure_indexes(self):
+        """Create the indexes in INDEXES; existing ones are left alone"""
+        for collection, keys, options in INDEXES:
+            try:
+                await self.db[collection].create_index(keys, **options)
+            except Exception as e:
+                print(f"⚠ Could not create index {options['name']} on {collection}: {e}")
+    
+    # User Management
+    async def create_or_update_user(self, user_data: dict) -> dict:
+        """Create or update user in MongoDB with one atomic upsert"""
+        if not await self.available():
+            return user_data
+        
+        try:
+            for attempt in range(2):
+                try:
+                    return format_user(await self.db.users.find_one_and_update(
+                        *user_upsert(user_data), upsert=True, return_document=ReturnDocument.AFTER
+                    ))
+                except DuplicateKeyError:
+                    # Lost a race to create the same user; retrying updates it instead
+                    if attempt:
+                        raise
+        except Exception as e:
+            print(f"Error creating/updating user: {e}")
+            return user_data
+    
+    async def get_user(self, user_id: str) -> Optional[dict]:
+        """Get user from MongoDB"""
+        if not await self.available():
+            return None
+        
+        try:
+            return format_user(await self.db.users.find_one({'user_id': user_id}))
+        except Exception as e:
+            print(f"Error getting user: {e}")
+            return None
+    
+    async def update_analysis_count(self, user_id: str):
+        """Increment user's analysis count"""
+        if not await self.available():
+            return
+        
+        try:
+            await self.db.users.update_one({'user_id': user_id}, analysis_count_update(1))
+        except Exception as e:
+            print(f"Error updating analysis count: {e}")
+    
+    # Analysis Management (layout described in MongoDBManager)
+    async def save_analysis(self, user_id: str, analysis_data: dict) -> str:
+        """Save analysis result to MongoDB"""
+        if not await self.available():
+            print(f"⚠ MongoDB not connected, skipping save for user {user_id}")
+            return "local"
+        
+        try:
+            analysis_doc, buckets, gemini_doc = analysis_documents(user_id, analysis_data)
+            
+            # Details first, so a summary never points at missing modules; writes
+            # to different collections go out together, one round-trip per step
+            details = []
+            if buckets:
+                details.append(self.db.analysis_modules.insert_many(buckets, ordered=False))
+            if gemini_doc:
+                details.append(self.db.analysis_gemini.insert_one(gemini_doc))
+            await asyncio.gather(*details)
+            await asyncio.gather(
+                self.db.analyses.insert_one(analysis_doc),
+                self.db.users.update_one({'user_id': user_id}, analysis_count_update(1))
+            )
+            
+            print(f"✓ Analysis saved to MongoDB: {analysis_data.get('repository_name')} for user {user_id}")
+            return str(analysis_doc['_id'])
+        except Exception as e:
+            print(f"✗ Error saving analysis: {e}")
+            return "error"
+    
+    async def update_analysis_gemini(self, analysis_id: str, gemini_analysis: dict) -> bool:
+        """Attach a (deferred) Gemini analysis to a saved analysis"""
+        if not await self.available():
+            return False
+        
+        try:
+            now = datetime.utcnow()
+            result = await self.db.analyses.update_one(
+                {'_id': ObjectId(analysis_id)},
+                {'$set': {'has_gemini': True, 'gemini_updated_at': now}}
+            )
+            if result.matched_count != 1:
+                return False
+            await self.db.analysis_gemini.update_one(
+                {'_id': ObjectId(analysis_id)},
+                {'$set': {'gemini_analysis': gemini_analysis, 'updated_at': now}},
+                upsert=True
+            )
+            return True
+        except Exception as e:
+            print(f"✗ Error updating Gemini analysis: {e}")
+            return False
+    
+    async def get_user_analyses(self, user_id: str, limit: int = 50, projection: Optional[dict] = None) -> List[dict]:
+        """Get summaries of the user's analyses, newest first"""
+        if not await self.available():
+            return []
+        
+        try:
+            cursor = self.db.analyses.find(
+                {'user_id': user_id}, projection or SUMMARY_FIELDS
+            ).sort('analyzed_at', -1).limit(limit)
+            return [analysis_summary(doc) for doc in await cursor.to_list(length=limit)]
+        except Exception as e:
+            print(f"Error getting analyses: {e}")
+            return []
+    
+    async def get_analysis(self, analysis_id: str, include_modules: bool = True) -> Optional[dict]:
+        """Full analysis for the detail view: summary, modules and Gemini output"""
+        if not await self.available():
+            return None
+        
+        try:
+            doc = await self.db.analyses.find_one({'_id': ObjectId(analysis_id)})
+            if not doc:
+                return None
+            doc = analysis_summary(doc)
+            
+            if not include_modules:
+                doc.pop('modules', None)
+            elif 'modules' not in doc:
+                doc['modules'] = await self.get_analysis_modules(analysis_id)
+            if doc.get('has_gemini') and 'gemini_analysis' not in doc:
+                gemini = await self.db.analysis_gemini.find_one({'_id': ObjectId(analysis_id)})
+                doc['gemini_analysis'] = gemini.get('gemini_analysis') if gemini else None
+            return doc
+        except Exception as e:
+            print(f"Error getting analysis: {e}")
+            return None
+    
+    async def get_analysis_modules(self, analysis_id: str, offset: int = 0, limit: Optional[int] = None) -> List[dict]:
+        """Modules of an analysis, reading only the buckets that cover ``offset``..``offset + limit``"""
+        if not await self.available():
+            return []
+        
+        try:
+            cursor = self.db.analysis_modules.find(bucket_query(analysis_id, offset, limit)).sort('bucket', 1)
+            buckets = await cursor.to_list(length=None)
+            legacy = None
+            if not buckets:
+                legacy = await self.db.analyses.find_one({'_id': ObjectId(analysis_id)}, {'modules': 1})
+            return page_modules(buckets, legacy, offset, limit)
+        except Exception as e:
+            print(f"Error getting analysis modules: {e}")
+            return []
+    
+    async def get_user_stats(self, user_id: str) -> dict:
+        """Get user statistics, computed by the server (see MongoDBManager.get_user_stats)"""
+        if not await self.available():
+            return empty_stats()
+        
+        try:
+            user, recent = await asyncio.gather(
+                self.db.users.find_one({'user_id': user_id}, STATS_USER_FIELDS),
+                self.db.analyses.aggregate(recent_stats_pipeline(user_id)).to_list(length=1)
+            )
+            if not user:
+                return empty_stats()
+            return user_stats(user, recent[0] if recent else None)
+        except Exception as e:
+            print(f"Error getting user stats: {e}")
+            return empty_stats()
+    
+    async def get_analytics_trends(self, user_id: str) -> dict:
+        """Get trend data for charts"""
+        if not await self.available():
+            return empty_trends()
+        
+        try:
+            return analytics_trends(await self.get_user_analyses(user_id, limit=10, projection=TREND_FIELDS))
+        except Exception as e:
+            print(f"Error getting trends: {e}")
+            return empty_trends()
+    
+    def close(self):
+        """Close the connection pool"""
+        if self.client:
+            self.client.close()
+            self.client = None
+            self.db = None
+            print("✓ MongoDB connection closed")
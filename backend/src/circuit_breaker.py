@@ -0,0 +1,96 @@
+"""Circuit breaker that stops calling a failing dependency for a while"""
+import threading
+import time
+from collections import deque
+from typing import Dict
+
+class CircuitBreaker:
+    """Rolling-window error-rate breaker
+    
+    Outcomes of the last ``window_size`` calls are kept. Once at least
+    ``min_calls`` are recorded and the failure rate reaches
+    ``failure_threshold`` the breaker opens and ``allow_request`` returns False
+    for ``open_seconds``. After that a single trial call is let through
+    (half-open): success closes the breaker, failure opens it again.
+    """
+    
+    def __init__(self, window_size: int = 20, min_calls: int = 5,
+                 failure_threshold: float = 0.5, open_seconds: float = 30):
+        self.window_size = window_size
+        self.min_calls = min_calls
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self._outcomes = deque(maxlen=window_size)
+        self._state = 'closed'
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._short_circuited = 0
+        self._lock = threading.Lock()
+    
+    def allow_request(self) -> bool:
+        """Whether a call may go through right now"""
+        with self._lock:
+            if self._state == 'open':
+                if time.monotonic() - self._opened_at < self.open_seconds:
+                    self._short_circuited += 1
+                    return False
+                self._state = 'half_open'
+            
+            if self._state == 'half_open':
+                if self._trial_in_flight:
+                    self._short_circuited += 1
+                    return False
+                self._trial_in_flight = True
+            return True
+    
+    def record_success(self):
+        with self._lock:
+            self._outcomes.append(True)
+            if self._state == 'half_open':
+                print("✓ Circuit breaker closed")
+                self._state = 'closed'
+                self._trial_in_flight = False
+                self._outcomes.clear()
+    
+    def record_cancelled(self):
+        """A call that was let through was cancelled before it had an outcome
+        
+        Nothing is recorded, but a half-open trial slot is freed so the next
+        call can become the trial instead of the breaker staying half-open.
+        """
+        with self._lock:
+            if self._state == 'half_open':
+                self._trial_in_flight = False
+    
+    def record_failure(self):
+        with self._lock:
+            self._outcomes.append(False)
+            if self._state == 'half_open':
+                self._open()
+                return
+            
+            failures = self._outcomes.count(False)
+            if len(self._outcomes) >= self.min_calls and \
+                    failures / len(self._outcomes) >= self.failure_threshold:
+                self._open()
+    
+    def _open(self):
+        print(f"⚡ Circuit breaker opened for {self.open_seconds:.0f}s")
+        self._state = 'open'
+        self._opened_at = time.monotonic()
+        self._trial_in_flight = False
+    
+    def stats(self) -> Dict:
+        with self._lock:
+            failures = self._outcomes.count(False)
+            remaining = 0.0
+            if self._state == 'open':
+                remaining = max(0.0, self.open_seconds - (time.monotonic() - self._opened_at))
+            return {
+                'state': self._state,
+                'recent_calls': len(self._outcomes),
+                'recent_failures': failures,
+                'failure_rate': round(failures / len(self._outcomes), 3) if self._outcomes else 0,
+                'open_remaining_seconds': round(remaining, 1),
+                'short_circuited': self._short_circuited
+            }
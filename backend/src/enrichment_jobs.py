@@ -0,0 +1,162 @@
+"""Registry of background Gemini enrichment jobs"""
+import asyncio
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional
+
+class EnrichmentJobStore:
+    """SQLite-backed state of deferred Gemini analyses
+    
+    A job is created when an analysis returns its ML result before Gemini has
+    run. The job id is the handle clients use to fetch the Gemini section
+    once it is done; the finished result is kept here so it survives even
+    when the analysis could not be saved to MongoDB.
+    
+    Several worker processes may share the database. Each job records the
+    process that owns it (``owner``: host, pid and a per-store boot id), and
+    the owner refreshes ``heartbeat_at`` on its unfinished jobs every
+    ``heartbeat_seconds``. Only jobs whose heartbeat is older than
+    ``stale_seconds`` (their worker died) are failed, and finished jobs are
+    deleted ``ttl_seconds`` after they finished.
+    """
+    
+    def __init__(self, db_path: str = "../data/enrichment_jobs.db", heartbeat_seconds: Optional[float] = None,
+                 stale_seconds: Optional[float] = None, ttl_seconds: Optional[float] = None):
+        self.db_path = Path(db_path)
+        self.heartbeat_seconds = heartbeat_seconds if heartbeat_seconds is not None \
+            else float(os.getenv('ENRICHMENT_HEARTBEAT_SECONDS', '15'))
+        self.stale_seconds = stale_seconds if stale_seconds is not None \
+            else float(os.getenv('ENRICHMENT_STALE_SECONDS', '60'))
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None \
+            else float(os.getenv('ENRICHMENT_JOB_TTL_SECONDS', '86400'))
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._lock = threading.Lock()
+        self._sweeper = None
+        
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        with self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    session_id TEXT,
+                    user_id TEXT,
+                    repository TEXT,
+                    record_id INTEGER,
+                    analysis_id TEXT,
+                    result TEXT,
+                    error TEXT,
+                    created_at TEXT NOT NULL,
+                    finished_at TEXT,
+                    owner TEXT,
+                    heartbeat_at REAL
+                )
+            """)
+            columns = {row['name'] for row in self.conn.execute("PRAGMA table_info(jobs)")}
+            for column, kind in (('owner', 'TEXT'), ('heartbeat_at', 'REAL')):
+                if column not in columns:
+                    self.conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+        self.sweep()
+    
+    def create(self, session_id: Optional[str] = None, user_id: Optional[str] = None,
+               repository: Optional[str] = None) -> str:
+        """Register a pending job and return its id"""
+        job_id = uuid.uuid4().hex
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO jobs (id, status, session_id, user_id, repository, created_at, owner, heartbeat_at) "
+                "VALUES (?, 'pending', ?, ?, ?, ?, ?, ?)",
+                (job_id, session_id, user_id, repository, datetime.now().isoformat(), self.owner, time.time())
+            )
+        return job_id
+    
+    def attach(self, job_id: str, record_id: Optional[int] = None, analysis_id: Optional[str] = None):
+        """Link the job to the saved learning record and MongoDB analysis"""
+        with self._lock, self.conn:
+            self.conn.execute(
+                "UPDATE jobs SET record_id = ?, analysis_id = ? WHERE id = ?",
+                (record_id, analysis_id, job_id)
+            )
+    
+    def _set_status(self, job_id: str, status: str, result: Optional[Dict] = None,
+                    error: Optional[str] = None):
+        finished_at = datetime.now().isoformat() if status in ('complete', 'failed') else None
+        # A job already failed as stale stays failed; clients may have seen that
+        with self._lock, self.conn:
+            self.conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, heartbeat_at = ? "
+                "WHERE id = ? AND status IN ('pending', 'running')",
+                (status, json.dumps(result, default=str) if result is not None else None,
+                 error, finished_at, time.time(), job_id)
+            )
+    
+    def mark_running(self, job_id: str):
+        self._set_status(job_id, 'running')
+    
+    def complete(self, job_id: str, result: Dict):
+        self._set_status(job_id, 'complete', result=result)
+    
+    def fail(self, job_id: str, error: str, result: Optional[Dict] = None):
+        self._set_status(job_id, 'failed', result=result, error=error)
+    
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self.conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+    
+    def sweep(self) -> int:
+        """Heartbeat this process's jobs, fail orphaned ones and prune old finished ones
+        
+        Returns how many orphaned jobs were failed.
+        """
+        now = time.time()
+        with self._lock, self.conn:
+            self.conn.execute(
+                "UPDATE jobs SET heartbeat_at = ? WHERE owner = ? AND status IN ('pending', 'running')",
+                (now, self.owner)
+            )
+            # Rows from before owners were recorded have no heartbeat and no live owner
+            orphaned = self.conn.execute(
+                "UPDATE jobs SET status = 'failed', error = 'Interrupted: worker stopped', finished_at = ? "
+                "WHERE status IN ('pending', 'running') AND (heartbeat_at IS NULL OR heartbeat_at < ?)",
+                (datetime.now().isoformat(), now - self.stale_seconds)
+            ).rowcount
+            self.conn.execute(
+                "DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?",
+                (datetime.fromtimestamp(now - self.ttl_seconds).isoformat(),)
+            )
+        return orphaned
+    
+    async def _sweep_periodically(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_seconds)
+            try:
+                orphaned = await asyncio.to_thread(self.sweep)
+                if orphaned:
+                    print(f"🧹 Failed {orphaned} enrichment job(s) whose worker stopped")
+            except Exception as e:
+                print(f"⚠️ Enrichment job sweep failed: {e}")
+    
+    def start_sweeper(self):
+        """Start heartbeats and cleanup on the running event loop"""
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = asyncio.get_running_loop().create_task(self._sweep_periodically())
+    
+    def stop_sweeper(self):
+        if self._sweeper:
+            self._sweeper.cancel()
+            self._sweeper = None
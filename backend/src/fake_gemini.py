@@ -0,0 +1,226 @@
+"""
+Local fake of the Gemini generative REST endpoint for offline, reproducible tests
+
+Run with ``python -m src.fake_gemini --port 8090`` and point the backend at it
+with ``GEMINI_BASE_URL=http://127.0.0.1:8090``. Latency, error injection and
+streaming behaviour are set from FAKE_GEMINI_* environment variables or at
+runtime through ``POST /_config``.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import re
+import threading
+from typing import Dict
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+DEFAULT_CONFIG = {
+    'latency_distribution': 'fixed',  # fixed | uniform | lognormal
+    'latency_seconds': 0.2,  # Fixed value, uniform midpoint or lognormal median
+    'latency_spread': 0.5,  # Uniform half-width (fraction of latency) or lognormal sigma
+    'rate_429': 0.0,
+    'rate_504': 0.0,
+    'rate_malformed': 0.0,
+    'stream_chunk_chars': 80,
+    'stream_chunk_delay_seconds': 0.02,
+    'seed': None
+}
+
+class FakeGemini:
+    """Configurable fake answering generateContent / streamGenerateContent"""
+    
+    def __init__(self, **overrides):
+        self.config = dict(DEFAULT_CONFIG)
+        for name, default in DEFAULT_CONFIG.items():
+            value = os.getenv(f'FAKE_GEMINI_{name.upper()}')
+            if value is not None:
+                self.config[name] = value if isinstance(default, str) else float(value)
+        self.configure(**overrides)
+        self.stats = {}
+        self._lock = threading.Lock()
+    
+    def configure(self, **settings):
+        unknown = set(settings) - set(DEFAULT_CONFIG)
+        if unknown:
+            raise ValueError(f"Unknown settings: {', '.join(sorted(unknown))}")
+        self.config.update(settings)
+        self.random = random.Random(self.config['seed'])
+    
+    def reset_stats(self):
+        with self._lock:
+            self.stats = {}
+    
+    def _count(self, outcome: str):
+        with self._lock:
+            self.stats[outcome] = self.stats.get(outcome, 0) + 1
+    
+    def sample_latency(self) -> float:
+        base = float(self.config['latency_seconds'])
+        spread = float(self.config['latency_spread'])
+        distribution = self.config['latency_distribution']
+        if distribution == 'uniform':
+            return max(0.0, self.random.uniform(base * (1 - spread), base * (1 + spread)))
+        if distribution == 'lognormal':
+            return self.random.lognormvariate(math.log(base), spread) if base > 0 else 0.0
+        return base
+    
+    def sample_outcome(self) -> str:
+        roll = self.random.random()
+        for outcome in ('429', '504', 'malformed'):
+            rate = float(self.config[f'rate_{outcome}'])
+            if roll < rate:
+                return outcome
+            roll -= rate
+        return 'ok'
+    
+    def answer_text(self, prompt: str, malformed: bool = False) -> str:
+        """Deterministic JSON answer shaped like the prompt expects"""
+        numbered = re.findall(r'### File (\d+): (.+)', prompt)
+        if numbered:
+            answer = {'files': [
+                {'file_number': int(number), **self._file_analysis(name)} for number, name in numbered
+            ]}
+        elif 'bug prediction results' in prompt:
+            repository = re.search(r'Repository: (.+)', prompt)
+            answer = {
+                'overall_risk': 50,
+                'files_analyzed': 5,
+                'summary': f"Fake analysis of {repository.group(1) if repository else 'repository'}. " * 5,
+                'critical_concerns': [f"Fake concern {i + 1}" for i in range(5)],
+                'recommendations': [f"Fake recommendation {i + 1}" for i in range(8)],
+                'files': [self._file_analysis('example.py')]
+            }
+        else:
+            filename = re.search(r"code file '([^']*)'", prompt)
+            answer = self._file_analysis(filename.group(1) if filename else 'unknown')
+        
+        text = "```json\n" + json.dumps(answer, indent=2) + "\n```"
+        if malformed:
+            # Broken JSON that still looks like an answer
+            return "Here is my analysis:\n" + text[:len(text) // 2].replace('"', '', 3)
+        return text
+    
+    def _file_analysis(self, filename: str) -> Dict:
+        score = sum(map(ord, filename)) % 100  # Stable per file name
+        return {
+            'filename': filename,
+            'risk_score': score,
+            'vulnerabilities': [f"Fake vulnerability in {filename}"] if score > 50 else [],
+            'bugs': [f"Fake bug in {filename}"],
+            'code_smells': [],
+            'suggestions': [f"Fake suggestion for {filename}"],
+            'explanation': f"Fake explanation for {filename}."
+        }
+
+def _prompt_of(body: Dict) -> str:
+    return "".join(
+        part.get('text', '')
+        for content in body.get('contents', [])
+        for part in content.get('parts', [])
+    )
+
+def _response_chunk(text: str, prompt: str, final: bool = True) -> Dict:
+    chunk = {
+        'candidates': [{
+            'content': {'parts': [{'text': text}], 'role': 'model'},
+            'index': 0
+        }]
+    }
+    if final:
+        chunk['candidates'][0]['finishReason'] = 1  # STOP
+        prompt_tokens = math.ceil(len(prompt) / 4)
+        answer_tokens = math.ceil(len(text) / 4)
+        chunk['usageMetadata'] = {
+            'promptTokenCount': prompt_tokens,
+            'candidatesTokenCount': answer_tokens,
+            'totalTokenCount': prompt_tokens + answer_tokens
+        }
+    return chunk
+
+def _error_response(outcome: str) -> JSONResponse:
+    if outcome == '429':
+        return JSONResponse(status_code=429, content={'error': {
+            'code': 429, 'status': 'RESOURCE_EXHAUSTED',
+            'message': 'Resource has been exhausted (e.g. check quota).'
+        }})
+    return JSONResponse(status_code=504, content={'error': {
+        'code': 504, 'status': 'DEADLINE_EXCEEDED', 'message': 'Deadline Exceeded'
+    }})
+
+def create_app(fake: FakeGemini = None) -> FastAPI:
+    """Build the fake server app around a FakeGemini instance"""
+    fake = fake or FakeGemini()
+    app = FastAPI(title="Fake Gemini")
+    app.state.fake = fake
+    
+    @app.post("/v1beta/models/{model}:generateContent")
+    async def generate_content(model: str, request: Request):
+        prompt = _prompt_of(await request.json())
+        outcome = fake.sample_outcome()
+        await asyncio.sleep(fake.sample_latency())
+        fake._count(outcome)
+        if outcome in ('429', '504'):
+            return _error_response(outcome)
+        return _response_chunk(fake.answer_text(prompt, malformed=outcome == 'malformed'), prompt)
+    
+    @app.post("/v1beta/models/{model}:streamGenerateContent")
+    async def stream_generate_content(model: str, request: Request):
+        prompt = _prompt_of(await request.json())
+        outcome = fake.sample_outcome()
+        await asyncio.sleep(fake.sample_latency())  # Time to first token
+        fake._count(f"stream_{outcome}")
+        if outcome in ('429', '504'):
+            return _error_response(outcome)
+        
+        text = fake.answer_text(prompt, malformed=outcome == 'malformed')
+        size = max(1, int(fake.config['stream_chunk_chars']))
+        pieces = [text[i:i + size] for i in range(0, len(text), size)]
+        
+        async def chunks():
+            # The REST transport reads the stream as one JSON array
+            yield "["
+            for i, piece in enumerate(pieces):
+                if i:
+                    await asyncio.sleep(float(fake.config['stream_chunk_delay_seconds']))
+                    yield ","
+                yield json.dumps(_response_chunk(piece, prompt, final=i == len(pieces) - 1))
+            yield "]"
+        
+        return StreamingResponse(chunks(), media_type="application/json")
+    
+    @app.get("/_config")
+    def get_config():
+        return fake.config
+    
+    @app.post("/_config")
+    async def set_config(request: Request):
+        try:
+            fake.configure(**await request.json())
+        except ValueError as e:
+            return JSONResponse(status_code=400, content={'detail': str(e)})
+        return fake.config
+    
+    @app.get("/_stats")
+    def get_stats():
+        return fake.stats
+    
+    @app.post("/_reset")
+    def reset_stats():
+        fake.reset_stats()
+        return {'status': 'reset'}
+    
+    return app
+
+if __name__ == "__main__":
+    import uvicorn
+    
+    parser = argparse.ArgumentParser(description="Run the fake Gemini server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    args = parser.parse_args()
+    uvicorn.run(create_app(), host=args.host, port=args.port)
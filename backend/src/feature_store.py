@@ -0,0 +1,173 @@
+"""Feature store for feedback-labelled training rows"""
+import sqlite3
+import threading
+import numpy as np
+from pathlib import Path
+from typing import Dict, List, Optional
+
+FEATURE_COLUMNS = ['bug_keyword_count', 'lines_changed', 'commit_frequency',
+                   'critical_issues', 'high_issues']
+
+class FeatureStore:
+    """Per-file features captured at analysis time, labelled by user feedback
+    
+    Features are written once per analysed file. When feedback arrives the
+    matching feature row is copied into ``labelled_rows`` with its label, and
+    ``load_matrix`` folds new labelled rows into a NumPy snapshot on disk so
+    retraining starts from a ready feature matrix.
+    """
+    
+    def __init__(self, db_path: str = "../data/learning_history.db",
+                 matrix_path: str = "../data/training_matrix.npz"):
+        self.db_path = Path(db_path)
+        self.matrix_path = Path(matrix_path)
+        self._lock = threading.RLock()
+        
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self._create_schema()
+    
+    def _create_schema(self):
+        """Create tables if they do not exist yet"""
+        columns = ", ".join(f"{c} REAL NOT NULL" for c in FEATURE_COLUMNS)
+        with self.conn:
+            self.conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS file_features (
+                    record_id INTEGER NOT NULL,
+                    file TEXT NOT NULL,
+                    {columns},
+                    predicted_risk REAL,
+                    PRIMARY KEY (record_id, file)
+                )
+            """)
+            self.conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS labelled_rows (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    record_id INTEGER NOT NULL,
+                    file TEXT NOT NULL,
+                    {columns},
+                    predicted_risk REAL,
+                    is_buggy INTEGER NOT NULL
+                )
+            """)
+    
+    def capture(self, record_id: int, file_features: Dict[str, Dict], modules: List[Dict]):
+        """Store features for every module of an analysis"""
+        rows = []
+        for module in modules:
+            features = file_features.get(module['file'], {})
+            rows.append((
+                record_id,
+                module['file'],
+                features.get('bug_keyword_count', 0),
+                features.get('lines_changed', 0),
+                features.get('commit_frequency', 0),
+                module.get('critical_issues', 0),
+                module.get('high_issues', 0),
+                module.get('risk_score')
+            ))
+        
+        placeholders = ", ".join("?" * (len(FEATURE_COLUMNS) + 3))
+        with self._lock, self.conn:
+            self.conn.executemany(
+                f"INSERT OR REPLACE INTO file_features VALUES ({placeholders})", rows
+            )
+    
+    def get_features(self, record_id: int, file: str) -> Optional[Dict]:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT * FROM file_features WHERE record_id = ? AND file = ?",
+                (record_id, file)
+            ).fetchone()
+        return dict(row) if row else None
+    
+    def label(self, record_id: int, file: str, is_buggy: bool) -> bool:
+        """Materialize a labelled training row for a file
+        
+        Returns False for files without captured features (analyses from
+        before the feature store): their module data has no commit
+        features, and guessed values would mix different meanings into the
+        same training columns.
+        """
+        features = self.get_features(record_id, file)
+        if features is None:
+            return False
+        
+        columns = FEATURE_COLUMNS + ['predicted_risk']
+        with self._lock, self.conn:
+            self.conn.execute(
+                f"INSERT INTO labelled_rows (record_id, file, {', '.join(columns)}, is_buggy) "
+                f"VALUES (?, ?, {', '.join('?' * len(columns))}, ?)",
+                (record_id, file, *[features[c] for c in columns], int(is_buggy))
+            )
+        return True
+    
+    def count_labelled(self) -> int:
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM labelled_rows").fetchone()[0]
+    
+    def _load_snapshot(self) -> Dict[str, np.ndarray]:
+        if self.matrix_path.exists():
+            with np.load(self.matrix_path) as snapshot:
+                return {key: snapshot[key] for key in snapshot.files}
+        return {
+            'X': np.empty((0, len(FEATURE_COLUMNS))),
+            'y': np.empty(0, dtype=np.int64),
+            'predicted_risk': np.empty(0),
+            'record_ids': np.empty(0, dtype=np.int64),
+            'files': np.empty(0, dtype=str),
+            'seq': np.array(0)
+        }
+    
+    def load_matrix(self) -> Dict[str, np.ndarray]:
+        """Load the labelled feature matrix, folding in rows added since the last snapshot
+        
+        Returns a dict with ``X`` (features in FEATURE_COLUMNS order), ``y``,
+        ``predicted_risk``, ``record_ids`` and ``files``. When the same file
+        of the same analysis was labelled more than once the latest label wins.
+        """
+        with self._lock:
+            matrix = self._load_snapshot()
+            rows = self.conn.execute(
+                f"SELECT seq, record_id, file, {', '.join(FEATURE_COLUMNS)}, predicted_risk, is_buggy "
+                "FROM labelled_rows WHERE seq > ? ORDER BY seq",
+                (int(matrix['seq']),)
+            ).fetchall()
+            
+            if not rows:
+                return matrix
+            
+            new_X = np.array([[row[c] for c in FEATURE_COLUMNS] for row in rows], dtype=float)
+            matrix = {
+                'X': np.vstack([matrix['X'], new_X]),
+                'y': np.concatenate([matrix['y'], [row['is_buggy'] for row in rows]]).astype(np.int64),
+                'predicted_risk': np.concatenate([
+                    matrix['predicted_risk'],
+                    [np.nan if row['predicted_risk'] is None else row['predicted_risk'] for row in rows]
+                ]),
+                'record_ids': np.concatenate([matrix['record_ids'], [row['record_id'] for row in rows]]).astype(np.int64),
+                'files': np.concatenate([matrix['files'], [row['file'] for row in rows]]).astype(str),
+                'seq': np.array(rows[-1]['seq'])
+            }
+            matrix = self._latest_per_file(matrix)
+            
+            self.matrix_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.matrix_path.with_suffix('.tmp.npz')
+            np.savez(tmp_path, **matrix)
+            tmp_path.replace(self.matrix_path)
+            return matrix
+    
+    @staticmethod
+    def _latest_per_file(matrix: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        """Drop earlier labels for the same (record_id, file), keeping row order"""
+        keys = np.char.add(np.char.add(matrix['record_ids'].astype(str), ':'), matrix['files'])
+        _, last_from_end = np.unique(keys[::-1], return_index=True)
+        keep = np.sort(len(keys) - 1 - last_from_end)
+        if len(keep) == len(keys):
+            return matrix
+        return {
+            key: (value[keep] if value.ndim else value)
+            for key, value in matrix.items()
+        }
@@ -5,14 +5,20 @@ from typing import Optional
 
 router = APIRouter()
 
-# Learner will be set by main app
+# Learner and retrain worker will be set by main app
 learner = None
+retrain_worker = None
 
 def set_learner(learner_instance):
     """Set the shared learner instance"""
     global learner
     learner = learner_instance
 
+def set_retrain_worker(worker_instance):
+    """Set the shared background retraining worker"""
+    global retrain_worker
+    retrain_worker = worker_instance
+
 class FeedbackRequest(BaseModel):
     record_id: int
     file_name: str
@@ -40,8 +46,11 @@ def submit_feedback(feedback: FeedbackRequest):
         if not success:
             raise HTTPException(status_code=404, detail="Record not found")
         
-        # Check if auto-retrain should trigger
-        learner.auto_retrain_if_ready(threshold=20)
+        # Let the background worker decide when to retrain
+        if retrain_worker:
+            retrain_worker.notify_feedback()
+        else:
+            learner.auto_retrain_if_ready(threshold=20)
         
         return {
             "message": "Feedback recorded successfully",
@@ -76,6 +85,14 @@ def retrain_model(request: RetrainRequest):
                 "recommendation": "Collect at least 10 feedback items"
             }
         
+        if retrain_worker:
+            retrain_worker.request_retrain()
+            return {
+                "message": "Retraining scheduled",
+                "stats": stats,
+                "status": retrain_worker.get_status()
+            }
+        
         success = learner.retrain_model()
         
         if success:
@@ -91,24 +108,36 @@ def retrain_model(request: RetrainRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/retrain/status")
+def get_retrain_status():
+    """Get the state of the background retraining worker"""
+    if not retrain_worker:
+        raise HTTPException(status_code=503, detail="Background retraining not enabled")
+    return retrain_worker.get_status()
+
 @router.get("/feedback-history")
 def get_feedback_history(limit: int = 50):
     """Get recent feedback history"""
     if not learner:
         raise HTTPException(status_code=500, detail="Learner not initialized")
     
-    history = learner.learning_history[-limit:]
+    # Summaries of the last `limit` analyses, oldest first
+    history = learner.store.list_records(limit=limit)[::-1]
+    
+    # Only load feedback for records that have some
+    record_ids = [r['id'] for r in history if r['feedback_count']]
+    feedback = learner.store.get_feedback_many(record_ids)
     
-    # Filter to only records with feedback
     with_feedback = [
         {
+            'id': r['id'],
             'timestamp': r['timestamp'],
             'repository': r['repository'],
-            'feedback_count': len(r.get('feedback', [])),
-            'feedback': r.get('feedback', [])
+            'feedback_count': r['feedback_count'],
+            'feedback': feedback[r['id']]
         }
         for r in history
-        if r.get('feedback')
+        if r['id'] in feedback
     ]
     
     return {
@@ -118,21 +147,36 @@ def get_feedback_history(limit: int = 50):
     }
 
 @router.get("/debug/records")
-def debug_records():
-    """Debug endpoint to see all recorded analyses"""
+def debug_records(limit: int = 100, offset: int = 0, repository: Optional[str] = None):
+    """Debug endpoint to page through recorded analyses"""
     if not learner:
         raise HTTPException(status_code=500, detail="Learner not initialized")
     
+    records = learner.store.list_records(
+        repository=repository, limit=limit, offset=offset, newest_first=False
+    )
+    
     return {
-        "total_records": len(learner.learning_history),
+        "total_records": learner.store.count_analyses(),
         "records": [
             {
-                "id": idx,
-                "repository": r.get('repository'),
-                "timestamp": r.get('timestamp'),
-                "files_analyzed": r.get('files_analyzed'),
-                "has_feedback": bool(r.get('feedback'))
+                "id": r['id'],
+                "repository": r['repository'],
+                "timestamp": r['timestamp'],
+                "files_analyzed": r['files_analyzed'],
+                "has_feedback": r['feedback_count'] > 0
             }
-            for idx, r in enumerate(learner.learning_history)
+            for r in records
         ]
     }
+
+@router.get("/records/{record_id}")
+def get_record(record_id: int, include_modules: bool = True):
+    """Get one recorded analysis, optionally with its module payload"""
+    if not learner:
+        raise HTTPException(status_code=500, detail="Learner not initialized")
+    
+    record = learner.store.get_record(record_id, include_modules=include_modules)
+    if not record:
+        raise HTTPException(status_code=404, detail="Record not found")
+    return record
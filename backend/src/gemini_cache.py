@@ -0,0 +1,97 @@
+"""Persistent cache of parsed Gemini responses keyed by prompt hash"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+class GeminiResponseCache:
+    """SQLite-backed LRU cache with a TTL
+    
+    Entries are keyed by (model name, generation config, sha256(prompt)) and
+    hold the parsed JSON result, so a repeated prompt skips the model call.
+    """
+    
+    def __init__(self, db_path: str = "../data/gemini_cache.db",
+                 ttl_seconds: float = 86400, max_entries: int = 1000):
+        self.db_path = Path(db_path)
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    result TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_responses_access ON responses(last_access)"
+            )
+    
+    @staticmethod
+    def make_key(model_name: str, generation_config: Dict, prompt: str) -> str:
+        prompt_hash = hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+        config = json.dumps(generation_config, sort_keys=True)
+        return hashlib.sha256(f"{model_name}\n{config}\n{prompt_hash}".encode('utf-8')).hexdigest()
+    
+    def get(self, key: str) -> Optional[Dict]:
+        """Return the cached result, or None if missing or expired"""
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT result, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl_seconds:
+                self.misses += 1
+                if row is not None:
+                    with self.conn:
+                        self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            
+            with self.conn:
+                self.conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        return json.loads(row[0])
+    
+    def put(self, key: str, result: Dict):
+        """Store a result, evicting the least recently used entries beyond the limit"""
+        now = time.time()
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (key, result, created_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(result), now, now)
+            )
+            self.conn.execute("""
+                DELETE FROM responses WHERE key IN (
+                    SELECT key FROM responses ORDER BY last_access DESC LIMIT -1 OFFSET ?
+                )
+            """, (self.max_entries,))
+    
+    def clear(self):
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM responses")
+    
+    def stats(self) -> Dict:
+        with self._lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0,
+                'entries': entries,
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds
+            }
@@ -0,0 +1,112 @@
+"""Thread-safe pool of Gemini API keys with health tracking and cooldowns"""
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+class GeminiKey:
+    """One API key, its dedicated model client and its health counters"""
+    
+    def __init__(self, index: int, api_key: str, model):
+        self.index = index
+        self.api_key = api_key
+        self.model = model
+        self.cooldown_until = 0.0
+        self.consecutive_quota_errors = 0
+        self.consecutive_timeouts = 0
+        self.in_flight = 0
+        self.successes = 0
+        self.quota_errors = 0
+        self.timeouts = 0
+        self.errors = 0
+
+class GeminiKeyPool:
+    """Lease keys per request, round-robin across healthy keys
+    
+    A key that hits its quota is put into a cooldown that doubles with each
+    consecutive quota error (capped at ``max_cooldown_seconds``); repeated
+    timeouts put a key into a short cooldown. Keys come back automatically
+    once their cooldown expires instead of staying exhausted until restart.
+    """
+    
+    def __init__(self, api_keys: List[str], model_factory: Callable[[str], object],
+                 quota_cooldown_seconds: float = 60, timeout_cooldown_seconds: float = 15,
+                 timeouts_before_cooldown: int = 2, max_cooldown_seconds: float = 3600):
+        self.keys = [GeminiKey(i, key, model_factory(key)) for i, key in enumerate(api_keys)]
+        self.quota_cooldown_seconds = quota_cooldown_seconds
+        self.timeout_cooldown_seconds = timeout_cooldown_seconds
+        self.timeouts_before_cooldown = timeouts_before_cooldown
+        self.max_cooldown_seconds = max_cooldown_seconds
+        self._next = 0
+        self._lock = threading.Lock()
+    
+    def __len__(self):
+        return len(self.keys)
+    
+    def acquire(self, exclude: Iterable[int] = ()) -> Optional[GeminiKey]:
+        """Lease the next healthy key, or None if every key is cooling down or excluded"""
+        exclude = set(exclude)
+        now = time.monotonic()
+        with self._lock:
+            for offset in range(len(self.keys)):
+                key = self.keys[(self._next + offset) % len(self.keys)]
+                if key.index in exclude or key.cooldown_until > now:
+                    continue
+                self._next = key.index + 1
+                key.in_flight += 1
+                return key
+        return None
+    
+    def release(self, key: GeminiKey, outcome: str):
+        """Return a leased key with the outcome: success, quota, timeout, error or cancelled
+        
+        ``cancelled`` (the caller gave up mid-call) only ends the lease and
+        leaves the key's health alone.
+        """
+        now = time.monotonic()
+        with self._lock:
+            key.in_flight -= 1
+            if outcome == 'success':
+                key.successes += 1
+                key.consecutive_quota_errors = 0
+                key.consecutive_timeouts = 0
+            elif outcome == 'quota':
+                key.quota_errors += 1
+                key.consecutive_quota_errors += 1
+                cooldown = min(
+                    self.quota_cooldown_seconds * 2 ** (key.consecutive_quota_errors - 1),
+                    self.max_cooldown_seconds
+                )
+                key.cooldown_until = now + cooldown
+                print(f"⏸️ API key #{key.index + 1} cooling down for {cooldown:.0f}s (quota)")
+            elif outcome == 'timeout':
+                key.timeouts += 1
+                key.consecutive_timeouts += 1
+                if key.consecutive_timeouts >= self.timeouts_before_cooldown:
+                    key.cooldown_until = now + self.timeout_cooldown_seconds
+                    key.consecutive_timeouts = 0
+                    print(f"⏸️ API key #{key.index + 1} cooling down for {self.timeout_cooldown_seconds:.0f}s (timeouts)")
+            elif outcome != 'cancelled':
+                key.errors += 1
+    
+    def seconds_until_available(self) -> float:
+        """Time until the earliest cooling-down key is usable again"""
+        now = time.monotonic()
+        with self._lock:
+            return max(0.0, min(key.cooldown_until for key in self.keys) - now)
+    
+    def stats(self) -> List[Dict]:
+        now = time.monotonic()
+        with self._lock:
+            return [
+                {
+                    'key': f"#{key.index + 1}",
+                    'available': key.cooldown_until <= now,
+                    'cooldown_remaining_seconds': round(max(0.0, key.cooldown_until - now), 1),
+                    'in_flight': key.in_flight,
+                    'successes': key.successes,
+                    'quota_errors': key.quota_errors,
+                    'timeouts': key.timeouts,
+                    'errors': key.errors
+                }
+                for key in self.keys
+            ]
@@ -0,0 +1,332 @@
+"""Parsing helpers for Gemini JSON answers"""
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple, Type, Union
+from pydantic import BaseModel, ConfigDict, ValidationError, field_validator
+
+class PartialResultParser:
+    """Pick finished fields out of a streamed JSON answer as chunks arrive
+    
+    Text is scanned once, character by character, tracking string/escape
+    state and bracket nesting. Whenever a string value completes at one of
+    the watched positions it is reported: top-level string fields (e.g.
+    ``summary``) and items of top-level string arrays (e.g.
+    ``recommendations``). Anything before the first ``{`` (such as a code
+    fence) is skipped.
+    """
+    
+    def __init__(self, string_fields=('summary',),
+                 list_fields=('recommendations', 'critical_concerns')):
+        self.string_fields = set(string_fields)
+        self.list_fields = set(list_fields)
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._buffer = []
+        self._expect_key = False
+        self._top_key = None
+        self._list_index = 0
+        self._started = False
+    
+    def feed(self, text: str) -> List[Tuple[str, int, str]]:
+        """Consume a chunk; return (field, index, value) for values completed in it
+        
+        ``index`` is the position within a list field, or 0 for string fields.
+        """
+        completed = []
+        for char in text:
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                    self._buffer.append(char)
+                elif char == '\\':
+                    self._escape = True
+                    self._buffer.append(char)
+                elif char == '"':
+                    self._in_string = False
+                    self._string_done(completed)
+                else:
+                    self._buffer.append(char)
+                continue
+            
+            if not self._started:
+                if char == '{':
+                    self._started = True
+                    self._stack.append('{')
+                    self._expect_key = True
+                continue
+            if not self._stack:
+                continue  # Trailing prose after the object
+            
+            if char == '"':
+                self._in_string = True
+                self._buffer = []
+            elif char in '{[':
+                if char == '[' and self._stack == ['{']:
+                    self._list_index = 0
+                self._stack.append(char)
+                self._expect_key = char == '{'
+            elif char in '}]':
+                self._stack.pop()
+            elif char == ',':
+                self._expect_key = self._stack[-1] == '{'
+                if self._stack == ['{', '[']:
+                    self._list_index += 1
+            elif char == ':':
+                self._expect_key = False
+        return completed
+    
+    def _string_done(self, completed: list):
+        raw = ''.join(self._buffer)
+        if self._expect_key and self._stack and self._stack[-1] == '{':
+            if len(self._stack) == 1:
+                self._top_key = raw
+            return
+        
+        try:
+            value = json.loads(f'"{raw}"')
+        except ValueError:
+            value = raw
+        if self._stack == ['{'] and self._top_key in self.string_fields:
+            completed.append((self._top_key, 0, value))
+        elif self._stack == ['{', '['] and self._top_key in self.list_fields:
+            completed.append((self._top_key, self._list_index, value))
+
+_STRING_SPECIAL = re.compile(r'["\\\n\r\t]')
+_CONTROL_ESCAPES = {'\n': '\\n', '\r': '\\r', '\t': '\\t'}
+
+class JsonObjectScanner:
+    """Single-pass, incremental extraction of the first JSON object in free text
+    
+    Text can be fed in chunks. Prose and code fences around the object are
+    skipped, brackets are balanced while tracking string state, trailing
+    commas are dropped and raw newlines/tabs inside strings are escaped. If
+    the text ends before the object closes (e.g. the answer hit
+    ``max_output_tokens``), ``close`` returns the object cut back to its last
+    complete value.
+    """
+    
+    def __init__(self):
+        self.result = None
+        self._reset()
+    
+    def _reset(self):
+        self._out = []
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._key = False
+        self._comma = False
+        self._safe = None
+    
+    def _mark_safe(self):
+        self._safe = (len(self._out), list(self._stack))
+    
+    def feed(self, text: str) -> Optional[Dict]:
+        """Consume a chunk; returns the object once it is complete"""
+        if self.result is not None:
+            return self.result
+        
+        out = self._out
+        i, n = 0, len(text)
+        while i < n:
+            if self._in_string:
+                if self._escape:
+                    out.append(text[i])
+                    self._escape = False
+                    i += 1
+                    continue
+                match = _STRING_SPECIAL.search(text, i)
+                if match is None:
+                    out.append(text[i:])
+                    break
+                j = match.start()
+                if j > i:
+                    out.append(text[i:j])
+                char = text[j]
+                i = j + 1
+                if char == '"':
+                    out.append(char)
+                    self._in_string = False
+                    if not self._key:
+                        self._mark_safe()
+                elif char == '\\':
+                    out.append(char)
+                    self._escape = True
+                else:
+                    out.append(_CONTROL_ESCAPES[char])
+                continue
+            
+            if not self._stack:
+                start = text.find('{', i)
+                if start < 0:
+                    break
+                out.append('{')
+                self._stack.append('{')
+                self._key = True
+                self._mark_safe()
+                i = start + 1
+                continue
+            
+            char = text[i]
+            i += 1
+            if char.isspace():
+                continue
+            if char == ',':
+                self._mark_safe()
+                self._comma = True
+                self._key = self._stack[-1] == '{'
+                continue
+            if char in '}]':
+                self._comma = False  # Drop a trailing comma
+                self._stack.pop()
+                out.append(char)
+                if self._stack:
+                    self._mark_safe()
+                    continue
+                if self._finish():
+                    return self.result
+                out = self._out
+                continue
+            
+            if self._comma:
+                out.append(',')
+                self._comma = False
+            out.append(char)
+            if char == '"':
+                self._in_string = True
+            elif char in '{[':
+                self._stack.append(char)
+                self._key = char == '{'
+                self._mark_safe()
+            elif char == ':':
+                self._key = False
+        return None
+    
+    def _finish(self) -> bool:
+        """A top-level object closed; keep it if it parses, else look for the next one"""
+        try:
+            value = json.loads(''.join(self._out))
+        except ValueError:
+            value = None
+        self._reset()
+        if isinstance(value, dict):
+            self.result = value
+            return True
+        return False
+    
+    def close(self) -> Optional[Dict]:
+        """The complete object, or the repaired prefix of a truncated one"""
+        if self.result is not None or self._safe is None:
+            return self.result
+        
+        length, stack = self._safe
+        closers = ''.join('}' if bracket == '{' else ']' for bracket in reversed(stack))
+        try:
+            value = json.loads(''.join(self._out[:length]) + closers)
+        except ValueError:
+            return None
+        return value if isinstance(value, dict) else None
+
+def extract_json(text: str) -> Optional[Dict]:
+    """Extract the first JSON object from a Gemini answer, or None"""
+    scanner = JsonObjectScanner()
+    scanner.feed(text)
+    return scanner.close()
+
+def _as_list(value):
+    """Coerce a list field: a lone string or object becomes a one-item list"""
+    if value is None:
+        return None
+    if isinstance(value, (str, dict)):
+        value = [value]
+    if not isinstance(value, list):
+        return [str(value)]
+    return [item if isinstance(item, (str, dict)) else str(item) for item in value if item is not None]
+
+def _as_score(value):
+    """Coerce scores like "85", "85%" or 85.0 into a number within 0-100"""
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, str):
+        match = re.search(r'-?\d+(?:\.\d+)?', value)
+        if not match:
+            return None
+        value = float(match.group())
+    if not isinstance(value, (int, float)):
+        return None
+    return max(0, min(100, value))
+
+def _as_count(value):
+    """Coerce counts like "150", "150 files" or 150.0 into a non-negative int (no upper bound)"""
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, str):
+        match = re.search(r'-?\d+(?:\.\d+)?', value)
+        if not match:
+            return None
+        value = match.group()
+    try:
+        count = int(float(value))
+    except (TypeError, ValueError, OverflowError):
+        return None
+    return count if count >= 0 else None
+
+ListItems = Optional[List[Union[str, Dict[str, Any]]]]
+
+class CodeAnalysis(BaseModel):
+    """Gemini's analysis of one file"""
+    model_config = ConfigDict(extra='allow')
+    
+    file_number: Optional[int] = None  # Position of the file in a batched prompt
+    filename: Optional[str] = None
+    risk_score: Optional[float] = None
+    vulnerabilities: ListItems = None
+    bugs: ListItems = None
+    code_smells: ListItems = None
+    suggestions: ListItems = None
+    explanation: Optional[str] = None
+    
+    _lists = field_validator('vulnerabilities', 'bugs', 'code_smells', 'suggestions', mode='before')(_as_list)
+    _score = field_validator('risk_score', mode='before')(_as_score)
+    _number = field_validator('file_number', mode='before')(_as_count)
+
+class BatchAnalysis(BaseModel):
+    """Gemini's answer for a batch of files"""
+    model_config = ConfigDict(extra='allow')
+    
+    files: List[CodeAnalysis] = []
+    
+    @field_validator('files', mode='before')
+    @classmethod
+    def _only_objects(cls, value):
+        return [item for item in value if isinstance(item, dict)] if isinstance(value, list) else []
+
+class MLResultsAnalysis(BatchAnalysis):
+    """Gemini's interpretation of the ML prediction results"""
+    overall_risk: Optional[float] = None
+    files_analyzed: Optional[int] = None
+    summary: Optional[str] = None
+    critical_concerns: ListItems = None
+    recommendations: ListItems = None
+    suggestions: ListItems = None
+    
+    _lists = field_validator('critical_concerns', 'recommendations', 'suggestions', mode='before')(_as_list)
+    _score = field_validator('overall_risk', mode='before')(_as_score)
+    _count = field_validator('files_analyzed', mode='before')(_as_count)
+
+def parse_result(text: str, schema: Type[BaseModel]) -> Optional[Dict]:
+    """Extract the JSON object from ``text`` and validate it against ``schema``
+    
+    Returns the validated fields as a plain dict (fields Gemini left out stay
+    absent), the raw object if it does not fit the schema, or None if no
+    JSON object could be found.
+    """
+    parsed = extract_json(text)
+    if parsed is None:
+        return None
+    try:
+        return schema.model_validate(parsed).model_dump(exclude_none=True)
+    except ValidationError as e:
+        print(f"⚠️ Gemini answer does not match {schema.__name__}: {e.error_count()} error(s)")
+        return parsed
@@ -0,0 +1,154 @@
+"""Per-call accounting of Gemini token usage, latency and cache hits"""
+import contextvars
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# Attribution of the calls made in the current task / thread
+_scope = contextvars.ContextVar('gemini_usage_scope', default={})
+
+@contextmanager
+def usage_scope(**fields):
+    """Attribute Gemini calls made inside the block to an analysis, user or operation
+    
+    Scopes nest; inner fields override outer ones. The scope follows
+    ``asyncio`` tasks and ``asyncio.to_thread``, but plain executor
+    submissions must be wrapped with ``contextvars.copy_context().run``.
+    """
+    token = _scope.set({**_scope.get(), **{k: v for k, v in fields.items() if v is not None}})
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+_TOTALS = """
+    COUNT(*) AS calls,
+    COALESCE(SUM(cache_hit), 0) AS cache_hits,
+    COALESCE(SUM(outcome = 'quota'), 0) AS quota_errors,
+    COALESCE(SUM(outcome = 'timeout'), 0) AS timeouts,
+    COALESCE(SUM(outcome = 'error'), 0) AS errors,
+    COALESCE(SUM(prompt_tokens), 0) AS prompt_tokens,
+    COALESCE(SUM(response_tokens), 0) AS response_tokens,
+    COALESCE(SUM(estimated), 0) AS estimated_calls,
+    COALESCE(SUM(CASE WHEN cache_hit = 0 THEN latency_ms END), 0) AS request_latency_ms,
+    COALESCE(SUM(cache_hit = 0), 0) AS requests
+"""
+
+class GeminiUsageTracker:
+    """SQLite-backed log of every Gemini attempt and cache hit
+    
+    Each row records the operation, the analysis / user it was made for
+    (taken from ``usage_scope``), the key used, prompt and response tokens
+    (from the API's usage metadata, or the local estimator when the client
+    does not report it), latency and outcome. Rows older than
+    ``retention_days`` are pruned at startup.
+    """
+    
+    def __init__(self, db_path: str = "../data/gemini_usage.db", retention_days: float = 30):
+        self.db_path = Path(db_path)
+        self._lock = threading.Lock()
+        
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS calls (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    created_at REAL NOT NULL,
+                    operation TEXT,
+                    analysis_id TEXT,
+                    user_id TEXT,
+                    key_index INTEGER,
+                    prompt_tokens INTEGER NOT NULL DEFAULT 0,
+                    response_tokens INTEGER NOT NULL DEFAULT 0,
+                    estimated INTEGER NOT NULL DEFAULT 0,
+                    latency_ms REAL NOT NULL DEFAULT 0,
+                    cache_hit INTEGER NOT NULL DEFAULT 0,
+                    outcome TEXT NOT NULL
+                )
+            """)
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_calls_created ON calls(created_at)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_calls_analysis ON calls(analysis_id)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_calls_user ON calls(user_id, created_at)")
+            self.conn.execute("DELETE FROM calls WHERE created_at < ?", (time.time() - retention_days * 86400,))
+    
+    def record(self, outcome: str = 'success', key_index: Optional[int] = None, prompt_tokens: int = 0,
+               response_tokens: int = 0, estimated: bool = False, latency_ms: float = 0.0,
+               cache_hit: bool = False):
+        """Log one attempt (or cache hit) under the current usage scope"""
+        scope = _scope.get()
+        try:
+            with self._lock, self.conn:
+                self.conn.execute(
+                    "INSERT INTO calls (created_at, operation, analysis_id, user_id, key_index, prompt_tokens, "
+                    "response_tokens, estimated, latency_ms, cache_hit, outcome) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (time.time(), scope.get('operation'), scope.get('analysis_id'), scope.get('user_id'),
+                     key_index, prompt_tokens, response_tokens, int(estimated), latency_ms, int(cache_hit), outcome)
+                )
+        except Exception as e:
+            print(f"⚠️ Failed to record Gemini usage: {e}")
+    
+    @staticmethod
+    def _filters(analysis_id=None, user_id=None, since=None, until=None):
+        clauses, params = [], []
+        for column, op, value in (('analysis_id', '=', analysis_id), ('user_id', '=', user_id),
+                                  ('created_at', '>=', since), ('created_at', '<', until)):
+            if value is not None:
+                clauses.append(f"{column} {op} ?")
+                params.append(value)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+    
+    @staticmethod
+    def _totals(row, group: Optional[str] = None) -> Dict:
+        totals = dict(row)
+        if group:
+            totals.pop(group)
+        requests = totals.pop('requests')
+        latency = totals.pop('request_latency_ms')
+        totals['total_tokens'] = totals['prompt_tokens'] + totals['response_tokens']
+        totals['cache_hit_rate'] = round(totals['cache_hits'] / totals['calls'], 3) if totals['calls'] else 0.0
+        totals['avg_latency_ms'] = round(latency / requests, 1) if requests else 0.0
+        return totals
+    
+    def summary(self, analysis_id: Optional[str] = None, user_id: Optional[str] = None,
+                since: Optional[float] = None, until: Optional[float] = None) -> Dict:
+        """Totals over the matching calls, overall and per operation"""
+        where, params = self._filters(analysis_id, user_id, since, until)
+        with self._lock:
+            total = self.conn.execute(f"SELECT {_TOTALS} FROM calls{where}", params).fetchone()
+            by_operation = self.conn.execute(
+                f"SELECT operation, {_TOTALS} FROM calls{where} GROUP BY operation", params
+            ).fetchall()
+        return {
+            **self._totals(total),
+            'by_operation': {row['operation'] or 'unknown': self._totals(row, 'operation') for row in by_operation}
+        }
+    
+    def by_user(self, since: Optional[float] = None, limit: int = 20) -> List[Dict]:
+        """Heaviest users by tokens, with their quota errors"""
+        where, params = self._filters(since=since)
+        with self._lock:
+            rows = self.conn.execute(
+                f"SELECT user_id, {_TOTALS} FROM calls{where} GROUP BY user_id "
+                "ORDER BY SUM(prompt_tokens + response_tokens) DESC LIMIT ?",
+                params + [limit]
+            ).fetchall()
+        return [{'user_id': row['user_id'], **self._totals(row, 'user_id')} for row in rows]
+    
+    def timeline(self, bucket_seconds: float = 3600, since: Optional[float] = None,
+                 user_id: Optional[str] = None) -> List[Dict]:
+        """Totals per time window of ``bucket_seconds``"""
+        where, params = self._filters(user_id=user_id, since=since)
+        with self._lock:
+            rows = self.conn.execute(
+                f"SELECT CAST(created_at / ? AS INTEGER) * ? AS bucket, {_TOTALS} FROM calls{where} "
+                "GROUP BY bucket ORDER BY bucket",
+                [bucket_seconds, bucket_seconds] + params
+            ).fetchall()
+        return [{'start': row['bucket'], **self._totals(row, 'bucket')} for row in rows]
@@ -1,22 +1,36 @@
 """GitHub Repository Analyzer - Fetches commits, diffs, and issues"""
 import os
 from github import Github, GithubException
-from typing import Dict, List, Optional
+from typing import Callable, Dict, List, Optional
 from dotenv import load_dotenv
 from .code_analyzer import CodeAnalyzer
 
 load_dotenv()
 
 class GitHubAnalyzer:
+    # Commits processed per ``on_commits`` call; GitHub's default page size
+    COMMIT_PAGE_SIZE = 30
+    
     def __init__(self, access_token: Optional[str] = None, 
-                 progress_tracker=None, session_id: str = None):
-        """Initialize GitHub client with access token"""
+                 progress_tracker=None, session_id: str = None, progress=None):
+        """Initialize GitHub client with access token
+        
+        ``progress`` is any object with a thread-safe ``report`` method (see
+        ProgressReporter); it takes the place of the tracker's session reporter.
+        """
         token = access_token or os.getenv('GITHUB_TOKEN')
         self.github = Github(token) if token else Github()
         self.rate_limit_checked = False
         self.code_analyzer = CodeAnalyzer()
         self.progress_tracker = progress_tracker
         self.session_id = session_id
+        # Thread-safe, rate-limited reporter, so analyze_repository can run in a worker thread
+        self.progress = progress or (progress_tracker.reporter(session_id) if progress_tracker and session_id else None)
+    
+    def report_progress(self, status: str, message: str, progress: int = None, detail: str = None):
+        """Send a progress update for the session, if one is attached; safe from any thread"""
+        if self.progress:
+            self.progress.report(status, message, progress, detail)
     
     def check_rate_limit(self):
         """Check GitHub API rate limit"""
@@ -42,8 +56,14 @@ class GitHubAnalyzer:
         
         raise ValueError("Invalid GitHub URL format. Use: https://github.com/owner/repo or owner/repo")
     
-    def analyze_repository(self, repo_url: str, max_commits: int = 100) -> Dict:
-        """Analyze a GitHub repository and extract bug prediction data"""
+    def analyze_repository(self, repo_url: str, max_commits: int = 100,
+                           on_commits: Optional[Callable[[List[Dict]], None]] = None) -> Dict:
+        """Analyze a GitHub repository and extract bug prediction data
+        
+        ``on_commits`` is called (from the thread running this method) with
+        each page of processed commits as soon as it is ready, so callers can
+        show results before every commit has been fetched.
+        """
         try:
             owner, repo_name = self.parse_repo_url(repo_url)
             print(f"Analyzing repository: {owner}/{repo_name}")
@@ -68,12 +88,7 @@ class GitHubAnalyzer:
             issues_data = []
             
             print(f"Fetching up to {max_commits} commits...")
-            if self.progress_tracker and self.session_id:
-                import asyncio
-                asyncio.create_task(self.progress_tracker.update(
-                    self.session_id, "fetching", 
-                    f"Fetching commits from {owner}/{repo_name}...", 30
-                ))
+            self.report_progress("fetching", f"Fetching commits from {owner}/{repo_name}...", 30)
             
             # Fetch commits with empty repository handling
             try:
@@ -86,13 +101,11 @@ class GitHubAnalyzer:
                     commits_list.append(commit)
                     if idx % 10 == 0:
                         print(f"  Fetched {idx} commits...")
-                        if self.progress_tracker and self.session_id:
-                            progress = 30 + int((idx / max_commits) * 30)
-                            asyncio.create_task(self.progress_tracker.update(
-                                self.session_id, "fetching",
-                                f"Fetched {idx} commits...", progress,
-                                f"Processing commit {idx}/{max_commits}"
-                            ))
+                        self.report_progress(
+                            "fetching", f"Fetched {idx} commits...",
+                            30 + int((idx / max_commits) * 30),
+                            f"Processing commit {idx}/{max_commits}"
+                        )
             except Exception as e:
                 if "empty" in str(e).lower() or "409" in str(e):
                     print(f"✗ Repository is empty")
@@ -111,10 +124,15 @@ class GitHubAnalyzer:
                 raise
             
             print(f"Found {len(commits_list)} commits")
+            reported = 0
             
             for idx, commit in enumerate(commits_list, 1):
                 if idx % 10 == 0:
                     print(f"  Processed {idx} commits...")
+                    self.report_progress(
+                        "analyzing", f"Processed {idx}/{len(commits_list)} commits...",
+                        60 + int((idx / len(commits_list)) * 10)
+                    )
                 
                 try:
                     # Get commit details
@@ -135,13 +153,10 @@ class GitHubAnalyzer:
                             # Debug: Always log analysis results
                             if analysis['total_issues'] > 0:
                                 print(f"    Found {analysis['total_issues']} issues in {file.filename}")
-                                if self.progress_tracker and self.session_id:
-                                    import asyncio
-                                    asyncio.create_task(self.progress_tracker.update(
-                                        self.session_id, "analyzing",
-                                        f"Analyzing code quality...", None,
-                                        f"Found {analysis['total_issues']} issues in {file.filename}"
-                                    ))
+                                self.report_progress(
+                                    "analyzing", "Analyzing code quality...", None,
+                                    f"Found {analysis['total_issues']} issues in {file.filename}"
+                                )
                                 code_issues.append({
                                     'file': file.filename,
                                     'issues': analysis['total_issues'],
@@ -159,7 +174,12 @@ class GitHubAnalyzer:
                     
                 except Exception as e:
                     print(f"  Warning: Skipped commit {commit.sha[:7]}: {str(e)}")
-                    continue
+                
+                if on_commits and (idx % self.COMMIT_PAGE_SIZE == 0 or idx == len(commits_list)):
+                    page = commits_data[reported:]
+                    reported = len(commits_data)
+                    if page:
+                        on_commits(page)
             
             # Fetch issues (bugs)
             print("Fetching issues...")
@@ -0,0 +1,284 @@
+"""Append-only storage for the self-learning history"""
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+class LearningHistoryStore:
+    """SQLite (WAL) log of analyses and user feedback
+    
+    Each analysis and each feedback item is written as a single row, so the
+    cost of a write no longer depends on how much history has accumulated.
+    Record ids are 0-based and sequential, matching the list indexes the
+    previous JSON history handed out.
+    """
+    
+    def __init__(self, db_path: str = "../data/learning_history.db",
+                 legacy_json_path: Optional[str] = None,
+                 checkpoint_every: int = 500):
+        self.db_path = Path(db_path)
+        self.checkpoint_every = checkpoint_every
+        self._writes_since_checkpoint = 0
+        self._lock = threading.RLock()
+        
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._create_schema()
+        
+        if legacy_json_path:
+            self._import_legacy_json(Path(legacy_json_path))
+    
+    def _create_schema(self):
+        """Create tables if they do not exist yet"""
+        with self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS analyses (
+                    id INTEGER PRIMARY KEY,
+                    timestamp TEXT NOT NULL,
+                    repository TEXT,
+                    files_analyzed INTEGER,
+                    overall_risk REAL,
+                    modules TEXT,
+                    metadata TEXT
+                )
+            """)
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS feedback (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    record_id INTEGER NOT NULL REFERENCES analyses(id),
+                    file TEXT NOT NULL,
+                    actual_had_bugs INTEGER NOT NULL,
+                    severity TEXT,
+                    timestamp TEXT NOT NULL
+                )
+            """)
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_feedback_record ON feedback(record_id)"
+            )
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_analyses_repository ON analyses(repository, timestamp)"
+            )
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_analyses_timestamp ON analyses(timestamp)"
+            )
+    
+    def _import_legacy_json(self, json_path: Path):
+        """One-time import of the old learning_history.json into an empty store"""
+        if not json_path.exists() or self.count_analyses() > 0:
+            return
+        
+        try:
+            with open(json_path, 'r') as f:
+                history = json.load(f)
+        except Exception as e:
+            print(f"⚠ Could not import legacy history: {str(e)}")
+            return
+        
+        with self._lock, self.conn:
+            for record_id, record in enumerate(history):
+                self._insert_analysis(record_id, record)
+                for feedback in record.get('feedback') or []:
+                    self._insert_feedback(record_id, feedback)
+        print(f"✓ Imported {len(history)} records from {json_path}")
+    
+    def _insert_analysis(self, record_id: int, record: Dict):
+        self.conn.execute(
+            "INSERT INTO analyses (id, timestamp, repository, files_analyzed, overall_risk, modules, metadata) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                record_id,
+                record.get('timestamp'),
+                record.get('repository'),
+                record.get('files_analyzed'),
+                record.get('overall_risk'),
+                json.dumps(record.get('modules', [])),
+                json.dumps(record.get('metadata', {}))
+            )
+        )
+    
+    def _insert_feedback(self, record_id: int, feedback: Dict):
+        self.conn.execute(
+            "INSERT INTO feedback (record_id, file, actual_had_bugs, severity, timestamp) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (
+                record_id,
+                feedback['file'],
+                int(bool(feedback['actual_had_bugs'])),
+                feedback.get('severity'),
+                feedback.get('timestamp')
+            )
+        )
+    
+    def _after_write(self):
+        """Periodically fold the WAL back into the main database file"""
+        self._writes_since_checkpoint += 1
+        if self._writes_since_checkpoint >= self.checkpoint_every:
+            self.compact()
+    
+    def append_analysis(self, record: Dict) -> int:
+        """Append an analysis record and return its id"""
+        with self._lock:
+            with self.conn:
+                record_id = self.conn.execute(
+                    "SELECT COALESCE(MAX(id) + 1, 0) FROM analyses"
+                ).fetchone()[0]
+                self._insert_analysis(record_id, record)
+            self._after_write()
+        return record_id
+    
+    def append_feedback(self, record_id: int, feedback: Dict) -> bool:
+        """Append a feedback item; returns False if the record does not exist"""
+        with self._lock:
+            if not self.has_analysis(record_id):
+                return False
+            with self.conn:
+                self._insert_feedback(record_id, feedback)
+            self._after_write()
+        return True
+    
+    def _read(self, query: str, params: tuple = ()) -> List[sqlite3.Row]:
+        with self._lock:
+            return self.conn.execute(query, params).fetchall()
+    
+    def has_analysis(self, record_id: int) -> bool:
+        return bool(self._read("SELECT 1 FROM analyses WHERE id = ?", (record_id,)))
+    
+    def count_analyses(self) -> int:
+        return self._read("SELECT COUNT(*) FROM analyses")[0][0]
+    
+    def count_analyses_with_feedback(self) -> int:
+        return self._read("SELECT COUNT(DISTINCT record_id) FROM feedback")[0][0]
+    
+    def count_feedback(self) -> int:
+        return self._read("SELECT COUNT(*) FROM feedback")[0][0]
+    
+    def _feedback_by_record(self, record_ids: List[int]) -> Dict[int, List[Dict]]:
+        """Load feedback for several records with a single query"""
+        grouped = {}
+        if not record_ids:
+            return grouped
+        
+        placeholders = ",".join("?" * len(record_ids))
+        rows = self._read(
+            "SELECT record_id, file, actual_had_bugs, severity, timestamp FROM feedback "
+            f"WHERE record_id IN ({placeholders}) ORDER BY seq",
+            tuple(record_ids)
+        )
+        for row in rows:
+            grouped.setdefault(row['record_id'], []).append({
+                'file': row['file'],
+                'actual_had_bugs': bool(row['actual_had_bugs']),
+                'severity': row['severity'],
+                'timestamp': row['timestamp']
+            })
+        return grouped
+    
+    def get_feedback(self, record_id: int) -> List[Dict]:
+        """Get feedback items for a record in submission order"""
+        return self._feedback_by_record([record_id]).get(record_id, [])
+    
+    def get_feedback_many(self, record_ids: List[int]) -> Dict[int, List[Dict]]:
+        """Feedback items of several records, keyed by record id, with one query"""
+        return self._feedback_by_record(record_ids)
+    
+    def list_records(self, repository: Optional[str] = None, since: Optional[str] = None,
+                     until: Optional[str] = None, with_feedback: Optional[bool] = None,
+                     limit: int = 50, offset: int = 0, newest_first: bool = True) -> List[Dict]:
+        """Query record summaries without loading module payloads
+        
+        Filters use the repository/timestamp indexes; ``since``/``until`` are
+        ISO timestamps. Each summary carries its feedback count.
+        """
+        conditions = []
+        params = []
+        if repository:
+            conditions.append("a.repository = ?")
+            params.append(repository)
+        if since:
+            conditions.append("a.timestamp >= ?")
+            params.append(since)
+        if until:
+            conditions.append("a.timestamp < ?")
+            params.append(until)
+        if with_feedback is not None:
+            conditions.append(("" if with_feedback else "NOT ") +
+                              "EXISTS (SELECT 1 FROM feedback f WHERE f.record_id = a.id)")
+        
+        query = (
+            "SELECT a.id, a.timestamp, a.repository, a.files_analyzed, a.overall_risk, "
+            "(SELECT COUNT(*) FROM feedback f WHERE f.record_id = a.id) AS feedback_count "
+            "FROM analyses a"
+        )
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += f" ORDER BY a.id {'DESC' if newest_first else 'ASC'} LIMIT ? OFFSET ?"
+        params.extend([limit, offset])
+        
+        return [dict(row) for row in self._read(query, tuple(params))]
+    
+    def get_record(self, record_id: int, include_modules: bool = True) -> Optional[Dict]:
+        """Get a single record by id; module payload is only parsed when requested"""
+        columns = "id, timestamp, repository, files_analyzed, overall_risk, metadata"
+        if include_modules:
+            columns += ", modules"
+        rows = self._read(f"SELECT {columns} FROM analyses WHERE id = ?", (record_id,))
+        if not rows:
+            return None
+        
+        row = rows[0]
+        record = {
+            'id': row['id'],
+            'timestamp': row['timestamp'],
+            'repository': row['repository'],
+            'files_analyzed': row['files_analyzed'],
+            'overall_risk': row['overall_risk'],
+            'metadata': json.loads(row['metadata'] or '{}'),
+            'feedback': self.get_feedback(record_id) or None
+        }
+        if include_modules:
+            record['modules'] = json.loads(row['modules'] or '[]')
+        return record
+    
+    def get_modules(self, record_id: int) -> List[Dict]:
+        """Load the module payload of one record"""
+        rows = self._read("SELECT modules FROM analyses WHERE id = ?", (record_id,))
+        return json.loads(rows[0]['modules'] or '[]') if rows else []
+    
+    def iter_records(self, with_feedback_only: bool = False, batch_size: int = 200) -> Iterator[Dict]:
+        """Iterate over full records in id order, one batch in memory at a time"""
+        last_id = -1
+        while True:
+            query = "SELECT * FROM analyses WHERE id > ?"
+            if with_feedback_only:
+                query += " AND id IN (SELECT record_id FROM feedback)"
+            rows = self._read(query + " ORDER BY id LIMIT ?", (last_id, batch_size))
+            if not rows:
+                return
+            
+            feedback = self._feedback_by_record([row['id'] for row in rows])
+            for row in rows:
+                yield {
+                    'id': row['id'],
+                    'timestamp': row['timestamp'],
+                    'repository': row['repository'],
+                    'files_analyzed': row['files_analyzed'],
+                    'overall_risk': row['overall_risk'],
+                    'modules': json.loads(row['modules'] or '[]'),
+                    'metadata': json.loads(row['metadata'] or '{}'),
+                    'feedback': feedback.get(row['id'])
+                }
+            last_id = rows[-1]['id']
+    
+    def compact(self):
+        """Checkpoint the WAL and truncate it"""
+        with self._lock:
+            self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self._writes_since_checkpoint = 0
+    
+    def close(self):
+        self.compact()
+        self.conn.close()
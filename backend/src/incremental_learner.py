@@ -1,27 +1,38 @@
 """Incremental Learning System - Learns from user feedback and past data"""
+import os
+import threading
 import joblib
 import pandas as pd
 import numpy as np
 from pathlib import Path
 from datetime import datetime
-import json
+from sklearn.base import clone
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.model_selection import train_test_split
-from typing import Dict, List
+from typing import Callable, Dict, List
+from .history_store import LearningHistoryStore
+from .feature_store import FeatureStore, FEATURE_COLUMNS
+from .utils import extract_file_features
 
 class IncrementalLearner:
     """Self-learning model that improves from user feedback"""
     
     def __init__(self, model_path: str = "../models/bug_predictor.pkl",
-                 data_path: str = "../data/learning_history.json"):
+                 data_path: str = "../data/learning_history.json",
+                 db_path: str = "../data/learning_history.db",
+                 matrix_path: str = "../data/training_matrix.npz"):
         self.model_path = Path(model_path)
         self.data_path = Path(data_path)
         self.model = None
-        self.learning_history = []
+        self.store = None
+        self.features = None
+        self.model_listeners: List[Callable] = []
+        self._retrain_lock = threading.Lock()
         
-        # Load existing model and history
+        # Load existing model, history and training features
         self.load_model()
-        self.load_history()
+        self.load_history(db_path)
+        self.load_features(db_path, matrix_path)
         
     def load_model(self):
         """Load existing model or create new one"""
@@ -36,23 +47,26 @@ class IncrementalLearner:
             )
             print("✓ Created new model for incremental learning")
     
-    def load_history(self):
-        """Load learning history from disk"""
-        try:
-            if self.data_path.exists():
-                with open(self.data_path, 'r') as f:
-                    self.learning_history = json.load(f)
-                print(f"✓ Loaded {len(self.learning_history)} historical records")
-        except Exception as e:
-            print(f"⚠ Could not load history: {str(e)}")
-            self.learning_history = []
+    def load_history(self, db_path: str = "../data/learning_history.db"):
+        """Open the learning history store (imports the legacy JSON file once)"""
+        self.store = LearningHistoryStore(db_path, legacy_json_path=self.data_path)
+        print(f"✓ Opened learning history with {self.store.count_analyses()} records")
     
-    def save_history(self):
-        """Save learning history to disk"""
-        self.data_path.parent.mkdir(parents=True, exist_ok=True)
-        with open(self.data_path, 'w') as f:
-            json.dump(self.learning_history, f, indent=2)
-        print(f"✓ Saved {len(self.learning_history)} records to history")
+    def load_features(self, db_path: str = "../data/learning_history.db",
+                      matrix_path: str = "../data/training_matrix.npz"):
+        """Open the feature store, labelling feedback given before it existed"""
+        self.features = FeatureStore(db_path, matrix_path)
+        
+        if self.features.count_labelled() == 0 and self.store.count_feedback() > 0:
+            labelled = skipped = 0
+            for record in self.store.iter_records(with_feedback_only=True):
+                for f in record['feedback']:
+                    if self.features.label(record['id'], f['file'], f['actual_had_bugs']):
+                        labelled += 1
+                    else:
+                        skipped += 1
+            print(f"✓ Labelled {labelled} training rows from existing feedback "
+                  f"({skipped} from analyses without captured features skipped)")
     
     def record_analysis(self, repo_data: Dict, prediction_result: Dict):
         """Record an analysis for future learning"""
@@ -66,29 +80,31 @@ class IncrementalLearner:
             'feedback': None  # Will be updated when user provides feedback
         }
         
-        self.learning_history.append(record)
-        self.save_history()
+        record_id = self.store.append_analysis(record)
+        
+        # Capture real per-file features while the commits are at hand
+        self.features.capture(
+            record_id,
+            extract_file_features(repo_data.get('commits', [])),
+            prediction_result.get('modules', [])
+        )
         
-        return len(self.learning_history) - 1  # Return record ID
+        return record_id
     
     def add_user_feedback(self, record_id: int, file_name: str, 
                          actual_had_bugs: bool, severity: str = None):
         """Add user feedback about prediction accuracy"""
-        if 0 <= record_id < len(self.learning_history):
-            record = self.learning_history[record_id]
-            
-            if 'feedback' not in record or record['feedback'] is None:
-                record['feedback'] = []
-            
-            feedback = {
-                'file': file_name,
-                'actual_had_bugs': actual_had_bugs,
-                'severity': severity,
-                'timestamp': datetime.now().isoformat()
-            }
-            
-            record['feedback'].append(feedback)
-            self.save_history()
+        feedback = {
+            'file': file_name,
+            'actual_had_bugs': actual_had_bugs,
+            'severity': severity,
+            'timestamp': datetime.now().isoformat()
+        }
+        
+        if self.store.append_feedback(record_id, feedback):
+            # Analyses that predate the feature store have no commit features; they
+            # keep their feedback but add no training row
+            self.features.label(record_id, file_name, actual_had_bugs)
             
             print(f"✓ Recorded feedback for {file_name}")
             return True
@@ -96,93 +112,65 @@ class IncrementalLearner:
         return False
     
     def prepare_training_data_from_history(self) -> pd.DataFrame:
-        """Convert learning history into training data"""
-        rows = []
-        
-        for record in self.learning_history:
-            if not record.get('feedback'):
-                continue  # Skip records without feedback
-            
-            # Create mapping of file -> actual bugs
-            feedback_map = {
-                f['file']: f['actual_had_bugs'] 
-                for f in record['feedback']
-            }
-            
-            # Process each module
-            for module in record.get('modules', []):
-                file_name = module['file']
-                
-                # Skip if no feedback for this file
-                if file_name not in feedback_map:
-                    continue
-                
-                rows.append({
-                    'file': file_name,
-                    'bug_keyword_count': module.get('code_quality_issues', 0),
-                    'lines_changed': 50,  # Estimate
-                    'commit_frequency': 1,  # Estimate
-                    'predicted_risk': module['risk_score'],
-                    'critical_issues': module.get('critical_issues', 0),
-                    'high_issues': module.get('high_issues', 0),
-                    'is_buggy': int(feedback_map[file_name])  # Actual label
-                })
-        
-        return pd.DataFrame(rows)
+        """Labelled training rows as a DataFrame (for inspection and export)"""
+        matrix = self.features.load_matrix()
+        
+        df = pd.DataFrame(matrix['X'], columns=FEATURE_COLUMNS)
+        df.insert(0, 'file', matrix['files'])
+        df['predicted_risk'] = matrix['predicted_risk']
+        df['is_buggy'] = matrix['y']  # Actual label
+        return df
     
     def retrain_model(self, min_feedback_samples: int = 10):
         """Retrain model with accumulated feedback"""
-        df = self.prepare_training_data_from_history()
+        matrix = self.features.load_matrix()
+        X, y = matrix['X'], matrix['y']
         
-        if len(df) < min_feedback_samples:
-            print(f"⚠ Not enough feedback samples ({len(df)}/{min_feedback_samples})")
+        if len(y) < min_feedback_samples:
+            print(f"⚠ Not enough feedback samples ({len(y)}/{min_feedback_samples})")
             print("  Collect more user feedback before retraining")
             return False
         
         print(f"\n{'='*60}")
         print(f"Retraining Model with User Feedback")
         print(f"{'='*60}")
-        print(f"Training samples: {len(df)}")
-        print(f"Buggy files: {df['is_buggy'].sum()}")
-        print(f"Clean files: {len(df) - df['is_buggy'].sum()}")
-        
-        # Prepare features
-        feature_cols = ['bug_keyword_count', 'lines_changed', 'commit_frequency',
-                       'critical_issues', 'high_issues']
-        X = df[feature_cols]
-        y = df['is_buggy']
+        print(f"Training samples: {len(y)}")
+        print(f"Buggy files: {y.sum()}")
+        print(f"Clean files: {len(y) - y.sum()}")
         
         # Split for validation
         X_train, X_test, y_train, y_test = train_test_split(
             X, y, test_size=0.2, random_state=42
         )
         
-        # Train model
-        self.model.fit(X_train, y_train)
-        
-        # Evaluate
-        accuracy = self.model.score(X_test, y_test)
-        print(f"\n✓ Model retrained with {accuracy:.2%} accuracy")
-        
-        # Save updated model
-        self.model_path.parent.mkdir(parents=True, exist_ok=True)
-        joblib.dump(self.model, self.model_path)
-        print(f"✓ Updated model saved to {self.model_path}")
+        with self._retrain_lock:
+            # Train a fresh copy so requests keep using the current model meanwhile
+            new_model = clone(self.model)
+            new_model.fit(X_train, y_train)
+            
+            # Evaluate
+            accuracy = new_model.score(X_test, y_test)
+            print(f"\n✓ Model retrained with {accuracy:.2%} accuracy")
+            
+            # Save updated model (write then rename, so readers never see a partial file)
+            self.model_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.model_path.with_suffix('.tmp')
+            joblib.dump(new_model, tmp_path)
+            os.replace(tmp_path, self.model_path)
+            print(f"✓ Updated model saved to {self.model_path}")
+            
+            # Swap in the new model
+            self.model = new_model
+            for listener in self.model_listeners:
+                listener(new_model)
         
         return True
     
     def get_learning_stats(self) -> Dict:
         """Get statistics about learning progress"""
-        total_records = len(self.learning_history)
-        records_with_feedback = sum(
-            1 for r in self.learning_history 
-            if r.get('feedback')
-        )
-        
-        total_feedback = sum(
-            len(r.get('feedback', [])) 
-            for r in self.learning_history
-        )
+        total_records = self.store.count_analyses()
+        records_with_feedback = self.store.count_analyses_with_feedback()
+        total_feedback = self.store.count_feedback()
         
         return {
             'total_analyses': total_records,
@@ -3,12 +3,37 @@ MongoDB Manager for User Data and Analysis Results
 """
 import os
 from datetime import datetime
-from typing import Optional, List, Dict
-from pymongo import MongoClient
+from typing import Optional, List, Dict, Tuple
+from pymongo import MongoClient, ASCENDING, DESCENDING, ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+from bson import ObjectId
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Indexes backing every query the manager issues: (collection, keys, options)
+INDEXES = [
+    ('users', [('user_id', ASCENDING)], {'name': 'user_id_unique', 'unique': True}),
+    ('analyses', [('user_id', ASCENDING), ('analyzed_at', DESCENDING)], {'name': 'user_history'}),
+    ('analyses', [('repository_name', ASCENDING), ('analyzed_at', ASCENDING)], {'name': 'repository_history'}),
+    ('analysis_modules', [('analysis_id', ASCENDING), ('bucket', ASCENDING)], {'name': 'analysis_buckets', 'unique': True}),
+]
+
+# Modules per analysis_modules document; keeps each far below the 16 MB document limit
+MODULE_BUCKET_SIZE = 50
+
+# Highest-risk modules kept on the summary document for list views
+PREVIEW_MODULES = 5
+
+# Older analyses embedded modules and Gemini output; never load those for summaries
+SUMMARY_FIELDS = {'modules': 0, 'gemini_analysis': 0}
+
+# Fields the trend chart reads
+TREND_FIELDS = {'_id': 0, 'analyzed_at': 1, 'overall_risk': 1, 'repository_name': 1}
+
+# Fields of the user document that stats need
+STATS_USER_FIELDS = {'_id': 0, 'analysis_count': 1, 'created_at': 1}
+
 class MongoDBManager:
     def __init__(self):
         self.uri = os.getenv('MONGODB_URI')
@@ -20,7 +45,7 @@ class MongoDBManager:
     def connect(self):
         """Connect to MongoDB"""
         try:
-            self.client = MongoClient(self.uri)
+            self.client = MongoClient(self.uri, **client_options())
             self.db = self.client[self.db_name]
             # Test connection
             self.client.server_info()
@@ -29,6 +54,17 @@ class MongoDBManager:
             print(f"✗ MongoDB connection failed: {e}")
             self.client = None
             self.db = None
+            return
+        self.ensure_indexes()
+    
+    def ensure_indexes(self):
+        """Create the indexes in INDEXES; existing ones are left alone"""
+        for collection, keys, options in INDEXES:
+            try:
+                self.db[collection].create_index(keys, **options)
+            except Exception as e:
+                # e.g. duplicate user_id documents block the unique index
+                print(f"⚠ Could not create index {options['name']} on {collection}: {e}")
     
     def is_connected(self):
         """Check if MongoDB is connected"""
@@ -36,53 +72,20 @@ class MongoDBManager:
     
     # User Management
     def create_or_update_user(self, user_data: dict) -> dict:
-        """Create or update user in MongoDB"""
+        """Create or update user in MongoDB with one atomic upsert"""
         if not self.is_connected():
             return user_data
         
         try:
-            users = self.db.users
-            user_id = str(user_data['id'])
-            
-            existing_user = users.find_one({'user_id': user_id})
-            
-            if existing_user:
-                # Update existing user
-                users.update_one(
-                    {'user_id': user_id},
-                    {'$set': {
-                        'username': user_data.get('login'),
-                        'email': user_data.get('email'),
-                        'name': user_data.get('name'),
-                        'avatar_url': user_data.get('avatar_url'),
-                        'github_url': user_data.get('html_url'),
-                        'bio': user_data.get('bio'),
-                        'company': user_data.get('company'),
-                        'location': user_data.get('location'),
-                        'updated_at': datetime.utcnow(),
-                        'last_login': datetime.utcnow()
-                    }}
-                )
-                return self.get_user(user_id)
-            else:
-                # Create new user
-                user_doc = {
-                    'user_id': user_id,
-                    'username': user_data.get('login'),
-                    'email': user_data.get('email'),
-                    'name': user_data.get('name'),
-                    'avatar_url': user_data.get('avatar_url'),
-                    'github_url': user_data.get('html_url'),
-                    'bio': user_data.get('bio'),
-                    'company': user_data.get('company'),
-                    'location': user_data.get('location'),
-                    'created_at': datetime.utcnow(),
-                    'updated_at': datetime.utcnow(),
-                    'last_login': datetime.utcnow(),
-                    'analysis_count': 0
-                }
-                users.insert_one(user_doc)
-                return self.get_user(user_id)
+            for attempt in range(2):
+                try:
+                    return format_user(self.db.users.find_one_and_update(
+                        *user_upsert(user_data), upsert=True, return_document=ReturnDocument.AFTER
+                    ))
+                except DuplicateKeyError:
+                    # Lost a race to create the same user; retrying updates it instead
+                    if attempt:
+                        raise
         except Exception as e:
             print(f"Error creating/updating user: {e}")
             return user_data
@@ -94,12 +97,7 @@ class MongoDBManager:
         
         try:
             users = self.db.users
-            user = users.find_one({'user_id': user_id})
-            if user:
-                user['id'] = user['user_id']
-                user.pop('_id', None)
-                return user
-            return None
+            return format_user(users.find_one({'user_id': user_id}))
         except Exception as e:
             print(f"Error getting user: {e}")
             return None
@@ -110,143 +108,399 @@ class MongoDBManager:
             return
         
         try:
-            users = self.db.users
-            users.update_one(
-                {'user_id': user_id},
-                {
-                    '$inc': {'analysis_count': 1},
-                    '$set': {'updated_at': datetime.utcnow()}
-                }
-            )
+            self.db.users.update_one({'user_id': user_id}, analysis_count_update(1))
         except Exception as e:
             print(f"Error updating analysis count: {e}")
     
     # Analysis Management
+    #
+    # An analysis is stored as a small summary in ``analyses``, its modules in
+    # buckets of MODULE_BUCKET_SIZE in ``analysis_modules`` and its Gemini
+    # output in ``analysis_gemini`` (keyed by the analysis id). Summaries stay
+    # the same size however large the repository; details are read only when
+    # an analysis is opened.
     def save_analysis(self, user_id: str, analysis_data: dict) -> str:
         """Save analysis result to MongoDB"""
         if not self.is_connected():
             print(f"⚠ MongoDB not connected, skipping save for user {user_id}")
             return "local"
         
+        analysis_ids = self.save_analyses([(user_id, analysis_data)])
+        if not analysis_ids:
+            return "error"
+        print(f"✓ Analysis saved to MongoDB: {analysis_data.get('repository_name')} for user {user_id}")
+        return analysis_ids[0]
+    
+    def save_analyses(self, items: List[Tuple[str, dict]], batch_size: int = 500) -> List[str]:
+        """Bulk-save ``(user_id, analysis_data)`` pairs, e.g. for imports; returns the new analysis ids
+        
+        Each batch costs one insert_many per collection plus one bulk_write
+        of analysis counts, however many analyses and users it holds.
+        """
+        if not self.is_connected():
+            return []
+        
+        analysis_ids = []
         try:
-            analyses = self.db.analyses
-            analysis_doc = {
-                'user_id': user_id,
-                'repository_name': analysis_data.get('repository_name'),
-                'overall_risk': analysis_data.get('overall_repository_risk'),
-                'modules_count': len(analysis_data.get('modules', [])),
-                'modules': analysis_data.get('modules', []),
-                'metadata': analysis_data.get('metadata', {}),
-                'gemini_analysis': analysis_data.get('gemini_analysis'),
-                'analyzed_at': datetime.utcnow()
-            }
-            result = analyses.insert_one(analysis_doc)
-            
-            # Update user's analysis count
-            self.update_analysis_count(user_id)
-            
-            print(f"✓ Analysis saved to MongoDB: {analysis_data.get('repository_name')} for user {user_id}")
-            return str(result.inserted_id)
+            for i in range(0, len(items), batch_size):
+                documents = [analysis_documents(user_id, data) for user_id, data in items[i:i + batch_size]]
+                buckets = [bucket for _, doc_buckets, _ in documents for bucket in doc_buckets]
+                gemini_docs = [gemini_doc for _, _, gemini_doc in documents if gemini_doc]
+                summaries = [summary for summary, _, _ in documents]
+                
+                # Details first, so a summary never points at missing modules
+                if buckets:
+                    self.db.analysis_modules.insert_many(buckets, ordered=False)
+                if gemini_docs:
+                    self.db.analysis_gemini.insert_many(gemini_docs, ordered=False)
+                self.db.analyses.insert_many(summaries, ordered=False)
+                
+                counts = {}
+                for summary in summaries:
+                    counts[summary['user_id']] = counts.get(summary['user_id'], 0) + 1
+                self.db.users.bulk_write(
+                    [UpdateOne({'user_id': user_id}, analysis_count_update(n)) for user_id, n in counts.items()],
+                    ordered=False
+                )
+                analysis_ids.extend(str(summary['_id']) for summary in summaries)
+            return analysis_ids
         except Exception as e:
-            print(f"✗ Error saving analysis: {e}")
+            print(f"✗ Error saving analyses ({len(analysis_ids)} of {len(items)} saved): {e}")
             import traceback
             traceback.print_exc()
-            return "error"
+            return analysis_ids
+    
+    def update_analysis_gemini(self, analysis_id: str, gemini_analysis: dict) -> bool:
+        """Attach a (deferred) Gemini analysis to a saved analysis"""
+        if not self.is_connected():
+            return False
+        
+        try:
+            now = datetime.utcnow()
+            result = self.db.analyses.update_one(
+                {'_id': ObjectId(analysis_id)},
+                {'$set': {'has_gemini': True, 'gemini_updated_at': now}}
+            )
+            if result.matched_count != 1:
+                return False
+            self.db.analysis_gemini.update_one(
+                {'_id': ObjectId(analysis_id)},
+                {'$set': {'gemini_analysis': gemini_analysis, 'updated_at': now}},
+                upsert=True
+            )
+            return True
+        except Exception as e:
+            print(f"✗ Error updating Gemini analysis: {e}")
+            return False
     
-    def get_user_analyses(self, user_id: str, limit: int = 50) -> List[dict]:
-        """Get user's analysis history"""
+    def get_user_analyses(self, user_id: str, limit: int = 50, projection: Optional[dict] = None) -> List[dict]:
+        """Get summaries of the user's analyses, newest first; ``projection`` limits the fields fetched"""
         if not self.is_connected():
             return []
         
         try:
             analyses = self.db.analyses
             results = analyses.find(
-                {'user_id': user_id}
+                {'user_id': user_id}, projection or SUMMARY_FIELDS
             ).sort('analyzed_at', -1).limit(limit)
             
-            analysis_list = []
-            for doc in results:
-                doc.pop('_id', None)
-                analysis_list.append(doc)
-            
-            return analysis_list
+            return [analysis_summary(doc) for doc in results]
         except Exception as e:
             print(f"Error getting analyses: {e}")
             return []
     
+    def get_analysis(self, analysis_id: str, include_modules: bool = True) -> Optional[dict]:
+        """Full analysis for the detail view: summary, modules and Gemini output"""
+        if not self.is_connected():
+            return None
+        
+        try:
+            doc = self.db.analyses.find_one({'_id': ObjectId(analysis_id)})
+            if not doc:
+                return None
+            doc = analysis_summary(doc)
+            
+            if not include_modules:
+                doc.pop('modules', None)
+            elif 'modules' not in doc:
+                doc['modules'] = self.get_analysis_modules(analysis_id)
+            if doc.get('has_gemini') and 'gemini_analysis' not in doc:
+                gemini = self.db.analysis_gemini.find_one({'_id': ObjectId(analysis_id)})
+                doc['gemini_analysis'] = gemini.get('gemini_analysis') if gemini else None
+            return doc
+        except Exception as e:
+            print(f"Error getting analysis: {e}")
+            return None
+    
+    def get_analysis_modules(self, analysis_id: str, offset: int = 0, limit: Optional[int] = None) -> List[dict]:
+        """Modules of an analysis, reading only the buckets that cover ``offset``..``offset + limit``"""
+        if not self.is_connected():
+            return []
+        
+        try:
+            buckets = list(self.db.analysis_modules.find(bucket_query(analysis_id, offset, limit)).sort('bucket', 1))
+            legacy = None
+            if not buckets:
+                # Analysis saved before modules moved out of the summary
+                legacy = self.db.analyses.find_one({'_id': ObjectId(analysis_id)}, {'modules': 1})
+            return page_modules(buckets, legacy, offset, limit)
+        except Exception as e:
+            print(f"Error getting analysis modules: {e}")
+            return []
+    
     def get_user_stats(self, user_id: str) -> dict:
-        """Get user statistics from MongoDB"""
+        """Get user statistics from MongoDB
+        
+        Computed by the server: only the user's counters and one aggregated
+        row come back, never the analysis documents themselves.
+        """
         if not self.is_connected():
-            return {
-                'total_analyses': 0,
-                'repositories_analyzed': 0,
-                'average_risk': 0,
-                'last_analysis': None,
-                'member_since': None
-            }
+            return empty_stats()
         
         try:
-            user = self.get_user(user_id)
+            user = self.db.users.find_one({'user_id': user_id}, STATS_USER_FIELDS)
             if not user:
-                return {
-                    'total_analyses': 0,
-                    'repositories_analyzed': 0,
-                    'average_risk': 0,
-                    'last_analysis': None,
-                    'member_since': None
-                }
+                return empty_stats()
             
-            analyses = self.get_user_analyses(user_id)
-            
-            total_analyses = user.get('analysis_count', 0)
-            repositories_analyzed = len(analyses)
-            
-            # Calculate average risk
-            if analyses:
-                total_risk = sum(a.get('overall_risk', 0) for a in analyses)
-                average_risk = total_risk / len(analyses)
-                last_analysis = analyses[0].get('analyzed_at') if analyses else None
-            else:
-                average_risk = 0
-                last_analysis = None
-            
-            return {
-                'total_analyses': total_analyses,
-                'repositories_analyzed': repositories_analyzed,
-                'average_risk': average_risk,
-                'last_analysis': last_analysis.isoformat() if last_analysis else None,
-                'member_since': user.get('created_at').isoformat() if user.get('created_at') else None
-            }
+            recent = next(self.db.analyses.aggregate(recent_stats_pipeline(user_id)), None)
+            return user_stats(user, recent)
         except Exception as e:
             print(f"Error getting user stats: {e}")
-            return {
-                'total_analyses': 0,
-                'repositories_analyzed': 0,
-                'average_risk': 0,
-                'last_analysis': None,
-                'member_since': None
-            }
+            return empty_stats()
     
     def get_analytics_trends(self, user_id: str) -> dict:
         """Get trend data for charts"""
         if not self.is_connected():
-            return {'labels': [], 'risk_scores': [], 'repository_names': []}
+            return empty_trends()
         
         try:
-            analyses = self.get_user_analyses(user_id, limit=10)
-            analyses.reverse()  # Oldest first for timeline
-            
-            return {
-                'labels': [a.get('analyzed_at').strftime('%Y-%m-%d') if a.get('analyzed_at') else '' for a in analyses],
-                'risk_scores': [a.get('overall_risk', 0) for a in analyses],
-                'repository_names': [a.get('repository_name', '') for a in analyses]
-            }
+            return analytics_trends(self.get_user_analyses(user_id, limit=10, projection=TREND_FIELDS))
         except Exception as e:
             print(f"Error getting trends: {e}")
-            return {'labels': [], 'risk_scores': [], 'repository_names': []}
+            return empty_trends()
+    
+    # Diagnostics
+    def query_catalog(self, user_id: str, repository_name: str = '') -> List[tuple]:
+        """Every query the manager issues, as (name, database command) pairs for explain"""
+        now = datetime.utcnow()
+        return [
+            ('get_user', {'find': 'users', 'filter': {'user_id': user_id}, 'limit': 1}),
+            ('get_user_stats: user', {'find': 'users', 'filter': {'user_id': user_id},
+                                      'projection': STATS_USER_FIELDS, 'limit': 1}),
+            ('get_user_stats: recent analyses', {'aggregate': 'analyses', 'cursor': {},
+                                                 'pipeline': recent_stats_pipeline(user_id)}),
+            ('create_or_update_user', {'findAndModify': 'users', 'query': {'user_id': user_id},
+                                       'update': user_upsert({'id': user_id})[1], 'upsert': True, 'new': True}),
+            ('update_analysis_count', {'update': 'users', 'updates': [
+                {'q': {'user_id': user_id}, 'u': {'$inc': {'analysis_count': 1}, '$set': {'updated_at': now}}}
+            ]}),
+            ('update_analysis_gemini', {'update': 'analyses', 'updates': [
+                {'q': {'_id': ObjectId()}, 'u': {'$set': {'gemini_updated_at': now}}}
+            ]}),
+            ('get_user_analyses', {'find': 'analyses', 'filter': {'user_id': user_id}, 'projection': SUMMARY_FIELDS,
+                                   'sort': {'analyzed_at': -1}, 'limit': 50}),
+            ('get_analysis_modules', {'find': 'analysis_modules',
+                                      'filter': {'analysis_id': ObjectId(), 'bucket': {'$gte': 0, '$lte': 1}},
+                                      'sort': {'bucket': 1}}),
+            ('get_analytics_trends', {'find': 'analyses', 'filter': {'user_id': user_id},
+                                      'projection': TREND_FIELDS, 'sort': {'analyzed_at': -1}, 'limit': 10}),
+            ('repository_history', {'find': 'analyses', 'filter': {'repository_name': repository_name},
+                                    'sort': {'analyzed_at': 1}}),
+        ]
+    
+    def explain_queries(self, user_id: str, repository_name: str = '') -> List[dict]:
+        """Run explain (executionStats) on every query in the catalog and summarize the plans
+        
+        Explain does not apply the writes it plans.
+        """
+        if not self.is_connected():
+            return []
+        
+        plans = []
+        for name, command in self.query_catalog(user_id, repository_name):
+            try:
+                result = self.db.command({'explain': command, 'verbosity': 'executionStats'})
+                plans.append({'query': name, **summarize_plan(result)})
+            except Exception as e:
+                plans.append({'query': name, 'error': str(e)})
+        return plans
     
     def close(self):
         """Close MongoDB connection"""
         if self.client:
             self.client.close()
             print("✓ MongoDB connection closed")
+
+def summarize_plan(explain: dict) -> dict:
+    """Stages, indexes and work done by the winning plan of an explain result"""
+    stages, indexes = [], []
+    
+    def walk(stage):
+        stages.append(stage.get('stage'))
+        if stage.get('indexName'):
+            indexes.append(stage['indexName'])
+        for child in [stage.get('inputStage')] + stage.get('inputStages', []):
+            if child:
+                walk(child)
+    
+    if 'stages' in explain:
+        # Aggregation whose query part ran in the classic engine
+        explain = explain['stages'][0].get('$cursor', {})
+    planner = explain.get('queryPlanner', {})
+    walk(planner.get('winningPlan', {}).get('queryPlan', planner.get('winningPlan', {})))
+    stats = explain.get('executionStats', {})
+    return {
+        'stages': stages,
+        'indexes': indexes,
+        'collection_scan': 'COLLSCAN' in stages,
+        'in_memory_sort': 'SORT' in stages,
+        'returned': stats.get('nReturned'),
+        'keys_examined': stats.get('totalKeysExamined'),
+        'docs_examined': stats.get('totalDocsExamined'),
+        'time_ms': stats.get('executionTimeMillis')
+    }
+
+# Connection settings and documents shared with AsyncMongoDBManager
+
+def client_options() -> dict:
+    """Connection pool and timeouts for MongoClient / AsyncIOMotorClient, from MONGODB_* env vars"""
+    return {
+        'maxPoolSize': int(os.getenv('MONGODB_MAX_POOL_SIZE', '50')),
+        'minPoolSize': int(os.getenv('MONGODB_MIN_POOL_SIZE', '0')),
+        'maxIdleTimeMS': int(os.getenv('MONGODB_MAX_IDLE_TIME_MS', '300000')),
+        'serverSelectionTimeoutMS': int(os.getenv('MONGODB_SERVER_SELECTION_TIMEOUT_MS', '5000')),
+        'connectTimeoutMS': int(os.getenv('MONGODB_CONNECT_TIMEOUT_MS', '5000')),
+        # Single-document writes and reads are retried once after a failover or network error
+        'retryWrites': os.getenv('MONGODB_RETRY_WRITES', 'true').lower() == 'true',
+        'retryReads': True
+    }
+
+def profile_fields(user_data: dict) -> dict:
+    """User document fields taken from a GitHub profile"""
+    return {
+        'username': user_data.get('login'),
+        'email': user_data.get('email'),
+        'name': user_data.get('name'),
+        'avatar_url': user_data.get('avatar_url'),
+        'github_url': user_data.get('html_url'),
+        'bio': user_data.get('bio'),
+        'company': user_data.get('company'),
+        'location': user_data.get('location')
+    }
+
+def user_upsert(user_data: dict) -> tuple:
+    """(filter, update) creating the user on first login and refreshing the profile afterwards"""
+    now = datetime.utcnow()
+    return {'user_id': str(user_data['id'])}, {
+        '$set': {**profile_fields(user_data), 'updated_at': now, 'last_login': now},
+        '$setOnInsert': {'created_at': now, 'analysis_count': 0}
+    }
+
+def analysis_count_update(count: int) -> dict:
+    return {'$inc': {'analysis_count': count}, '$set': {'updated_at': datetime.utcnow()}}
+
+def format_user(user: Optional[dict]) -> Optional[dict]:
+    if user:
+        user['id'] = user['user_id']
+        user.pop('_id', None)
+    return user
+
+def analysis_documents(user_id: str, analysis_data: dict) -> tuple:
+    """(summary, module buckets, Gemini document or None) for a new analysis"""
+    analysis_id = ObjectId()
+    modules = analysis_data.get('modules', [])
+    gemini_analysis = analysis_data.get('gemini_analysis')
+    now = datetime.utcnow()
+    
+    buckets = [
+        {'analysis_id': analysis_id, 'bucket': i // MODULE_BUCKET_SIZE,
+         'modules': modules[i:i + MODULE_BUCKET_SIZE]}
+        for i in range(0, len(modules), MODULE_BUCKET_SIZE)
+    ]
+    gemini_doc = None
+    if gemini_analysis is not None:
+        gemini_doc = {'_id': analysis_id, 'gemini_analysis': gemini_analysis, 'updated_at': now}
+    
+    preview = sorted(modules, key=lambda m: m.get('risk_score') or 0, reverse=True)[:PREVIEW_MODULES]
+    analysis_doc = {
+        '_id': analysis_id,
+        'user_id': user_id,
+        'repository_name': analysis_data.get('repository_name'),
+        'overall_risk': analysis_data.get('overall_repository_risk'),
+        'modules_count': len(modules),
+        'top_modules': [{'file': m.get('file'), 'risk_score': m.get('risk_score')} for m in preview],
+        'metadata': analysis_data.get('metadata', {}),
+        'has_gemini': gemini_analysis is not None,
+        'analyzed_at': now
+    }
+    return analysis_doc, buckets, gemini_doc
+
+def analysis_summary(doc: dict) -> dict:
+    if '_id' in doc:
+        doc['analysis_id'] = str(doc.pop('_id'))
+    return doc
+
+def bucket_query(analysis_id: str, offset: int = 0, limit: Optional[int] = None) -> dict:
+    """Filter for the module buckets covering ``offset``..``offset + limit``"""
+    query = {'analysis_id': ObjectId(analysis_id), 'bucket': {'$gte': offset // MODULE_BUCKET_SIZE}}
+    if limit is not None:
+        query['bucket']['$lte'] = (offset + max(limit, 1) - 1) // MODULE_BUCKET_SIZE
+    return query
+
+def page_modules(buckets: List[dict], legacy: Optional[dict], offset: int = 0,
+                 limit: Optional[int] = None) -> List[dict]:
+    """Cut a page of modules out of the buckets read, or of an older embedded ``modules`` list"""
+    if buckets:
+        start = buckets[0]['bucket'] * MODULE_BUCKET_SIZE
+        modules = [module for bucket in buckets for module in bucket['modules']]
+    else:
+        start, modules = 0, (legacy or {}).get('modules', [])
+    modules = modules[offset - start:]
+    return modules[:limit] if limit is not None else modules
+
+def recent_stats_pipeline(user_id: str, recent: int = 50) -> List[dict]:
+    """Count, average risk and latest date over the user's last ``recent`` analyses"""
+    return [
+        {'$match': {'user_id': user_id}},
+        {'$sort': {'analyzed_at': -1}},
+        {'$limit': recent},
+        {'$group': {
+            '_id': None,
+            'count': {'$sum': 1},
+            'average_risk': {'$avg': {'$ifNull': ['$overall_risk', 0]}},
+            'last_analysis': {'$max': '$analyzed_at'}
+        }}
+    ]
+
+def empty_stats() -> dict:
+    return {
+        'total_analyses': 0,
+        'repositories_analyzed': 0,
+        'average_risk': 0,
+        'last_analysis': None,
+        'member_since': None
+    }
+
+def user_stats(user: dict, recent: Optional[dict]) -> dict:
+    """Stats response from the user's counters and the recent_stats_pipeline row"""
+    recent = recent or {}
+    last_analysis = recent.get('last_analysis')
+    return {
+        'total_analyses': user.get('analysis_count', 0),
+        'repositories_analyzed': recent.get('count', 0),
+        'average_risk': recent.get('average_risk') or 0,
+        'last_analysis': last_analysis.isoformat() if last_analysis else None,
+        'member_since': user.get('created_at').isoformat() if user.get('created_at') else None
+    }
+
+def empty_trends() -> dict:
+    return {'labels': [], 'risk_scores': [], 'repository_names': []}
+
+def analytics_trends(analyses: List[dict]) -> dict:
+    """Chart series from analyses fetched newest first"""
+    analyses = analyses[::-1]  # Oldest first for timeline
+    return {
+        'labels': [a.get('analyzed_at').strftime('%Y-%m-%d') if a.get('analyzed_at') else '' for a in analyses],
+        'risk_scores': [a.get('overall_risk', 0) for a in analyses],
+        'repository_names': [a.get('repository_name', '') for a in analyses]
+    }
@@ -1,6 +1,6 @@
 import joblib
 import numpy as np
-from typing import Dict, List
+from typing import Dict, Iterator, List, Optional
 from .utils import calculate_file_risk
 from .code_analyzer import CodeAnalyzer
 
@@ -19,95 +19,123 @@ class BugPredictor:
     def predict_repository_risk(self, repo_data: Dict) -> Dict:
         """Predict bug risk for all modules in a repository"""
         try:
-            print(f"Predicting risk for repository: {repo_data.get('repository_name', 'Unknown')}")
-            
-            commits = repo_data.get('commits', [])
-            print(f"Processing {len(commits)} commits")
-            
-            if not commits:
-                print("Warning: No commits found in repository data")
-                return {
-                    "repository_name": repo_data.get('repository_name', 'Unknown'),
-                    "modules": [],
-                    "overall_repository_risk": 0.0
-                }
-            
-            issues = {issue.get('commit_hash'): issue.get('type') for issue in repo_data.get('issues', [])}
-            
-            # Aggregate commits by file
-            file_commits = {}
-            for commit in commits:
-                files = commit.get('files_changed', [])
-                for file in files:
-                    if file not in file_commits:
-                        file_commits[file] = []
-                    file_commits[file].append(commit)
-            
-            print(f"Analyzing {len(file_commits)} unique files")
-            
-            # Calculate risk for each file
-            modules = []
-            total_commits = len(commits)
+            modules = list(self.iter_module_risks(repo_data))
+            return self.summarize_modules(repo_data.get('repository_name', 'Unknown'), modules)
+        except Exception as e:
+            print(f"✗ Error in predict_repository_risk: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            raise
+    
+    def iter_module_risks(self, repo_data: Dict) -> Iterator[Dict]:
+        """Yield the risk result of each file as soon as it is scored"""
+        print(f"Predicting risk for repository: {repo_data.get('repository_name', 'Unknown')}")
+        
+        commits = repo_data.get('commits', [])
+        print(f"Processing {len(commits)} commits")
+        
+        if not commits:
+            print("Warning: No commits found in repository data")
+            return
+        
+        # Aggregate commits by file
+        file_commits = {}
+        for commit in commits:
+            files = commit.get('files_changed', [])
+            for file in files:
+                if file not in file_commits:
+                    file_commits[file] = []
+                file_commits[file].append(commit)
+        
+        print(f"Analyzing {len(file_commits)} unique files")
+        
+        # Calculate risk for each file
+        total_commits = len(commits)
+        
+        for file, commits_list in file_commits.items():
+            module = self.score_module(file, commits_list, total_commits)
+            if module:
+                yield module
+    
+    def score_module(self, file: str, commits_list: List[Dict], total_commits: int) -> Optional[Dict]:
+        """Risk result of one file from the commits that touched it"""
+        try:
+            risk_score, reason = calculate_file_risk(commits_list, total_commits)
             
-            for file, commits_list in file_commits.items():
-                try:
-                    risk_score, reason = calculate_file_risk(commits_list, total_commits)
-                    
-                    # Analyze code quality issues in this file
-                    code_quality_issues = []
-                    critical_issues = 0
-                    high_issues = 0
-                    
-                    for commit in commits_list:
-                        for issue_data in commit.get('code_issues', []):
-                            if issue_data['file'] == file:
-                                code_quality_issues.append(issue_data)
-                                critical_issues += issue_data['severity_counts'].get('critical', 0)
-                                high_issues += issue_data['severity_counts'].get('high', 0)
-                    
-                    # Adjust risk score based on code quality issues
-                    if critical_issues > 0:
-                        risk_score = min(risk_score + 0.2, 1.0)
-                        reason += f" | {critical_issues} critical code issues detected"
-                    elif high_issues > 0:
-                        risk_score = min(risk_score + 0.1, 1.0)
-                        reason += f" | {high_issues} high-severity code issues"
-                    
-                    # Collect detailed issues for display
-                    detailed_issues = []
-                    for commit in commits_list:
-                        for issue_data in commit.get('code_issues', []):
-                            if issue_data['file'] == file:
-                                detailed_issues.extend(issue_data.get('detailed_issues', []))
-                    
-                    modules.append({
-                        "file": file,
-                        "risk_score": round(risk_score, 2),
-                        "reason": reason,
-                        "code_quality_issues": len(code_quality_issues),
-                        "critical_issues": critical_issues,
-                        "high_issues": high_issues,
-                        "detailed_issues": detailed_issues[:10]  # Limit to 10 most important
-                    })
-                except Exception as e:
-                    print(f"Warning: Error calculating risk for {file}: {str(e)}")
-                    continue
+            # Analyze code quality issues in this file
+            code_quality_issues = []
+            critical_issues = 0
+            high_issues = 0
             
-            # Sort by risk score
-            modules.sort(key=lambda x: x['risk_score'], reverse=True)
+            for commit in commits_list:
+                for issue_data in commit.get('code_issues', []):
+                    if issue_data['file'] == file:
+                        code_quality_issues.append(issue_data)
+                        critical_issues += issue_data['severity_counts'].get('critical', 0)
+                        high_issues += issue_data['severity_counts'].get('high', 0)
             
-            # Calculate overall repository risk
-            overall_risk = np.mean([m['risk_score'] for m in modules]) if modules else 0.0
+            # Adjust risk score based on code quality issues
+            if critical_issues > 0:
+                risk_score = min(risk_score + 0.2, 1.0)
+                reason += f" | {critical_issues} critical code issues detected"
+            elif high_issues > 0:
+                risk_score = min(risk_score + 0.1, 1.0)
+                reason += f" | {high_issues} high-severity code issues"
             
-            print(f"✓ Risk prediction complete: {len(modules)} modules analyzed")
+            # Collect detailed issues for display
+            detailed_issues = []
+            for issue_data in code_quality_issues:
+                detailed_issues.extend(issue_data.get('detailed_issues', []))
             
             return {
-                "repository_name": repo_data.get('repository_name', 'Unknown'),
-                "modules": modules,
-                "overall_repository_risk": round(overall_risk, 2)
+                "file": file,
+                "risk_score": round(risk_score, 2),
+                "reason": reason,
+                "code_quality_issues": len(code_quality_issues),
+                "critical_issues": critical_issues,
+                "high_issues": high_issues,
+                "detailed_issues": detailed_issues[:10]  # Limit to 10 most important
             }
         except Exception as e:
-            print(f"✗ Error in predict_repository_risk: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            raise
+            print(f"Warning: Error calculating risk for {file}: {str(e)}")
+            return None
+    
+    def summarize_modules(self, repository_name: str, modules: List[Dict]) -> Dict:
+        """Build the repository-level result from scored modules"""
+        # Sort by risk score
+        modules = sorted(modules, key=lambda x: x['risk_score'], reverse=True)
+        
+        # Calculate overall repository risk
+        overall_risk = np.mean([m['risk_score'] for m in modules]) if modules else 0.0
+        
+        print(f"✓ Risk prediction complete: {len(modules)} modules analyzed")
+        
+        return {
+            "repository_name": repository_name,
+            "modules": modules,
+            "overall_repository_risk": round(overall_risk, 2)
+        }
+
+class IncrementalModuleRisks:
+    """Per-file commit history kept up to date while pages of commits arrive
+    
+    ``add`` scores only the files a page touched, so following a fetch costs
+    the same as scoring it once at the end. Scores of files the page did not
+    touch are not recomputed, so they are provisional until the final pass.
+    """
+    
+    def __init__(self, predictor: BugPredictor):
+        self.predictor = predictor
+        self.file_commits: Dict[str, List[Dict]] = {}
+        self.total_commits = 0
+    
+    def add(self, commits: List[Dict]) -> List[Dict]:
+        """Add a page of commits and return the risk of each file it touched"""
+        touched = {}
+        for commit in commits:
+            for file in commit.get('files_changed', []):
+                self.file_commits.setdefault(file, []).append(commit)
+                touched[file] = True
+        self.total_commits += len(commits)
+        modules = (self.predictor.score_module(file, self.file_commits[file], self.total_commits) for file in touched)
+        return [module for module in modules if module]
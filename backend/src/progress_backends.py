@@ -0,0 +1,363 @@
+"""Where progress events live: in this process, or shared between worker processes"""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from itertools import islice
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+class ProgressSession:
+    """Event log of one analysis, shared by every client watching it
+    
+    Each update is serialized to JSON once, numbered and kept in a ring
+    buffer of the last ``replay_size`` events. Subscribers read the ring
+    with their own cursor, so publishing costs the same however many clients
+    watch. A subscriber that falls more than ``replay_size`` events behind
+    skips the oldest ones (drop-oldest backpressure), and a reconnecting
+    client resumes after its ``Last-Event-ID``.
+    """
+    
+    def __init__(self, replay_size: int = 256, max_details: int = 200):
+        self.events = deque(maxlen=replay_size)  # (id, status, JSON data)
+        self.next_id = 1
+        self.subscribers = 0
+        self.last_activity = time.monotonic()
+        self.state = {
+            'status': 'starting',
+            'message': 'Initializing analysis...',
+            'progress': 0,
+            'details': deque(maxlen=max_details)  # Oldest details are dropped
+        }
+        self._closed = False
+        self._changed = asyncio.Event()
+    
+    @property
+    def last_id(self) -> int:
+        return self.next_id - 1
+    
+    @property
+    def closed(self) -> bool:
+        return self._closed
+    
+    def publish(self, update: Dict):
+        event_id = self.next_id
+        self.next_id += 1
+        self.events.append((event_id, update['status'], json.dumps(update)))
+        self.last_activity = time.monotonic()
+        self._wake()
+    
+    def close(self):
+        self._closed = True
+        self._wake()
+    
+    def expire(self):
+        """Drop this process' handle on the session, ending its local subscribers"""
+        self.close()
+    
+    def _wake(self):
+        # Swap in a fresh event so waiters woken now do not see it set later
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+    
+    def events_after(self, last_id: int) -> Tuple[List[Tuple[int, str, str]], int]:
+        """Buffered events newer than ``last_id``, and how many of those were already dropped"""
+        if not self.events:
+            return [], 0
+        first_id = self.events[0][0]
+        start = max(last_id + 1, first_id)
+        return list(islice(self.events, start - first_id, None)), start - (last_id + 1)
+    
+    def buffered_bytes(self) -> int:
+        """Rough size of the replay buffer and stored details"""
+        return sum(len(data) for _, _, data in self.events) + sum(len(d) for d in self.state['details'])
+    
+    async def refresh(self):
+        """Catch up with events stored outside this process; nothing to do in process"""
+    
+    async def wait(self, last_id: int, timeout: float):
+        """Return once an event newer than ``last_id`` exists or the session closes"""
+        if self.last_id > last_id or self.closed:
+            return
+        await asyncio.wait_for(self._changed.wait(), timeout=timeout)
+
+class InProcessProgressBackend:
+    """Events are only visible inside this process (single worker)"""
+    name = 'memory'
+    
+    def open(self, session_id: str, replay_size: int, max_details: int) -> ProgressSession:
+        return ProgressSession(replay_size, max_details)
+    
+    def sweep(self, ttl_seconds: float) -> int:
+        return 0
+    
+    def stats(self) -> Dict:
+        return {}
+
+class SharedProgressSession(ProgressSession):
+    """A session whose events are written to and read from the shared SQLite log
+    
+    No SQLite call runs on the event loop. ``publish`` and ``close`` queue
+    their write to a worker thread behind the session's earlier writes, so
+    they keep their order. While the session has subscribers in this
+    process, one poller per session (however many subscribers) copies new
+    events from the log into the local ring buffer every ``poll_seconds``,
+    and subscribers read that buffer like an in-process session. Events
+    published here are added as soon as their write commits. Status,
+    details and Gemini partials in ``state`` stay local to the process
+    running the analysis.
+    """
+    
+    def __init__(self, backend: 'SQLiteProgressBackend', session_id: str, replay_size: int,
+                 max_details: int):
+        super().__init__(replay_size, max_details)
+        self.backend = backend
+        self.session_id = session_id
+        self.replay_size = replay_size
+        self._last_seq = 0
+        self._remote_closed = False
+        self._loop = None
+        self._writes = None  # Last queued write; the next one waits for it
+        self._poller = None
+    
+    @property
+    def last_id(self) -> int:
+        return self._last_seq
+    
+    @property
+    def closed(self) -> bool:
+        return self._closed or self._remote_closed
+    
+    def _write(self, method, *args) -> asyncio.Task:
+        """Run a backend write in a worker thread once the previous write is done"""
+        previous = self._writes
+        
+        async def run():
+            if previous:
+                await asyncio.gather(previous, return_exceptions=True)
+            return await asyncio.to_thread(method, *args)
+        
+        self._loop = asyncio.get_running_loop()
+        self._writes = self._loop.create_task(run())
+        return self._writes
+    
+    def publish(self, update: Dict):
+        status, data = update['status'], json.dumps(update)
+        self.last_activity = time.monotonic()
+        write = self._write(self.backend.append, self.session_id, status, data, self.replay_size)
+        
+        def published(task: asyncio.Task):
+            if task.cancelled():
+                return
+            if task.exception():
+                print(f"⚠️ Could not store progress event for {self.session_id}: {task.exception()}")
+                return
+            seq = task.result()
+            if seq == self._last_seq + 1 or seq == 1:
+                self._apply(seq, False, [(seq, status, data)])
+            elif seq > self._last_seq:
+                # Other workers published in between; the poller fills the gap
+                self._start_poller()
+        
+        write.add_done_callback(published)
+    
+    def close(self):
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            if self._loop and self._loop.is_running():
+                # Called from a sync endpoint's thread: queue it behind pending writes
+                self._loop.call_soon_threadsafe(self.close)
+            else:
+                self.backend.close(self.session_id)
+                ProgressSession.close(self)
+            return
+        self._write(self.backend.close, self.session_id).add_done_callback(
+            lambda task: task.cancelled() or task.exception()
+        )
+        ProgressSession.close(self)
+    
+    def expire(self):
+        # Other workers may still be publishing, so the shared log stays open
+        ProgressSession.close(self)
+    
+    async def refresh(self):
+        """Copy events other workers stored since the last poll into the local buffer"""
+        self._loop = asyncio.get_running_loop()
+        self._apply(*await asyncio.to_thread(self.backend.poll, self.session_id, self._last_seq))
+    
+    def _apply(self, last_seq: int, closed: bool, rows: List[Tuple[int, str, str]]):
+        if last_seq < self._last_seq:
+            # The id was reused for a new run after a close; its sequence starts over
+            self.events.clear()
+            self._last_seq = 0
+        rows = [row for row in rows if row[0] > self._last_seq]
+        if rows:
+            self.events.extend(rows)
+            self._last_seq = rows[-1][0]
+            self.last_activity = time.monotonic()  # Another worker may be publishing
+        if rows or closed != self._remote_closed:
+            self._remote_closed = closed
+            self._wake()
+    
+    def _start_poller(self):
+        if self._poller is None and self.subscribers:
+            self._poller = asyncio.get_running_loop().create_task(self._poll())
+    
+    async def _poll(self):
+        try:
+            while self.subscribers and not self.closed:
+                try:
+                    await self.refresh()
+                except Exception as e:
+                    print(f"⚠️ Could not read progress of {self.session_id}: {e}")
+                await asyncio.sleep(self.backend.poll_seconds)
+        finally:
+            self._poller = None
+    
+    async def wait(self, last_id: int, timeout: float):
+        self._start_poller()
+        await super().wait(last_id, timeout)
+
+class SQLiteProgressBackend:
+    """Progress events shared by all worker processes through SQLite in WAL mode
+    
+    Each session has its own event sequence; the last ``replay_size`` events
+    are kept per session so any worker can replay them or resume after a
+    ``Last-Event-ID``. Publishing after a session was closed starts a new
+    run with a fresh sequence. Sessions idle for longer than the TTL are
+    removed by ``sweep``. Needs no service besides a file every worker can
+    reach.
+    """
+    name = 'sqlite'
+    
+    def __init__(self, db_path: str = "../data/progress_events.db", poll_seconds: float = 0.1):
+        self.db_path = Path(db_path)
+        self.poll_seconds = poll_seconds
+        self._lock = threading.Lock()
+        
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        # Autocommit mode; writes use explicit BEGIN IMMEDIATE transactions
+        self.conn = sqlite3.connect(str(self.db_path), check_same_thread=False,
+                                    isolation_level=None, timeout=5.0)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS progress_sessions (
+                session_id TEXT PRIMARY KEY,
+                last_seq INTEGER NOT NULL DEFAULT 0,
+                closed INTEGER NOT NULL DEFAULT 0,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS progress_events (
+                session_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                data TEXT NOT NULL,
+                PRIMARY KEY (session_id, seq)
+            )
+        """)
+    
+    def open(self, session_id: str, replay_size: int, max_details: int) -> SharedProgressSession:
+        return SharedProgressSession(self, session_id, replay_size, max_details)
+    
+    def append(self, session_id: str, status: str, data: str, replay_size: int) -> int:
+        """Store one event and return its sequence number within the session"""
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute(
+                    "SELECT last_seq, closed FROM progress_sessions WHERE session_id = ?", (session_id,)
+                ).fetchone()
+                last_seq = 0
+                if row and row[1]:
+                    # A new analysis reusing a closed session id
+                    self.conn.execute("DELETE FROM progress_events WHERE session_id = ?", (session_id,))
+                elif row:
+                    last_seq = row[0]
+                seq = last_seq + 1
+                self.conn.execute(
+                    "INSERT INTO progress_sessions (session_id, last_seq, closed, updated_at) VALUES (?, ?, 0, ?) "
+                    "ON CONFLICT(session_id) DO UPDATE SET last_seq = excluded.last_seq, closed = 0, "
+                    "updated_at = excluded.updated_at",
+                    (session_id, seq, time.time())
+                )
+                self.conn.execute(
+                    "INSERT INTO progress_events (session_id, seq, status, data) VALUES (?, ?, ?, ?)",
+                    (session_id, seq, status, data)
+                )
+                self.conn.execute(
+                    "DELETE FROM progress_events WHERE session_id = ? AND seq <= ?",
+                    (session_id, seq - replay_size)
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return seq
+    
+    def poll(self, session_id: str, last_id: int) -> Tuple[int, bool, List[Tuple[int, str, str]]]:
+        """(last sequence number, closed, events newer than ``last_id``) of a session"""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT last_seq, closed FROM progress_sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            rows = self.conn.execute(
+                "SELECT seq, status, data FROM progress_events WHERE session_id = ? AND seq > ? ORDER BY seq",
+                (session_id, last_id)
+            ).fetchall()
+        last_seq, closed = (row[0], bool(row[1])) if row else (0, False)
+        return last_seq, closed, rows
+    
+    def close(self, session_id: str):
+        with self._lock:
+            self.conn.execute(
+                "UPDATE progress_sessions SET closed = 1, updated_at = ? WHERE session_id = ?",
+                (time.time(), session_id)
+            )
+    
+    def sweep(self, ttl_seconds: float) -> int:
+        """Delete sessions (and their events) idle for longer than ``ttl_seconds``"""
+        cutoff = time.time() - ttl_seconds
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.execute(
+                    "DELETE FROM progress_events WHERE session_id IN "
+                    "(SELECT session_id FROM progress_sessions WHERE updated_at < ?)",
+                    (cutoff,)
+                )
+                removed = self.conn.execute(
+                    "DELETE FROM progress_sessions WHERE updated_at < ?", (cutoff,)
+                ).rowcount
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return removed
+
+    def stats(self) -> Dict:
+        """Size of the shared log, across all workers"""
+        with self._lock:
+            sessions = self.conn.execute("SELECT COUNT(*) FROM progress_sessions").fetchone()[0]
+            events, size = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM progress_events"
+            ).fetchone()
+        return {'shared_sessions': sessions, 'shared_events': events, 'shared_bytes': size}
+
+def create_progress_backend():
+    """Backend selected by PROGRESS_BACKEND: ``memory`` (default) or ``sqlite`` for multiple workers"""
+    kind = os.getenv('PROGRESS_BACKEND', 'memory').lower()
+    if kind == 'sqlite':
+        return SQLiteProgressBackend(
+            db_path=os.getenv('PROGRESS_DB_PATH', '../data/progress_events.db'),
+            poll_seconds=float(os.getenv('PROGRESS_POLL_SECONDS', '0.1'))
+        )
+    if kind != 'memory':
+        print(f"⚠️ Unknown PROGRESS_BACKEND '{kind}', using in-process progress")
+    return InProcessProgressBackend()
@@ -1,31 +1,154 @@
 """Progress tracking for real-time updates"""
 import asyncio
 import json
-from typing import Dict, List
+import os
+import time
+import uuid
+import threading
+from typing import Dict, Optional
 from datetime import datetime
+from .progress_backends import ProgressSession, create_progress_backend
 
 class ProgressTracker:
-    """Track and broadcast analysis progress"""
-    
-    def __init__(self):
-        self.progress_queues: Dict[str, asyncio.Queue] = {}
-        self.current_progress: Dict[str, Dict] = {}
-    
-    def create_session(self, session_id: str):
-        """Create a new progress tracking session"""
-        self.progress_queues[session_id] = asyncio.Queue()
-        self.current_progress[session_id] = {
-            'status': 'starting',
-            'message': 'Initializing analysis...',
-            'progress': 0,
-            'details': []
-        }
+    """Track and broadcast analysis progress to any number of subscribers
+    
+    Memory stays bounded: every session keeps at most ``replay_size`` events
+    and ``max_details`` details, sessions without activity for
+    ``session_ttl_seconds`` are expired by a periodic sweep, and beyond
+    ``max_sessions`` the least recently active session is evicted.
+    
+    Events are stored by ``backend`` (see progress_backends): in-process by
+    default, or shared through SQLite so that with several uvicorn workers a
+    client can stream a session from any of them.
+    """
+    
+    def __init__(self, replay_size: int = 256, keepalive_seconds: float = 30.0,
+                 session_ttl_seconds: Optional[float] = None, max_details: Optional[int] = None,
+                 max_sessions: Optional[int] = None, sweep_interval_seconds: Optional[float] = None,
+                 backend=None, max_updates_per_second: Optional[float] = None):
+        self.backend = backend or create_progress_backend()
+        self.replay_size = replay_size
+        self.keepalive_seconds = keepalive_seconds
+        self.session_ttl_seconds = session_ttl_seconds if session_ttl_seconds is not None \
+            else float(os.getenv('PROGRESS_SESSION_TTL_SECONDS', '900'))
+        self.max_details = max_details if max_details is not None \
+            else int(os.getenv('PROGRESS_MAX_DETAILS', '200'))
+        self.max_sessions = max_sessions if max_sessions is not None \
+            else int(os.getenv('PROGRESS_MAX_SESSIONS', '1000'))
+        self.sweep_interval_seconds = sweep_interval_seconds if sweep_interval_seconds is not None \
+            else float(os.getenv('PROGRESS_SWEEP_INTERVAL_SECONDS', '60'))
+        self.max_updates_per_second = max_updates_per_second if max_updates_per_second is not None \
+            else float(os.getenv('PROGRESS_MAX_UPDATES_PER_SECOND', '5'))
+        self.sessions: Dict[str, ProgressSession] = {}
+        self.dropped_events = 0  # Events skipped by subscribers that fell behind
+        self.sessions_created = 0
+        self.sessions_expired = 0
+        self.sessions_evicted = 0
+        self._sweeper = None
+    
+    def reporter(self, session_id: str) -> 'ProgressReporter':
+        """Thread-safe progress handle for ``session_id``; must be created on the event loop"""
+        return ProgressReporter(self, session_id, asyncio.get_running_loop(), self.max_updates_per_second)
+    
+    def allocate_session(self) -> str:
+        """Create a session under a new unique id and return the id"""
+        session_id = uuid.uuid4().hex
+        self.create_session(session_id)
+        return session_id
     
-    async def update(self, session_id: str, status: str, message: str, 
-                    progress: int = None, detail: str = None):
-        """Update progress for a session"""
-        if session_id not in self.progress_queues:
+    def create_session(self, session_id: str) -> ProgressSession:
+        """Return the session, creating it if needed
+        
+        An existing session is kept as is, so a client reconnecting mid-analysis
+        does not wipe the events other subscribers are reading.
+        """
+        session = self.sessions.get(session_id)
+        if session is None:
+            if len(self.sessions) >= self.max_sessions:
+                self._evict()
+            session = self.sessions[session_id] = self.backend.open(session_id, self.replay_size, self.max_details)
+            self.sessions_created += 1
+        return session
+    
+    def _evict(self):
+        """Make room for a new session: expire idle ones, else drop the least recently active"""
+        if self.sweep():
             return
+        oldest = min(self.sessions, key=lambda sid: self.sessions[sid].last_activity)
+        self.sessions.pop(oldest).expire()
+        self.sessions_evicted += 1
+    
+    def sweep(self) -> int:
+        """Expire sessions idle for longer than the TTL; returns how many were removed
+        
+        Sessions someone is still watching are kept, however long the
+        analysis has been quiet.
+        """
+        cutoff = time.monotonic() - self.session_ttl_seconds
+        expired = [
+            sid for sid, session in self.sessions.items()
+            if session.last_activity < cutoff and not session.subscribers
+        ]
+        for sid in expired:
+            self.sessions.pop(sid).expire()
+        self.sessions_expired += len(expired)
+        return len(expired)
+    
+    async def _sweep_periodically(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval_seconds)
+            expired = self.sweep()
+            if expired:
+                print(f"🧹 Expired {expired} idle progress session(s), {len(self.sessions)} live")
+            try:
+                # The shared log is cleaned in a worker thread, off the event loop
+                await asyncio.to_thread(self.backend.sweep, self.session_ttl_seconds)
+            except Exception as e:
+                print(f"⚠️ Progress backend sweep failed: {e}")
+    
+    def start_sweeper(self):
+        """Start the periodic sweep on the running event loop"""
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = asyncio.get_running_loop().create_task(self._sweep_periodically())
+    
+    def stop_sweeper(self):
+        if self._sweeper:
+            self._sweeper.cancel()
+            self._sweeper = None
+    
+    async def stats(self) -> Dict:
+        """Live sessions, subscribers and buffered memory of this process, plus the shared log's size
+        
+        The shared log is read in a worker thread.
+        """
+        sessions = list(self.sessions.values())
+        local = {
+            'backend': self.backend.name,
+            'live_sessions': len(sessions),
+            'subscribers': sum(session.subscribers for session in sessions),
+            'buffered_events': sum(len(session.events) for session in sessions),
+            'buffered_bytes': sum(session.buffered_bytes() for session in sessions),
+            'dropped_events': self.dropped_events,
+            'sessions_created': self.sessions_created,
+            'sessions_expired': self.sessions_expired,
+            'sessions_evicted': self.sessions_evicted,
+            'session_ttl_seconds': self.session_ttl_seconds,
+            'max_sessions': self.max_sessions
+        }
+        return {**local, **await asyncio.to_thread(self.backend.stats)}
+    
+    async def update(self, session_id: str, status: str, message: str,
+                    progress: int = None, detail: str = None, partial: Dict = None,
+                    result: Dict = None):
+        """Update progress for a session
+        
+        ``partial`` carries a piece of the Gemini answer while it streams:
+        ``{'field', 'index', 'value'}``. Pieces are also kept in the session
+        state under ``gemini_partial``. ``result`` pushes a finished result to
+        the client, e.g. a deferred Gemini analysis.
+        """
+        session = self.create_session(session_id)
+        state = session.state
         
         update = {
             'timestamp': datetime.now().isoformat(),
@@ -35,41 +158,189 @@ class ProgressTracker:
         
         if progress is not None:
             update['progress'] = progress
-            self.current_progress[session_id]['progress'] = progress
+            state['progress'] = progress
         
         if detail:
             update['detail'] = detail
-            self.current_progress[session_id]['details'].append(detail)
+            state['details'].append(detail)
         
-        self.current_progress[session_id]['status'] = status
-        self.current_progress[session_id]['message'] = message
+        if result is not None:
+            update['result'] = result
         
-        await self.progress_queues[session_id].put(update)
-    
-    async def get_updates(self, session_id: str):
-        """Get progress updates for a session"""
-        if session_id not in self.progress_queues:
-            return
+        if partial:
+            update['partial'] = partial
+            gemini_partial = state.setdefault('gemini_partial', {})
+            if partial['field'] == 'summary':
+                gemini_partial['summary'] = partial['value']
+            else:
+                items = gemini_partial.setdefault(partial['field'], [])
+                if partial['index'] < len(items):
+                    items[partial['index']] = partial['value']
+                else:
+                    items.append(partial['value'])
         
-        queue = self.progress_queues[session_id]
+        state['status'] = status
+        state['message'] = message
         
-        while True:
-            try:
-                update = await asyncio.wait_for(queue.get(), timeout=30.0)
-                yield f"data: {json.dumps(update)}\n\n"
+        session.publish(update)
+    
+    async def events(self, session_id: str, last_event_id: Optional[int] = None):
+        """Subscribe to a session; yields ``('event', id, status, data)``, ``('dropped', count)`` and ``('idle',)``
+        
+        ``data`` is the update already serialized to JSON. Without
+        ``last_event_id`` every event still buffered is replayed first, so a
+        client that connects after the analysis started catches up; with it,
+        only newer events are sent. ``idle`` is yielded after
+        ``keepalive_seconds`` without events. The subscription ends after a
+        ``complete`` or ``error`` event, or when the session is closed.
+        """
+        session = self.create_session(session_id)
+        session.last_activity = time.monotonic()
+        await session.refresh()
+        last_id = last_event_id or 0
+        if last_id > session.last_id:
+            last_id = 0  # Id from an earlier session under the same name, replay this one
+        session.subscribers += 1
+        try:
+            while True:
+                events, dropped = session.events_after(last_id)
+                if dropped:
+                    self.dropped_events += dropped
+                    yield ('dropped', dropped)
+                for event_id, status, data in events:
+                    last_id = event_id
+                    yield ('event', event_id, status, data)
+                    if status in ['complete', 'error']:
+                        return
                 
-                if update['status'] in ['complete', 'error']:
-                    break
-            except asyncio.TimeoutError:
+                if session.closed:
+                    return
+                try:
+                    await session.wait(last_id, self.keepalive_seconds)
+                except asyncio.TimeoutError:
+                    yield ('idle',)
+        finally:
+            session.subscribers -= 1
+    
+    async def get_updates(self, session_id: str, last_event_id: Optional[int] = None):
+        """Stream a session's updates as SSE frames (see ``events``)"""
+        async for item in self.events(session_id, last_event_id):
+            if item[0] == 'event':
+                yield f"id: {item[1]}\ndata: {item[3]}\n\n"
+            elif item[0] == 'dropped':
+                yield f": {item[1]} event(s) dropped\n\n"
+            else:
                 # Send keepalive
                 yield f"data: {json.dumps({'type': 'keepalive'})}\n\n"
     
-    def cleanup_session(self, session_id: str):
-        """Clean up a session"""
-        if session_id in self.progress_queues:
-            del self.progress_queues[session_id]
-        if session_id in self.current_progress:
-            del self.current_progress[session_id]
+    def cleanup_session(self, session_id: str, session: Optional[ProgressSession] = None):
+        """Clean up a session; its remaining subscribers finish their stream
+        
+        With ``session``, only that session object is removed, so a delayed
+        cleanup does not hit a newer analysis that reused the id.
+        """
+        current = self.sessions.get(session_id)
+        if current is None or (session is not None and current is not session):
+            return
+        del self.sessions[session_id]
+        current.close()
+
+class ProgressReporter:
+    """Report a session's progress from any thread, at most ``max_per_second`` times a second
+    
+    ``report`` only hands the update to the event loop with
+    ``call_soon_threadsafe``, so blocking work running in a worker thread can
+    keep the client informed. Updates arriving faster than the rate limit
+    are coalesced: the latest status, message and progress win, and details
+    in between are counted in the detail that is sent. Call ``drain`` on the
+    loop when the work is done, before publishing later stages, so nothing
+    pending arrives out of order.
+    """
+    
+    def __init__(self, tracker: ProgressTracker, session_id: str, loop: asyncio.AbstractEventLoop,
+                 max_per_second: float = 5):
+        self.tracker = tracker
+        self.session_id = session_id
+        self.loop = loop
+        self.interval = 1.0 / max_per_second if max_per_second > 0 else 0.0
+        self.coalesced = 0  # Updates merged into a later one
+        self._lock = threading.Lock()
+        self._pending = None
+        self._skipped_details = 0
+        self._scheduled = False
+        self._closed = False
+        self._last_sent = 0.0
+        self._timer = None
+        self._tasks = set()
+    
+    def report(self, status: str, message: str, progress: int = None, detail: str = None):
+        """Queue an update; safe to call from any thread"""
+        with self._lock:
+            if self._closed:
+                return
+            if self._pending is not None:
+                self.coalesced += 1
+                if self._pending['detail'] and detail:
+                    self._skipped_details += 1
+            previous = self._pending or {}
+            self._pending = {
+                'status': status,
+                'message': message,
+                'progress': progress if progress is not None else previous.get('progress'),
+                'detail': detail or previous.get('detail')
+            }
+            if self._scheduled:
+                return
+            self._scheduled = True
+        self.loop.call_soon_threadsafe(self._schedule)
+    
+    def _schedule(self):
+        delay = self._last_sent + self.interval - self.loop.time()
+        if delay > 0:
+            self._timer = self.loop.call_later(delay, self._send)
+        else:
+            self._send()
+    
+    def _send(self):
+        with self._lock:
+            update, self._pending = self._pending, None
+            skipped, self._skipped_details = self._skipped_details, 0
+            self._scheduled = False
+            self._timer = None
+        if update is None:
+            return
+        if skipped:
+            update['detail'] = f"{update['detail']} (+{skipped} more)"
+        self._last_sent = self.loop.time()
+        task = self.loop.create_task(self.tracker.update(self.session_id, **update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+    
+    async def drain(self):
+        """Publish whatever is pending now and stop accepting reports; call on the loop"""
+        with self._lock:
+            self._closed = True
+        if self._timer:
+            self._timer.cancel()
+        self._send()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+class QueueProgressSink:
+    """Tracker stand-in that puts a ProgressReporter's updates on a queue as ``('progress', update)``
+    
+    Lets one request (the NDJSON stream) reuse the reporter's thread hand-off
+    and rate limiting without creating a session.
+    """
+    
+    def __init__(self, queue: asyncio.Queue):
+        self.queue = queue
+    
+    async def update(self, session_id: str, status: str, message: str,
+                     progress: int = None, detail: str = None):
+        self.queue.put_nowait(('progress', {
+            'status': status, 'message': message, 'progress': progress, 'detail': detail
+        }))
 
 # Global progress tracker
 progress_tracker = ProgressTracker()
@@ -0,0 +1,214 @@
+"""Progress of many sessions multiplexed over one WebSocket connection"""
+import asyncio
+import json
+import os
+import time
+from typing import Dict, Optional, Union
+from fastapi import WebSocket, WebSocketDisconnect
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+class ProgressSocket:
+    """One client connection subscribed to any number of progress sessions
+    
+    The client sends JSON (text or binary frames, or msgpack binary frames
+    when msgpack is installed)::
+    
+        {"action": "subscribe", "sessions": ["<id>", ...], "jobs": ["<job id>", ...],
+         "last_event_ids": {"<id>": 12}}
+        {"action": "unsubscribe", "sessions": ["<id>", ...]}
+        {"action": "ping"} / {"action": "pong"}
+    
+    Server frames name the session in ``s`` and carry either an event
+    (``id`` plus the update in ``e``), ``dropped`` (events skipped because
+    the client fell behind) or ``end`` (the subscription finished).
+    Deferred Gemini jobs that already finished are answered directly with
+    ``{"job", "status", "result", "error"}``; running ones subscribe to their
+    session. Malformed requests are answered with ``{"type": "error"}`` and
+    the connection stays open. Frames are JSON text, or msgpack binary with
+    ``binary``.
+    
+    A ``{"type": "ping"}`` is sent every ``heartbeat_seconds``. Answering
+    with ``{"action": "pong"}`` is optional: a client that has sent a pong
+    at least once is closed after three silent intervals. Other clients,
+    such as a browser that only listens, stay connected; dead peers among
+    them are dropped by the server's WebSocket protocol pings (uvicorn's
+    ``--ws-ping-interval``).
+    """
+    
+    def __init__(self, websocket: WebSocket, tracker, jobs=None, binary: bool = False,
+                 heartbeat_seconds: Optional[float] = None, max_subscriptions: int = 50):
+        self.websocket = websocket
+        self.tracker = tracker
+        self.jobs = jobs
+        self.binary = binary
+        self.heartbeat_seconds = heartbeat_seconds if heartbeat_seconds is not None \
+            else float(os.getenv('PROGRESS_WS_HEARTBEAT_SECONDS', '20'))
+        self.max_subscriptions = max_subscriptions
+        self.subscriptions: Dict[str, asyncio.Task] = {}
+        self.last_seen = time.monotonic()
+        self.answers_pings = False  # Set by the first pong; only then is silence fatal
+        self._send_lock = asyncio.Lock()
+    
+    async def run(self):
+        """Serve the connection until the client leaves or stops answering heartbeats"""
+        heartbeat = asyncio.create_task(self._heartbeat())
+        try:
+            while True:
+                message = await self.websocket.receive()
+                if message['type'] == 'websocket.disconnect':
+                    raise WebSocketDisconnect(message.get('code', 1000))
+                self.last_seen = time.monotonic()
+                await self._handle(message['text'] if message.get('text') is not None else message.get('bytes'))
+        except WebSocketDisconnect:
+            pass
+        finally:
+            heartbeat.cancel()
+            for task in list(self.subscriptions.values()):
+                task.cancel()
+    
+    async def _send(self, frame: Dict):
+        if self.binary:
+            payload = msgpack.packb(frame)
+        else:
+            payload = json.dumps(frame)
+        await self._send_payload(payload)
+    
+    async def _send_event(self, session_id: str, event_id: int, data: str):
+        if self.binary:
+            await self._send({'s': session_id, 'id': event_id, 'e': json.loads(data)})
+        else:
+            # The update is already JSON; splice it in instead of re-encoding it
+            await self._send_payload(f'{{"s": {json.dumps(session_id)}, "id": {event_id}, "e": {data}}}')
+    
+    async def _send_payload(self, payload):
+        async with self._send_lock:
+            if isinstance(payload, bytes):
+                await self.websocket.send_bytes(payload)
+            else:
+                await self.websocket.send_text(payload)
+    
+    async def _heartbeat(self):
+        try:
+            while True:
+                await asyncio.sleep(self.heartbeat_seconds)
+                if self.answers_pings and time.monotonic() - self.last_seen > 3 * self.heartbeat_seconds:
+                    print("⚠️ Progress WebSocket client stopped answering, closing")
+                    await self.websocket.close(code=1001)
+                    return
+                await self._send({'type': 'ping', 'sessions': len(self.subscriptions)})
+        except (WebSocketDisconnect, RuntimeError):
+            pass  # Connection already gone
+    
+    @staticmethod
+    def _decode(message: Union[str, bytes, None]) -> Optional[Dict]:
+        """The request in a text or binary frame, or None if it is not an object"""
+        try:
+            if isinstance(message, bytes) and msgpack is not None:
+                try:
+                    request = msgpack.unpackb(message, raw=False)
+                except Exception:
+                    request = json.loads(message)  # JSON sent in a binary frame
+            else:
+                request = json.loads(message)
+        except (TypeError, ValueError):
+            return None
+        return request if isinstance(request, dict) else None
+    
+    @staticmethod
+    def _invalid(request: Dict) -> Optional[str]:
+        """Why a request is malformed, or None if it is fine"""
+        for field in ('sessions', 'jobs'):
+            value = request.get(field)
+            if value is not None and not (isinstance(value, list) and all(isinstance(v, str) for v in value)):
+                return f"'{field}' must be a list of strings"
+        last_event_ids = request.get('last_event_ids')
+        if last_event_ids is not None and not (
+            isinstance(last_event_ids, dict) and all(
+                isinstance(sid, str) and isinstance(event_id, int) and not isinstance(event_id, bool)
+                and event_id >= 0
+                for sid, event_id in last_event_ids.items()
+            )
+        ):
+            return "'last_event_ids' must map session ids to non-negative integers"
+        return None
+    
+    async def _handle(self, message: Union[str, bytes, None]):
+        request = self._decode(message)
+        if request is None:
+            await self._send({'type': 'error', 'message': 'Messages must be JSON (or msgpack) objects'})
+            return
+        problem = self._invalid(request)
+        if problem:
+            await self._send({'type': 'error', 'message': problem})
+            return
+        action = request.get('action')
+        
+        if action == 'subscribe':
+            last_event_ids = request.get('last_event_ids') or {}
+            sessions = list(request.get('sessions') or [])
+            for job_id in request.get('jobs') or []:
+                session_id = await self._job_session(job_id)
+                if session_id:
+                    sessions.append(session_id)
+            subscribed = [sid for sid in sessions if self._subscribe(sid, last_event_ids.get(sid))]
+            await self._send({'type': 'subscribed', 'sessions': subscribed})
+        elif action == 'unsubscribe':
+            for session_id in request.get('sessions') or []:
+                task = self.subscriptions.pop(session_id, None)
+                if task:
+                    task.cancel()
+            await self._send({'type': 'unsubscribed', 'sessions': request.get('sessions') or []})
+        elif action == 'ping':
+            await self._send({'type': 'pong'})
+        elif action == 'pong':
+            self.answers_pings = True
+        else:
+            await self._send({'type': 'error', 'message': f"Unknown action: {action}"})
+    
+    async def _job_session(self, job_id: str) -> Optional[str]:
+        """Session to follow for a deferred Gemini job; finished jobs are answered right away"""
+        # The job store is SQLite; read it in a worker thread
+        job = await asyncio.to_thread(self.jobs.get, job_id) if self.jobs else None
+        if not job:
+            await self._send({'type': 'error', 'job': job_id, 'message': 'Job not found'})
+            return None
+        if job['status'] in ('complete', 'failed') or not job.get('session_id'):
+            await self._send({'job': job_id, 'status': job['status'], 'result': job['result'],
+                              'error': job.get('error')})
+            return None
+        return job['session_id']
+    
+    def _subscribe(self, session_id: str, last_event_id: Optional[int]) -> bool:
+        if not isinstance(session_id, str) or session_id in self.subscriptions:
+            return False
+        if len(self.subscriptions) >= self.max_subscriptions:
+            return False
+        self.subscriptions[session_id] = asyncio.create_task(self._forward(session_id, last_event_id))
+        return True
+    
+    async def _forward(self, session_id: str, last_event_id: Optional[int]):
+        try:
+            async for item in self.tracker.events(session_id, last_event_id):
+                if item[0] == 'event':
+                    await self._send_event(session_id, item[1], item[3])
+                elif item[0] == 'dropped':
+                    await self._send({'s': session_id, 'dropped': item[1]})
+            await self._send({'s': session_id, 'end': True})
+        except (WebSocketDisconnect, RuntimeError):
+            pass  # Connection closed while sending
+        finally:
+            if self.subscriptions.get(session_id) is asyncio.current_task():
+                del self.subscriptions[session_id]
+
+async def serve_progress_socket(websocket: WebSocket, tracker, jobs=None, format: str = 'json'):
+    """Accept a progress WebSocket and serve it until it closes"""
+    await websocket.accept()
+    if format == 'msgpack' and msgpack is None:
+        await websocket.send_json({'type': 'error', 'message': 'msgpack is not installed on the server, use format=json'})
+        await websocket.close(code=1003)
+        return
+    await ProgressSocket(websocket, tracker, jobs, binary=format == 'msgpack').run()
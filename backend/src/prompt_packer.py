@@ -0,0 +1,37 @@
+"""Token-aware packing of source files into batched Gemini prompts"""
+import math
+from typing import List, Tuple
+
+CHARS_PER_TOKEN = 4  # Rough average for code with Gemini's tokenizer
+
+def estimate_tokens(text: str) -> int:
+    """Cheap local token estimate, no API round trip"""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    return text[:max_tokens * CHARS_PER_TOKEN]
+
+def pack_files(files: List[Tuple[str, str]], token_budget: int = 6000,
+               max_file_tokens: int = 1250, max_files_per_batch: int = 6) -> List[List[Tuple[str, str]]]:
+    """Group (filename, code) pairs into batches that fit a prompt token budget
+    
+    Each file is first truncated to ``max_file_tokens``. Files are packed in
+    order; a batch is closed when the next file would exceed ``token_budget``
+    or the batch already holds ``max_files_per_batch`` files (which bounds
+    the size of the answer as well).
+    """
+    batches = []
+    current = []
+    current_tokens = 0
+    for filename, code in files:
+        code = truncate_to_tokens(code, max_file_tokens)
+        tokens = estimate_tokens(code) + estimate_tokens(filename) + 10  # Section header
+        if current and (current_tokens + tokens > token_budget or len(current) >= max_files_per_batch):
+            batches.append(current)
+            current = []
+            current_tokens = 0
+        current.append((filename, code))
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
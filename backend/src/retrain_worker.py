@@ -0,0 +1,135 @@
+"""Background model retraining, decoupled from feedback requests"""
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+class RetrainWorker:
+    """Daemon thread that retrains the learner when enough new labels arrive
+    
+    Feedback requests only call ``notify_feedback``; the worker retrains once
+    at least ``min_new_labels`` labels have arrived since the last run, at
+    most once every ``min_interval_seconds``, and only once the history holds
+    ``min_total_labels`` feedback items overall.
+    """
+    
+    def __init__(self, learner, min_interval_seconds: Optional[float] = None,
+                 min_new_labels: Optional[int] = None, min_total_labels: Optional[int] = None,
+                 poll_seconds: float = 5.0):
+        self.learner = learner
+        self.min_interval_seconds = min_interval_seconds if min_interval_seconds is not None \
+            else float(os.getenv('RETRAIN_MIN_INTERVAL_SECONDS', '600'))
+        self.min_new_labels = min_new_labels if min_new_labels is not None \
+            else int(os.getenv('RETRAIN_MIN_NEW_LABELS', '20'))
+        self.min_total_labels = min_total_labels if min_total_labels is not None \
+            else int(os.getenv('RETRAIN_MIN_TOTAL_LABELS', '20'))
+        self.poll_seconds = poll_seconds
+        
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pending_labels = 0
+        self._force_requested = False
+        self._last_run_monotonic = None
+        self._status = {
+            'state': 'idle',
+            'pending_labels': 0,
+            'last_started_at': None,
+            'last_finished_at': None,
+            'last_result': None,
+            'last_error': None,
+            'last_duration_seconds': None,
+            'runs': 0
+        }
+    
+    def start(self):
+        """Start the worker thread (idempotent)"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="retrain-worker", daemon=True)
+        self._thread.start()
+        print("✓ Background retraining worker started")
+    
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+    
+    def notify_feedback(self, count: int = 1):
+        """Record new labels; cheap enough to call inside a request"""
+        with self._lock:
+            self._pending_labels += count
+        self._wake.set()
+    
+    def request_retrain(self):
+        """Ask for a retrain on the next cycle, ignoring the debounce rules"""
+        with self._lock:
+            self._force_requested = True
+        self._wake.set()
+    
+    def get_status(self) -> Dict:
+        with self._lock:
+            status = dict(self._status)
+            status['pending_labels'] = self._pending_labels
+            status['force_requested'] = self._force_requested
+        status['min_interval_seconds'] = self.min_interval_seconds
+        status['min_new_labels'] = self.min_new_labels
+        return status
+    
+    def _should_retrain(self) -> bool:
+        with self._lock:
+            if self._force_requested:
+                return True
+            if self._pending_labels < self.min_new_labels:
+                return False
+            if self._last_run_monotonic is not None and \
+                    time.monotonic() - self._last_run_monotonic < self.min_interval_seconds:
+                return False
+        return self.learner.get_learning_stats()['total_feedback_items'] >= self.min_total_labels
+    
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.poll_seconds)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            
+            try:
+                if not self._should_retrain():
+                    continue
+            except Exception as e:
+                print(f"⚠ Retrain check failed: {e}")
+                continue
+            
+            with self._lock:
+                labels_in_run = self._pending_labels
+                self._pending_labels = 0
+                self._force_requested = False
+                self._status['state'] = 'training'
+                self._status['last_started_at'] = datetime.now().isoformat()
+            
+            started = time.monotonic()
+            result, error = None, None
+            try:
+                print(f"\n🎓 Background retraining triggered ({labels_in_run} new labels)")
+                result = self.learner.retrain_model()
+            except Exception as e:
+                error = str(e)
+                print(f"✗ Background retraining failed: {e}")
+            
+            with self._lock:
+                if error:
+                    self._pending_labels += labels_in_run  # Retry with the next cycle
+                self._last_run_monotonic = time.monotonic()
+                self._status.update({
+                    'state': 'idle',
+                    'last_finished_at': datetime.now().isoformat(),
+                    'last_result': 'retrained' if result else ('error' if error else 'skipped'),
+                    'last_error': error,
+                    'last_duration_seconds': round(self._last_run_monotonic - started, 3),
+                    'runs': self._status['runs'] + 1
+                })
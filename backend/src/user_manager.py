@@ -8,17 +8,21 @@ from typing import Optional
 from .mongodb_manager import MongoDBManager
 
 class UserManager:
-    def __init__(self, data_dir: str = "data/users"):
+    def __init__(self, data_dir: str = "data/users", use_mongodb: bool = True):
+        """``use_mongodb=False`` keeps to local files (the API talks to MongoDB through AsyncMongoDBManager)"""
         self.data_dir = data_dir
         os.makedirs(data_dir, exist_ok=True)
-        self.mongodb = MongoDBManager()
+        self.mongodb = MongoDBManager() if use_mongodb else None
+    
+    def _mongodb_connected(self) -> bool:
+        return self.mongodb is not None and self.mongodb.is_connected()
     
     def create_or_update_user(self, user_data: dict) -> dict:
         """Create or update user profile in MongoDB and local file"""
         user_id = str(user_data['id'])
         
         # Save to MongoDB
-        if self.mongodb.is_connected():
+        if self._mongodb_connected():
             print(f"✓ Saving user {user_id} to MongoDB")
             result = self.mongodb.create_or_update_user(user_data)
             print(f"✓ User saved: {result.get('username')}")
@@ -60,7 +64,7 @@ class UserManager:
     def get_user(self, user_id: str) -> Optional[dict]:
         """Get user profile from MongoDB or local file"""
         # Try MongoDB first
-        if self.mongodb.is_connected():
+        if self._mongodb_connected():
             return self.mongodb.get_user(user_id)
         
         # Fallback to local file
@@ -73,7 +77,7 @@ class UserManager:
     def update_analysis_count(self, user_id: str):
         """Increment user's analysis count"""
         # Try MongoDB first
-        if self.mongodb.is_connected():
+        if self._mongodb_connected():
             self.mongodb.update_analysis_count(user_id)
         
         # Also update local file
@@ -130,7 +134,7 @@ class UserManager:
     def get_user_stats(self, user_id: str) -> dict:
         """Get user statistics from MongoDB or local file"""
         # Try MongoDB first
-        if self.mongodb.is_connected():
+        if self._mongodb_connected():
             return self.mongodb.get_user_stats(user_id)
         
         # Fallback to local file
@@ -44,3 +44,22 @@ def calculate_file_risk(file_commits: List[Dict], total_commits: int) -> tuple:
         reason = "Low bug frequency and stable changes"
     
     return min(risk_score, 1.0), reason
+
+def extract_file_features(commits: List[Dict]) -> Dict[str, Dict]:
+    """Per-file training features from the commits that touched each file"""
+    file_commits = {}
+    for commit in commits:
+        for file in commit.get('files_changed', []):
+            file_commits.setdefault(file, []).append(commit)
+    
+    features = {}
+    for file, commits_list in file_commits.items():
+        features[file] = {
+            'bug_keyword_count': sum(
+                1 for c in commits_list
+                if any(kw in c.get('message', '').lower() for kw in BUG_KEYWORDS)
+            ),
+            'lines_changed': sum(len(c.get('diff', '').split('\n')) for c in commits_list) / len(commits_list),
+            'commit_frequency': len(commits_list)
+        }
+    return features
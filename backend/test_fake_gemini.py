@@ -0,0 +1,217 @@
+"""
+Offline benchmark of the Gemini client paths against the local fake server
+
+No API key or network needed: starts src/fake_gemini.py in-process and points
+GeminiAnalyzer at it through GEMINI_BASE_URL. Seeds are fixed, so runs are
+reproducible. Run it as a script (``python test_fake_gemini.py``); it exits
+with status 1 when a check fails.
+"""
+import sys
+import os
+import time
+import socket
+import asyncio
+import tempfile
+import threading
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import uvicorn
+from src.fake_gemini import FakeGemini, create_app
+from src.gemini_analyzer import GeminiAnalyzer
+from src.gemini_cache import GeminiResponseCache
+
+def start_fake_server(fake: FakeGemini) -> str:
+    """Run the fake server in a background thread and return its base URL"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(create_app(fake), host='127.0.0.1', port=port, log_level='warning'))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}"
+
+def use_fake_server(base_url: str):
+    """Point GeminiAnalyzer instances created from now on at the fake server"""
+    os.environ['GEMINI_BASE_URL'] = base_url
+    os.environ['GEMINI_API_KEY'] = 'fake-key-1'
+    os.environ['GEMINI_API_KEY_2'] = 'fake-key-2'
+    os.environ['GEMINI_API_KEY_3'] = 'fake-key-3'
+    os.environ['GEMINI_CACHE_ENABLED'] = 'false'
+    os.environ['GEMINI_BACKOFF_BASE_SECONDS'] = '0.1'
+    os.environ['GEMINI_QUOTA_COOLDOWN_SECONDS'] = '0.2'
+
+ML_DATA = {
+    'repository': 'example/repo',
+    'overall_risk': 0.55,
+    'total_files': 3,
+    'high_risk_files': [],
+    'modules': [{'file': f'module_{i}.py', 'risk_score': 0.5, 'reason': 'Frequent bug fixes'} for i in range(3)]
+}
+
+def sample_files(count: int) -> list:
+    return [
+        {'filename': f'file_{i}.py', 'code': f"def handler_{i}(x):\n    return x / {i}\n" * 5}
+        for i in range(count)
+    ]
+
+def percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+def check_concurrency(fake: FakeGemini, analyzer: GeminiAnalyzer) -> bool:
+    """Fan-out of analyze_repository with and without batching
+    
+    With a fixed latency, 10 single-file requests 4 at a time take about 3
+    rounds, and batched requests run side by side take about one call.
+    """
+    print("\n" + "="*60)
+    print("TEST 1: analyze_repository fan-out (10 files, 0.3s latency)")
+    print("="*60)
+    latency = 0.3
+    fake.configure(latency_distribution='fixed', latency_seconds=latency, seed=1)
+    
+    timings, passed = {}, True
+    for max_files, concurrency in [(1, 1), (1, 4), (6, 4)]:
+        analyzer.batch_max_files = max_files
+        fake.reset_stats()
+        start = time.perf_counter()
+        result = analyzer.analyze_repository(sample_files(10), max_concurrency=concurrency)
+        elapsed = timings[(max_files, concurrency)] = time.perf_counter() - start
+        failed = sum(1 for f in result['files'] if f.get('error'))
+        print(f"   - batch={max_files} concurrency={concurrency}: {elapsed:.2f}s, "
+              f"{sum(fake.stats.values())} request(s), {result['files_analyzed']} files, {failed} failed")
+        passed = passed and result['files_analyzed'] == 10 and failed == 0
+    analyzer.batch_max_files = 6
+    
+    # Generous margins for scheduling noise, tight enough to catch serialized calls
+    fan_out_ok = timings[(1, 4)] < 4 * latency + 0.5
+    batched_ok = timings[(6, 4)] < latency + 0.5
+    print(f"   - 4-way fan-out ~3 rounds: {'ok' if fan_out_ok else 'too slow'}, "
+          f"batched ~1 call: {'ok' if batched_ok else 'too slow'}")
+    return passed and fan_out_ok and batched_ok
+
+def check_cache(fake: FakeGemini, analyzer: GeminiAnalyzer) -> bool:
+    """Cold vs warm response cache: repeats are hits and never reach the server"""
+    print("\n" + "="*60)
+    print("TEST 2: Response cache")
+    print("="*60)
+    fake.configure(latency_distribution='fixed', latency_seconds=0.3, seed=2)
+    fake.reset_stats()
+    with tempfile.TemporaryDirectory() as tmp:
+        analyzer.cache = GeminiResponseCache(db_path=os.path.join(tmp, 'cache.db'))
+        timings = []
+        for _ in range(3):
+            start = time.perf_counter()
+            analyzer.analyze_code("print('cached')", "cached.py")
+            timings.append(time.perf_counter() - start)
+        stats = analyzer.cache.stats()
+        print(f"   - cold: {timings[0]*1000:.0f}ms, warm: {timings[1]*1000:.1f}ms / {timings[2]*1000:.1f}ms")
+        print(f"   - stats: {stats}, server requests: {sum(fake.stats.values())}")
+        analyzer.cache.conn.close()
+        analyzer.cache = None
+    return stats['misses'] == 1 and stats['hits'] == 2 and sum(fake.stats.values()) == 1
+
+def check_fault_injection(fake: FakeGemini, analyzer: GeminiAnalyzer) -> bool:
+    """Retries and key rotation under 429 / 504 / malformed answers"""
+    print("\n" + "="*60)
+    print("TEST 3: Fault injection (15% 429, 15% 504, 10% malformed)")
+    print("="*60)
+    fake.configure(latency_distribution='lognormal', latency_seconds=0.1, latency_spread=0.5,
+                   rate_429=0.15, rate_504=0.15, rate_malformed=0.1, seed=7)
+    fake.reset_stats()
+    
+    latencies, failures, heuristic = [], 0, 0
+    for i in range(20):
+        start = time.perf_counter()
+        result = analyzer.analyze_code(f"x = {i}", f"fault_{i}.py")
+        latencies.append(time.perf_counter() - start)
+        if result.get('error'):
+            failures += 1
+        elif result.get('risk_score') == 60 and not result.get('filename'):
+            heuristic += 1
+    
+    print(f"   - p50 {percentile(latencies, 0.5):.2f}s, p95 {percentile(latencies, 0.95):.2f}s")
+    print(f"   - failed: {failures}/20, heuristic parses: {heuristic}/20")
+    print(f"   - server outcomes: {fake.stats}")
+    print(f"   - keys: {analyzer.key_pool.stats()}")
+    fake.configure(rate_429=0, rate_504=0, rate_malformed=0)
+    return failures < 20
+
+def check_streaming(fake: FakeGemini, analyzer: GeminiAnalyzer) -> bool:
+    """Time to first partial insight vs full answer
+    
+    The answer takes 0.5s to start and then arrives in chunks 50ms apart.
+    The first partial has to come before half of that chunked phase is
+    over; a client that buffers the whole response only sees it at the end.
+    """
+    print("\n" + "="*60)
+    print("TEST 4: Streaming ML-results analysis")
+    print("="*60)
+    latency = 0.5
+    fake.configure(latency_distribution='fixed', latency_seconds=latency,
+                   stream_chunk_chars=40, stream_chunk_delay_seconds=0.05, seed=3)
+    
+    async def run():
+        start = time.perf_counter()
+        first = []
+        
+        async def on_partial(partial):
+            if not first:
+                first.append(time.perf_counter() - start)
+        
+        result = await analyzer.analyze_ml_results_async(ML_DATA, on_partial=on_partial)
+        return first[0] if first else None, time.perf_counter() - start, result
+    
+    first, total, result = asyncio.run(run())
+    print(f"   - first partial after {first:.2f}s, full answer after {total:.2f}s")
+    print(f"   - recommendations: {len(result.get('recommendations', []))}")
+    return first is not None and first < latency + (total - latency) / 2
+
+def check_deadline_and_breaker(fake: FakeGemini, analyzer: GeminiAnalyzer) -> bool:
+    """Bounded latency and circuit breaker with a Gemini that only times out"""
+    print("\n" + "="*60)
+    print("TEST 5: Deadline budget and circuit breaker (100% 504)")
+    print("="*60)
+    fake.configure(latency_distribution='fixed', latency_seconds=0.2, rate_504=1.0, seed=5)
+    
+    async def run():
+        for attempt in range(7):
+            start = time.perf_counter()
+            try:
+                await analyzer.analyze_ml_results_async(ML_DATA, budget_seconds=2)
+                outcome = "ok"
+            except Exception as e:
+                outcome = "breaker open" if "circuit breaker" in str(e) else "failed"
+            print(f"   - request {attempt + 1}: {outcome} in {time.perf_counter() - start:.2f}s")
+    
+    asyncio.run(run())
+    print(f"   - breaker: {analyzer.breaker.stats()}")
+    fake.configure(rate_504=0)
+    return analyzer.breaker.stats()['state'] == 'open'
+
+def main() -> int:
+    fake = FakeGemini(latency_seconds=0.3, seed=42)
+    use_fake_server(start_fake_server(fake))
+    
+    print("\n🧪 GEMINI OFFLINE BENCHMARK (fake server)")
+    print(f"   Endpoint: {os.environ['GEMINI_BASE_URL']}")
+    
+    # Fresh analyzer per check so key cooldowns and breaker state do not carry over
+    results = [
+        ("Concurrency", check_concurrency(fake, GeminiAnalyzer())),
+        ("Cache", check_cache(fake, GeminiAnalyzer())),
+        ("Fault injection", check_fault_injection(fake, GeminiAnalyzer())),
+        ("Streaming", check_streaming(fake, GeminiAnalyzer())),
+        ("Deadline / breaker", check_deadline_and_breaker(fake, GeminiAnalyzer())),
+    ]
+    
+    print("\n" + "="*60)
+    print("SUMMARY")
+    print("="*60)
+    for name, passed in results:
+        print(f"{'✅' if passed else '❌'} {name}")
+    return 0 if all(passed for _, passed in results) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,178 @@
+"""
+Cross-process progress delivery with the SQLite progress backend
+
+Starts several worker processes (each its own uvicorn server and
+ProgressTracker, sharing one SQLite file, like N workers behind a load
+balancer), publishes an analysis' progress through one worker and streams
+it from the others. Run it as a script; it exits with status 1 when a check
+fails.
+"""
+import sys
+import os
+import json
+import time
+import socket
+import tempfile
+import threading
+import multiprocessing
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import requests
+
+WORKERS = 3
+EVENTS = 20
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def run_worker(port: int, db_path: str):
+    """One worker process: a minimal app around a ProgressTracker"""
+    import uvicorn
+    from fastapi import FastAPI, Request
+    from fastapi.responses import StreamingResponse
+    from src.progress_backends import SQLiteProgressBackend
+    from src.progress_tracker import ProgressTracker
+    
+    tracker = ProgressTracker(backend=SQLiteProgressBackend(db_path=db_path, poll_seconds=0.05),
+                              keepalive_seconds=1)
+    app = FastAPI()
+    
+    @app.post("/publish/{session_id}")
+    async def publish(session_id: str, body: dict):
+        await tracker.update(session_id, body['status'], body['message'], body.get('progress'))
+        return {"worker": os.getpid()}
+    
+    @app.post("/cleanup/{session_id}")
+    def cleanup(session_id: str):
+        tracker.cleanup_session(session_id)
+        return {"worker": os.getpid()}
+    
+    @app.get("/progress/{session_id}")
+    async def progress(session_id: str, request: Request):
+        header = request.headers.get("last-event-id")
+        return StreamingResponse(
+            tracker.get_updates(session_id, int(header) if header else None),
+            media_type="text/event-stream"
+        )
+    
+    uvicorn.run(app, host='127.0.0.1', port=port, log_level='warning')
+
+def wait_ready(url: str):
+    for _ in range(100):
+        try:
+            requests.get(url + "/docs", timeout=1)
+            return
+        except requests.exceptions.ConnectionError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Worker {url} did not start")
+
+def stream(url: str, results: list, headers: dict = None):
+    """Collect (id, status) of every SSE event until the stream ends"""
+    event_id = None
+    with requests.get(url, stream=True, headers=headers or {}, timeout=30) as response:
+        for line in response.iter_lines(decode_unicode=True):
+            if line.startswith('id: '):
+                event_id = int(line[4:])
+            elif line.startswith('data: '):
+                data = json.loads(line[6:])
+                if data.get('type') != 'keepalive':
+                    results.append((event_id, data['status']))
+
+def check_fan_out(urls: list):
+    """Events published on worker 1 reach subscribers on every worker"""
+    print("\n" + "="*60)
+    print(f"TEST 1: Publish on worker 1, stream from all {len(urls)} workers")
+    print("="*60)
+    session_id = f"mp_{int(time.time() * 1000)}"
+    received = [[] for _ in urls]
+    threads = [
+        threading.Thread(target=stream, args=(f"{url}/progress/{session_id}", received[i]))
+        for i, url in enumerate(urls)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.5)
+    
+    start = time.perf_counter()
+    for i in range(EVENTS - 1):
+        requests.post(f"{urls[0]}/publish/{session_id}",
+                      json={'status': 'analyzing', 'message': f'step {i}', 'progress': i})
+    requests.post(f"{urls[0]}/publish/{session_id}",
+                  json={'status': 'complete', 'message': 'done', 'progress': 100})
+    for thread in threads:
+        thread.join(timeout=10)
+    elapsed = time.perf_counter() - start
+    
+    expected = list(range(1, EVENTS + 1))
+    passed = True
+    for i, events in enumerate(received):
+        ok = [event_id for event_id, _ in events] == expected and events[-1][1] == 'complete'
+        passed = passed and ok
+        print(f"   {'✓' if ok else '✗'} worker {i + 1}: {len(events)} event(s)")
+    print(f"   Delivered in {elapsed:.2f}s")
+    return passed, session_id
+
+def check_resume(urls: list, session_id: str):
+    """A client reconnecting to another worker resumes after Last-Event-ID"""
+    print("\n" + "="*60)
+    print("TEST 2: Reconnect to a different worker with Last-Event-ID: 15")
+    print("="*60)
+    received = []
+    stream(f"{urls[-1]}/progress/{session_id}", received, headers={'Last-Event-ID': '15'})
+    ids = [event_id for event_id, _ in received]
+    print(f"   Received ids: {ids}")
+    return ids == list(range(16, EVENTS + 1))
+
+def check_cleanup(urls: list):
+    """Cleaning a session up on one worker ends streams on the others"""
+    print("\n" + "="*60)
+    print("TEST 3: Cleanup on worker 1 ends a stream on worker 2")
+    print("="*60)
+    session_id = f"mp_cleanup_{int(time.time() * 1000)}"
+    requests.post(f"{urls[0]}/publish/{session_id}", json={'status': 'ml_complete', 'message': 'ML done'})
+    received = []
+    thread = threading.Thread(target=stream, args=(f"{urls[1]}/progress/{session_id}", received))
+    thread.start()
+    time.sleep(0.5)
+    requests.post(f"{urls[0]}/cleanup/{session_id}")
+    thread.join(timeout=5)
+    print(f"   Stream ended: {not thread.is_alive()}, events: {received}")
+    return not thread.is_alive() and received == [(1, 'ml_complete')]
+
+def main() -> int:
+    print("\n🧪 CROSS-PROCESS PROGRESS TEST (SQLite backend)")
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'progress_events.db')
+        ports = [free_port() for _ in range(WORKERS)]
+        context = multiprocessing.get_context('spawn')
+        workers = [context.Process(target=run_worker, args=(port, db_path), daemon=True) for port in ports]
+        for worker in workers:
+            worker.start()
+        urls = [f"http://127.0.0.1:{port}" for port in ports]
+        
+        try:
+            for url in urls:
+                wait_ready(url)
+            
+            fan_out_passed, session_id = check_fan_out(urls)
+            results = [
+                ("Fan-out across workers", fan_out_passed),
+                ("Resume on another worker", check_resume(urls, session_id)),
+                ("Cleanup across workers", check_cleanup(urls)),
+            ]
+        finally:
+            for worker in workers:
+                worker.terminate()
+    
+    print("\n" + "="*60)
+    print("SUMMARY")
+    print("="*60)
+    for name, passed in results:
+        print(f"{'✅' if passed else '❌'} {name}")
+    return 0 if all(passed for _, passed in results) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
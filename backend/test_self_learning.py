@@ -1,8 +1,8 @@
 """Test the self-learning system"""
 import sys
-sys.path.append('src')
+sys.path.append('.')
 
-from incremental_learner import IncrementalLearner
+from src.incremental_learner import IncrementalLearner
 
 print("=" * 70)
 print("Testing Self-Learning System")
@@ -28,7 +28,7 @@ else:
     print("   The fix is correctly applied.")
 
 # Check the generate_content call
-if 'self.model.generate_content(' in content:
+if '.model.generate_content(' in content:
     print("✅ VERIFIED: generate_content method exists")
     
     # Find the call and show it
@@ -37,7 +37,7 @@ if 'self.model.generate_content(' in content:
     call_lines = []
     
     for line in lines:
-        if 'self.model.generate_content(' in line:
+        if '.model.generate_content(' in line:
             in_generate_call = True
         
         if in_generate_call:
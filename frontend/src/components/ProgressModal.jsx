@@ -7,6 +7,7 @@ const ProgressModal = ({ sessionId, onComplete, onError }) => {
     const [status, setStatus] = useState('starting')
     const [message, setMessage] = useState('Initializing analysis...')
     const [details, setDetails] = useState([])
+    const [insights, setInsights] = useState({ recommendations: [], critical_concerns: [] })
 
     useEffect(() => {
         if (!sessionId) return
@@ -33,6 +34,16 @@ const ProgressModal = ({ sessionId, onComplete, onError }) => {
                     }])
                 }
 
+                if (data.partial) {
+                    const { field, index, value } = data.partial
+                    setInsights(prev => {
+                        if (field === 'summary') return { ...prev, summary: value }
+                        const items = [...(prev[field] || [])]
+                        items[index] = value
+                        return { ...prev, [field]: items }
+                    })
+                }
+
                 if (data.status === 'complete') {
                     setTimeout(() => {
                         eventSource.close()
@@ -48,8 +59,10 @@ const ProgressModal = ({ sessionId, onComplete, onError }) => {
         }
 
         eventSource.onerror = () => {
-            eventSource.close()
-            onError('Connection lost')
+            // While CONNECTING the browser retries and resumes from Last-Event-ID
+            if (eventSource.readyState === EventSource.CLOSED) {
+                onError('Connection lost')
+            }
         }
 
         return () => eventSource.close()
@@ -61,6 +74,7 @@ const ProgressModal = ({ sessionId, onComplete, onError }) => {
             case 'fetching': return '📡'
             case 'analyzing': return '🔍'
             case 'predicting': return '🤖'
+            case 'gemini': return '✨'
             case 'recording': return '💾'
             case 'complete': return '✅'
             case 'error': return '❌'
@@ -101,6 +115,20 @@ const ProgressModal = ({ sessionId, onComplete, onError }) => {
                             </div>
                         </div>
                     )}
+
+                    {insights.recommendations.length > 0 && (
+                        <div className="progress-details ai-insights">
+                            <div className="details-header">AI Recommendations (streaming):</div>
+                            <div className="details-list">
+                                {insights.recommendations.map((item, idx) => (
+                                    <div key={idx} className="detail-item">
+                                        <span className="detail-bullet">•</span>
+                                        <span className="detail-text">{item}</span>
+                                    </div>
+                                ))}
+                            </div>
+                        </div>
+                    )}
                 </div>
 
                 <div className="progress-footer">